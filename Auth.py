@@ -2,11 +2,13 @@
 """
 from __future__ import print_function
 
-__all__ = ['Auth']
+__all__ = ['Auth', 'PasswordStore']
 
+import os
 import re
 
 import CPL
+from Hub.Reply.KVBuilder import kv, qKV
 import g
 
 class Auth(CPL.Object):
@@ -27,6 +29,12 @@ class Auth(CPL.Object):
         self.actors = {}                # The actors subject to permissions.
         self.lockedActors = {}
 
+        # Access decisions, as { (program, authName, safe) : access }, and whether
+        # commands are safe, as { (safeCmds, cmd) : safe }
+        self.decisions = {}
+        self.safeCmds = {}
+        self.maxCachedSafeCmds = argv.get('maxCachedSafeCmds', 10000)
+
         self.hackOn = False
         self.gods = ("APO", "TU02")
 
@@ -40,6 +48,62 @@ class Auth(CPL.Object):
         self.addPrograms(self.gods, ["perms"])
         self.status()
         
+    # Cached decisions which need warnings sent when they are used.
+    LOCKED = 'locked'
+    NO_PROGRAM = 'noProgram'
+
+    @property
+    def hackOn(self):
+        return self._hackOn
+
+    @hackOn.setter
+    def hackOn(self, hackOn):
+        self._hackOn = hackOn
+        self.invalidate()
+
+    def invalidate(self):
+        """ Forget all cached access decisions. Must be called whenever the permissions change. """
+
+        self.decisions = {}
+
+    def handoverState(self):
+        """ Return the permissions as plain data, for a new hub process. """
+
+        return dict(programs=dict([(p, dict(a)) for p, a in self.programs.items()]),
+                    actors=dict(self.actors),
+                    lockedActors=dict(self.lockedActors),
+                    hackOn=self.hackOn)
+
+    def restoreHandoverState(self, state):
+        """ Take over the old hub process's permissions. """
+
+        self.programs = state['programs']
+        self.actors = state['actors']
+        self.lockedActors = state['lockedActors']
+        self.hackOn = state['hackOn']
+
+    def isSafe(self, actor, cmdString):
+        """ Return whether the actor declares cmdString to be safe for anyone to send. """
+
+        safeCmds = actor.safeCmds
+        if safeCmds is None or cmdString is None:
+            return False
+
+        # The answer only depends on the regexp and the command text, and the same few
+        # commands are sent over and over again.
+        #
+        key = (safeCmds, cmdString)
+        try:
+            return self.safeCmds[key]
+        except KeyError:
+            pass
+
+        safe = safeCmds.search(cmdString) is not None
+        if len(self.safeCmds) >= self.maxCachedSafeCmds:
+            self.safeCmds.clear()
+        self.safeCmds[key] = safe
+        return safe
+
     def checkAccess(self, cmdr, actor, cmd=None):
         """Return whether the given cmdr may command the given actor.
 
@@ -47,12 +111,11 @@ class Auth(CPL.Object):
            - If the actor is locked, only allow APO users to command it.
            - If the program is unknown, deny access.
            - Otherwise check the program's access list.
+
+        Decisions are cached per (program, actor, whether the command is safe) until the
+        permissions are next changed.
         """
 
-        program = cmdr.split('.', 1)[0]
-        if self.debug > 5:
-            CPL.log("Auth.checkAccess", "checking %s (%s) -> %s" % (cmdr, program, actor))
-            
         if not cmd:
             cmd = self.defaultCmd
 
@@ -60,16 +123,48 @@ class Auth(CPL.Object):
         authName = actor.needsAuth
         if not authName:
             return True
-        actorName = actor.name
+
+        program = cmdr.split('.', 1)[0]
+        key = (program, authName, self.isSafe(actor, cmd.cmd))
+        try:
+            access = self.decisions[key]
+        except KeyError:
+            access = self.decide(program, authName, actor.name, key[2])
+            self.decisions[key] = access
+
+        if self.debug > 5:
+            CPL.log("Auth.checkAccess", "checked %s (%s) -> %s: %s" % (cmdr, program, actor.name, access))
+
+        if access is True or access is False:
+            return access
+
+        if access == self.LOCKED:
+            cmd.warn(qKV('text', "%s is locked by APO" % (actor.name)))
+        elif access == self.NO_PROGRAM:
+            # Send a warning to our .defaultCmd as well as to the affected cmd
+            cmd.warn(qKV('permsTxt', "Authorization table has no entry for program: %s" % (program)))
+            if cmd != self.defaultCmd:
+                self.defaultCmd.warn(qKV('permsTxt', "Authorization table has no entry for program: %s" % (program)))
+        return False
+
+    def decide(self, program, authName, actorName, safe):
+        """ Work out whether a program can command an actor.
+
+        Args:
+           program   - the commander's program name.
+           authName  - the name the actor is authorized as.
+           actorName - the actor's real name.
+           safe      - whether the actor declares the command to be safe.
+
+        Returns:
+           True or False, or .LOCKED or .NO_PROGRAM to deny access with a warning.
+        """
 
         # We can lock actors that we ordinarily don't know about, so check .lockedActors first
         if authName in self.lockedActors:
-            access = program in self.gods
-            if access:
+            if program in self.gods:
                 return True
-            else:
-                cmd.warn("text=%s" % (CPL.qstr("%s is locked by APO" % (actorName))))
-                return False
+            return self.LOCKED
 
         # If we don't know about an actor, let the command go through
         if authName not in self.actors:
@@ -78,11 +173,8 @@ class Auth(CPL.Object):
             return True
 
         # If the command is declared safe by the actor, let it go though.
-        safeCmds = actor.safeCmds
-        CPL.log("auth.checkAccess", "checking '%s' against %s" % (cmd.cmd, safeCmds))
-        if safeCmds != None and cmd.cmd != None:
-            if safeCmds.search(cmd.cmd):
-                return True
+        if safe:
+            return True
 
         # Let the hub command anything. This is for initialization commands, etc.
         if program == 'hub':
@@ -92,30 +184,20 @@ class Auth(CPL.Object):
         #
         try:
             accessList = self.programs[program]
-            if self.debug > 5:
-                CPL.log("Auth.checkAccess", "cmdr %s accessList = %s" % (cmdr, accessList))
-
-                ok = authName in accessList
-
-                if self.hackOn:
-                    CPL.log("Auth.checkAccess", "actor in accessList = %s" % (ok))
-                    return True
-                else:
-                    return ok
         except KeyError:
             # For SDSS, if permissions are disabled do not generate annoying warnings.
             if self.hackOn:
                 return True
+            return self.NO_PROGRAM
 
-            # In this case, send a warning to our .defaultCmd as well as to the affected cmd
-            cmd.warn("permsTxt=%s" % (CPL.qstr("Authorization table has no entry for program: %s" % (program))))
-            if cmd != self.defaultCmd:
-                self.defaultCmd.warn("permsTxt=%s" % (CPL.qstr("Authorization table has no entry for program: %s" % (program))))
-            if self.hackOn:
-                CPL.log("Auth.checkAccess", "unknown program %s" % (program))
-                return True
-            else:
-                return False
+        if self.debug > 5:
+            CPL.log("Auth.checkAccess", "program %s accessList = %s" % (program, accessList))
+
+        ok = authName in accessList
+        if self.hackOn:
+            CPL.log("Auth.checkAccess", "actor in accessList = %s" % (ok))
+            return True
+        return ok
 
     def status(self, cmd=None):
         """ Generate all our keys. 
@@ -146,13 +228,12 @@ class Auth(CPL.Object):
         actors = list(self.actors.keys())
         actors.remove('perms')
         actors.sort()
-        actors = [CPL.qstr(x) for x in actors]
 
         # HACK - older TUIs do not like empty variables ("name=")
         if actors:
-            cmd.inform("actors=%s" % (','.join(actors)))
+            cmd.inform(kv('actors', actors, quote=True))
         else:
-            cmd.inform("actors")
+            cmd.inform(kv('actors'))
             
         
     def genProgramsKey(self, cmd=None):
@@ -170,13 +251,12 @@ class Auth(CPL.Object):
 
         programs = list(self.programs.keys())
         programs.sort()
-        programs = [CPL.qstr(x) for x in programs]
 
         # HACK - older TUIs do not like empty variables ("name=")
         if programs:
-            cmd.inform("programs=%s" % (','.join(programs)))
+            cmd.inform(kv('programs', programs, quote=True))
         else:
-            cmd.inform("programs")
+            cmd.inform(kv('programs'))
             
         
     def genLockedKey(self, cmd=None):
@@ -194,13 +274,12 @@ class Auth(CPL.Object):
 
         actors = list(self.lockedActors.keys())
         actors.sort()
-        actors = [CPL.qstr(x) for x in actors]
 
         # HACK - older TUIs do not like empty variables ("name=")
         if actors:
-            cmd.inform("lockedActors=%s" % (','.join(actors)))
+            cmd.inform(kv('lockedActors', actors, quote=True))
         else:
-            cmd.inform("lockedActors")
+            cmd.inform(kv('lockedActors'))
 
     def addActors(self, actors, cmd=None):
         """ Register a list of actors to be controlled.
@@ -215,9 +294,10 @@ class Auth(CPL.Object):
 
         for a in actors:
             if a in self.actors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is already registered for access control." % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is already registered for access control." % (a)))
             else:
                 self.actors[a] = True
+        self.invalidate()
 
         # Prime superusers to be able to command newly connected actors
         #
@@ -248,9 +328,10 @@ class Auth(CPL.Object):
         self.lockedActors = {}
         for a in actors:
             if a not in self.actors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is not subject to permissions and will not be locked" % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is not subject to permissions and will not be locked" % (a)))
             else:
                 self.lockedActors[a] = True
+        self.invalidate()
 
         self.genLockedKey(cmd=cmd)
         
@@ -272,11 +353,12 @@ class Auth(CPL.Object):
 
         for a in actors:
             if a in self.lockedActors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is already locked" % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is already locked" % (a)))
             elif a not in self.actors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is not subject to permissions and will not be locked" % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is not subject to permissions and will not be locked" % (a)))
             else:
                 self.lockedActors[a] = True
+        self.invalidate()
 
         self.genLockedKey(cmd=cmd)
         
@@ -297,7 +379,8 @@ class Auth(CPL.Object):
             try:
                 del self.lockedActors[a]
             except KeyError:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s was not locked" % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s was not locked" % (a)))
+        self.invalidate()
 
         self.genLockedKey(cmd=cmd)
         
@@ -327,8 +410,7 @@ class Auth(CPL.Object):
                 raise Exception("No authorization entry found for program %s" % (prog))
             
             pAuth.sort()
-            actors = [CPL.qstr(x) for x in pAuth]
-            cmd.inform("authList=%s,%s" % (CPL.qstr(prog), ','.join(actors)))
+            cmd.inform(kv('authList', [prog] + pAuth, quote=True))
         
     def addPrograms(self, programs=[], actors=[], cmd=None):
         """ Add a list program to the control list.
@@ -353,11 +435,11 @@ class Auth(CPL.Object):
 
         for prog in programs:
             if prog in self.programs:
-                cmd.warn("permsTxt=%s" % \
-                         (CPL.qstr("Program %s already has an authorization entry, which will not be modified." % (prog))))
+                cmd.warn(qKV('permsTxt', "Program %s already has an authorization entry, which will not be modified." % (prog)))
                 continue
             self.programs[prog] = {}
             self.setActorsForProgram(prog, actors, cmd=cmd)
+        self.invalidate()
         self.genProgramsKey(cmd=cmd)
         
     def dropPrograms(self, programs=[], cmd=None):
@@ -380,15 +462,14 @@ class Auth(CPL.Object):
 
         for program in programs:
             if program in self.gods:
-                cmd.warn("permsTxt=%s" % \
-                         (CPL.qstr("Super-%s cannot be removed from the list of authorized programs" % (program))))
+                cmd.warn(qKV('permsTxt', "Super-%s cannot be removed from the list of authorized programs" % (program)))
                 self.genAuthKeys([program], cmd)
                 continue
             try:
                 del self.programs[program]
             except:
-                cmd.warn("permsTxt=%s" % \
-                         (CPL.qstr("Program %s did not have an authorization entry, so could not be deleted" % (program))))
+                cmd.warn(qKV('permsTxt', "Program %s did not have an authorization entry, so could not be deleted" % (program)))
+        self.invalidate()
             
         self.genProgramsKey(cmd=cmd)
     
@@ -403,13 +484,13 @@ class Auth(CPL.Object):
             cmd = self.defaultCmd
 
         if program not in self.programs:
-            cmd.fail("permsTxt=%s" % (CPL.qstr("Program %s did not have an authorization entry, so could not be set" % (program))))
+            cmd.fail(qKV('permsTxt', "Program %s did not have an authorization entry, so could not be set" % (program)))
             return
         
         d = {}
         for a in actors:
             if a not in self.actors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is not subject to permissions." % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is not subject to permissions." % (a)))
             else:
                 d[a] = True
             
@@ -418,6 +499,7 @@ class Auth(CPL.Object):
         if program in self.gods:
             d['perms'] = True
         self.programs[program] = d
+        self.invalidate()
 
         self.genAuthKeys(programs=[program], cmd=cmd)
         
@@ -434,14 +516,15 @@ class Auth(CPL.Object):
         try:
             d = self.programs[program]
         except KeyError as e:
-            cmd.fail("permsTxt=%s" % (CPL.qstr("Program %s did not have an authorization entry, so could not be added to" % (program))))
+            cmd.fail(qKV('permsTxt', "Program %s did not have an authorization entry, so could not be added to" % (program)))
             return
 
         for a in actors:
             if a not in self.actors:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s is not subject to permissions." % (a))))
+                cmd.warn(qKV('permsTxt', "Actor %s is not subject to permissions." % (a)))
             else:
                 d[a] = True
+        self.invalidate()
 
         self.genAuthKeys(programs=[program], cmd=cmd)
         
@@ -455,17 +538,98 @@ class Auth(CPL.Object):
         try:
             d = self.programs[program]
         except KeyError as e:
-            cmd.fail("permsTxt=%s" % (CPL.qstr("Program %s did not have an authorization entry, so could not be modified" % (program))))
+            cmd.fail(qKV('permsTxt', "Program %s did not have an authorization entry, so could not be modified" % (program)))
             return
 
         for a in actors:
             try:
                 del d[a]
             except KeyError:
-                cmd.warn("permsTxt=%s" % (CPL.qstr("Actor %s was not in program %s's athorized list" % (a, program))))
+                cmd.warn(qKV('permsTxt', "Actor %s was not in program %s's athorized list" % (a, program)))
+        self.invalidate()
 
         self.genAuthKeys(programs=[program], cmd=cmd)
 
+class PasswordStore(CPL.Object):
+    """ The login passwords, which are only reread when the password file changes.
+
+    The file has one "program password" entry per line, plus blank and '#' comment lines.
+    Program names are matched without regard to case.
+    """
+
+    def __init__(self, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        self.passwords = {}
+
+        # The (path, inode, size, mtime) of the file we last read.
+        self.fileID = None
+        self.reads = 0
+
+    def refresh(self):
+        """ Reread the password file if it has changed since we last read it.
+
+        Returns:
+           True, or a string describing the problem.
+        """
+
+        try:
+            path = CPL.cfg.get('hub', 'passwordFile')
+            st = os.stat(path)
+        except Exception as e:
+            self.forget()
+            g.hubcmd.inform(qKV('HubError', "Could not read the password file: %s" % e),
+                            src="hub")
+            return "Could not read the password file."
+
+        fileID = (path, st.st_ino, st.st_size, st.st_mtime_ns)
+        if fileID == self.fileID:
+            return True
+
+        try:
+            pw_f = open(path, "r")
+        except Exception as e:
+            self.forget()
+            g.hubcmd.inform(qKV('HubError', "Could not read the password file: %s" % e),
+                            src="hub")
+            return "Could not read the password file."
+
+        passwords = {}
+        with pw_f:
+            for l in pw_f:
+                # Ignore blank lines and comment lines.
+                #
+                l = l.strip()
+                if len(l) == 0 or l[0] == '#':
+                    continue
+
+                try:
+                    (program, password) = l.split()
+                except Exception as e:
+                    g.hubcmd.inform(qKV('HubError', "password file line cannot be parsed: %s" % l),
+                                    src="hub")
+                    continue
+                passwords[program.upper()] = password
+
+        self.passwords = passwords
+        self.fileID = fileID
+        self.reads += 1
+        if self.debug > 0:
+            CPL.log("PasswordStore.refresh", "read %d passwords from %s" % (len(passwords), path))
+
+        return True
+
+    def forget(self):
+        """ Drop all passwords, so that the file is reread before the next login. """
+
+        self.passwords = {}
+        self.fileID = None
+
+    def get(self, program):
+        """ Return the password for a program, or None. Does not check the file. """
+
+        return self.passwords.get(program.upper(), None)
+
 if __name__ == "__main__":
     def checkAndPrint(cmdr, actor, expect):
         access = a.checkAccess(cmdr, actor)
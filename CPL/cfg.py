@@ -1,10 +1,13 @@
 """ A simple configuration manager. Loads python files in a given directory. That's it.
+
+Each file is only reread when it has changed: get(..., doFlush=True) and refresh() stat the
+file, and only reload it if its contents are different.
 """
 from __future__ import print_function
 
-from past.builtins import execfile
-__all__ = ['init', 'get', 'flush']
+__all__ = ['init', 'get', 'getSpace', 'flush', 'refresh', 'changedVars']
 
+import hashlib
 import os
 import sys
 
@@ -13,6 +16,9 @@ from CPL.Exceptions import ICCError
 cfgCache = None
 cfgPath = '/not/yet/defined'
 
+# What we know about each loaded file, as { space : ((mtime, size), sha1) }
+cfgStamps = {}
+
 def init(path=None, verbose=True):
     """ Initialize the cfg space.
     
@@ -41,6 +47,49 @@ def flush():
     global cfgCache
     
     cfgCache = {}
+    cfgStamps.clear()
+
+def refresh(space=None):
+    """ Reload any cached namespaces whose files have changed.
+
+    Args:
+        space     ? if set, only check this namespace.
+
+    Returns:
+        a dict of { space : old contents } for the namespaces which were reloaded.
+
+    If a changed file cannot be loaded, the error is raised and the old contents are kept.
+    """
+
+    if cfgCache == None:
+        init()
+
+    spaces = [space] if space != None else list(cfgCache.keys())
+    reloaded = {}
+    for s in spaces:
+        if s not in cfgCache:
+            continue
+        filename = _spacePath(s)
+        stamp, digest = cfgStamps.get(s, (None, None))
+        try:
+            st = os.stat(filename)
+        except OSError:
+            # Leave a vanished file's contents alone; the next real load will complain.
+            continue
+
+        newStamp = (st.st_mtime_ns, st.st_size)
+        if newStamp == stamp:
+            continue
+        old = cfgCache[s]
+        if _loadSpace(s, digest) is not old:
+            reloaded[s] = old
+
+    return reloaded
+
+def changedVars(old, new):
+    """ Return the sorted names of the variables which differ between two namespaces. """
+
+    return sorted([k for k in set(old) | set(new) if k not in old or k not in new or old[k] != new[k]])
 
 __nodef = 'no such variable HERE'
 def get(space, var, default=__nodef, doFlush=False):
@@ -50,13 +99,13 @@ def get(space, var, default=__nodef, doFlush=False):
         space     - the namespace to search.
         var       - the name of the variable to get.
         default   ? if set, and var is not in space, return this.
-        doFlush   ? if True, reload the config cache.
+        doFlush   ? if True, reload the namespace if its file has changed.
     """
 
-    if doFlush:
-        flush()
     if cfgCache == None:
         init()
+    if doFlush:
+        refresh(space)
         
     try:
         s = cfgCache[space]
@@ -68,19 +117,54 @@ def get(space, var, default=__nodef, doFlush=False):
     else:
         return s.get(var, default)
 
-def _loadSpace(space):
+def getSpace(space, doFlush=False):
+    """ Fetch a whole configuration namespace, as a dict which must not be modified.
+
+    Args:
+        space     - the namespace to fetch.
+        doFlush   ? if True, reload the namespace if its file has changed.
+    """
+
+    if cfgCache == None:
+        init()
+    if doFlush:
+        refresh(space)
+
+    try:
+        return cfgCache[space]
+    except KeyError:
+        return _loadSpace(space)
+
+def _spacePath(space):
+    return os.path.join(cfgPath, "%s.py" % (space))
+
+def _loadSpace(space, digest=None):
     """ Load a configuration file into the cache. 
 
     Args:
         space    - a namespace to load from cfgPath/space + ".py"
+        digest   ? if set, and the file still has this hash, keep the cached contents.
     """
     
     gdict = {}
     ldict = {}
     
-    filename = os.path.join(cfgPath, "%s.py" % (space))
+    filename = _spacePath(space)
+    try:
+        with open(filename, 'rb') as f:
+            st = os.fstat(f.fileno())
+            source = f.read()
+    except Exception as e:
+        raise ICCError("failed to read the configuration file %s: %s" % (filename, e))
+
+    stamp = (st.st_mtime_ns, st.st_size)
+    newDigest = hashlib.sha1(source).digest()
+    if digest != None and newDigest == digest and space in cfgCache:
+        cfgStamps[space] = (stamp, newDigest)
+        return cfgCache[space]
+
     try:
-        execfile(filename, gdict, ldict)
+        exec(compile(source, filename, 'exec'), gdict, ldict)
     except SyntaxError as e:
         # ICCError handling should be improved to handle multi-line errors,
         # so we could use the SyntaxError's .text and .offset, and spit out a proper
@@ -90,6 +174,7 @@ def _loadSpace(space):
         raise ICCError("failed to read the configuration file %s: %s" % (filename, e))
         
     cfgCache[space] = ldict
+    cfgStamps[space] = (stamp, newDigest)
     return ldict
 
 def _test():
@@ -0,0 +1,218 @@
+from __future__ import print_function
+from builtins import str
+__all__ = ['qstr', 'dequote', 'escapeEOL']
+
+""" The quoting and escaping used for keyword values.
+
+  - qstr() wraps a string in quotes, backslash-escaping any backslashes and quotes.
+  - dequote() undoes that.
+  - escapeEOL() hides EOL characters in an encoded value, so that it cannot end a line early.
+
+  These run for most keywords of most replies, so each has a fast path for the common case
+  of a string with nothing to escape. The output is identical to that of the original
+  find-and-rebuild loops; see the tests at the bottom of the file.
+"""
+
+def qstr(o, equotes=None, tquote='"'):
+    """ Put a string representation of an object into quotes and escape it minimally.
+
+    Return the string wrapped in tquotes.
+    Escape all the characters in equotes, as well as backslashes. If equotes are
+    are not defined, use tquote.
+
+    Basically,
+       o  -> "str(o)"
+       \  -> \\
+       eq  -> \eq
+    """
+
+    s = str(o)
+
+    # Always quote backslashes _first_.
+    #
+    if equotes == None:
+        if tquote == None:
+            return s
+        if tquote == '"' and '"' not in s and '\\' not in s:
+            return '"' + s + '"'
+        equotes = '\\' + tquote
+    else:
+        equotes = '\\' + equotes
+
+    # Escaping one character at a time, with str.replace(), matches the original
+    # find-and-rebuild loop exactly (including for repeated equotes), and beats
+    # str.translate(), whose multi-character mappings take a slow path.
+    #
+    for equote in equotes:
+        if equote in s:
+            s = s.replace(equote, "\\" + equote)
+
+    if tquote:
+        return ''.join((tquote, s, tquote))
+    else:
+        return s
+
+def dequote(s):
+    """ Convert s as a possibly quoted string to an unquoted string.
+
+    If s is quoted, strip the quotes and unescape internal quotes..
+    """
+
+    if s == None:
+        return None
+
+    assert type(s) == str
+
+    if len(s) >= 2:
+        c0 = s[0]
+        if c0 not in ('"', "'") or s[-1] != c0:
+            return s
+
+        # OK, we have a quoted string. Strip the quotes, and if there is nothing escaped
+        # we are done.
+        #
+        sNoQuotes = s[1:-1]
+        if '\\' not in sNoQuotes:
+            return sNoQuotes
+
+        # Unescape internal quotes, then escapes.
+        #
+        if c0 == '"':
+            sNoQuotes = sNoQuotes.replace('\\"', '"')
+        else:
+            sNoQuotes = sNoQuotes.replace("\\'", "'")
+
+        return sNoQuotes.replace('\\\\', '\\')
+
+    return s
+
+knownEscapes = { '\r' : '\\r',
+                 '\n' : '\\n' }
+
+def escapeEOL(s, escape):
+    """ If it exists in the string s, replace the escape string by an escaped version of itself. """
+
+    if not escape or s.find(escape) < 0:
+        return s
+
+    return s.replace(escape, ''.join([knownEscapes[c] for c in escape]))
+
+#
+# The original implementations, which the ones above must match exactly.
+#
+
+def _oldQstr(o, equotes=None, tquote='"'):
+    s = str(o)
+    if equotes == None:
+        if tquote == None:
+            return s
+        equotes = '\\' + tquote
+    else:
+        equotes = '\\' + equotes
+    for equote in equotes:
+        equote_repl = "\\" + equote
+        idx = 0
+        while 1:
+            dq = s.find(equote, idx)
+            if dq == -1:
+                break
+            s = ''.join((s[:dq], equote_repl, s[dq+1:]))
+            idx = dq + 2
+    if tquote:
+        return ''.join((tquote, s, tquote))
+    else:
+        return s
+
+def _oldDequote(s):
+    if s == None:
+        return None
+    if len(s) >= 2:
+        c0 = s[0]
+        if c0 not in ('"', "'") or s[-1] != c0:
+            return s
+        if c0 == '"':
+            findQuote = '\\"'
+            replaceQuote = '"'
+        else:
+            findQuote = "\\'"
+            replaceQuote = "'"
+        sNoQuotes = s[1:-1].replace(findQuote, replaceQuote)
+        sNoQuotes = sNoQuotes.replace('\\\\', '\\')
+        return sNoQuotes
+    return s
+
+def _oldEscapeEOL(s, escape):
+    if not escape:
+        return s
+    i = s.find(escape)
+    while i >= 0:
+        repl = ''.join([knownEscapes[c] for c in escape])
+        s = s[:i] + repl + s[i+len(escape):]
+        i = s.find(escape)
+    return s
+
+def testCodec(n=200000, seed=None):
+    """ Check that the codec matches the original implementations, and that dequote() undoes qstr(). """
+
+    import random
+
+    alphabet = ('a', 'b', ' ', '"', '"', "'", "'", '\\', '\\', '\r', '\n', '\r\n', 'xyz', u'\xe9')
+    quoting = ((None, '"'), (None, "'"), (None, None), (None, ''), ('"', '"'), ("'", '"'),
+               ('"\'', '"'), ('\\', '"'), ('""', '"'), ('ab', "'"), (None, '""'))
+    escapes = (None, '', '\n', '\r\n', '\r', '\n\r')
+
+    rng = random.Random(seed)
+    failures = 0
+    def fail(what, s, new, old):
+        print("MISMATCH in %s for %r: new=%r old=%r" % (what, s, new, old))
+        return 1
+
+    for i in range(n):
+        s = ''.join([rng.choice(alphabet) for j in range(rng.randint(0, 12))])
+
+        equotes, tquote = rng.choice(quoting)
+        new, old = qstr(s, equotes=equotes, tquote=tquote), _oldQstr(s, equotes=equotes, tquote=tquote)
+        if new != old:
+            failures += fail('qstr(%r, %r)' % (equotes, tquote), s, new, old)
+
+        for q in ('"', "'"):
+            if dequote(qstr(s, tquote=q)) != s:
+                failures += fail('dequote(qstr(tquote=%r))' % (q), s, dequote(qstr(s, tquote=q)), s)
+
+        for t in (s, '"%s"' % (s), "'%s'" % (s)):
+            new, old = dequote(t), _oldDequote(t)
+            if new != old:
+                failures += fail('dequote', t, new, old)
+
+        escape = rng.choice(escapes)
+        new, old = escapeEOL(s, escape), _oldEscapeEOL(s, escape)
+        if new != old:
+            failures += fail('escapeEOL(%r)' % (escape), s, new, old)
+
+    print("tested %d strings: %d mismatches" % (n, failures))
+    return failures == 0
+
+def benchmark(n=100000):
+    """ Time the codec against the original implementations. """
+
+    import time
+
+    tests = (('qstr, plain', qstr, _oldQstr, ('exposure 23 of 100 done, 128.30s elapsed',)),
+             ('qstr, quotes', qstr, _oldQstr, ('command "expose" failed: \\ no "shutter"',)),
+             ('dequote, plain', dequote, _oldDequote, ('"exposure 23 of 100 done, 128.30s elapsed"',)),
+             ('dequote, quotes', dequote, _oldDequote, ('"command \\"expose\\" failed: \\\\"',)),
+             ('escapeEOL, plain', escapeEOL, _oldEscapeEOL, ('"exposure 23 of 100 done"', '\n')),
+             ('escapeEOL, EOLs', escapeEOL, _oldEscapeEOL, ('"a\nb\nc\nd\ne\nf\ng\nh"', '\n')))
+
+    for name, new, old, args in tests:
+        times = []
+        for f in new, old:
+            t0 = time.time()
+            for i in range(n):
+                f(*args)
+            times.append(1e6 * (time.time() - t0) / n)
+        print("%-20s new=%0.3fus old=%0.3fus" % (name, times[0], times[1]))
+
+if __name__ == "__main__":
+    testCodec()
+    benchmark()
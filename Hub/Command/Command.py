@@ -1,5 +1,5 @@
 from builtins import range
-__all__ = ['Command']
+__all__ = ['Command', 'commandFromHandoverState']
            
 import re 
 import time
@@ -7,10 +7,11 @@ import time
 import collections
 import CPL
 from Hub.Reply.Reply import Reply
+from Hub.Reply.KVBuilder import kv, qKV
 import Parsing
 import g
 
-class Command(CPL.Object):
+class Command(object):
     """ Maintain everything required to shepherd a command through the hub.
 
     Basically, we need to track the commander's MID and CID, the internal XID,
@@ -26,8 +27,21 @@ class Command(CPL.Object):
                 Synthetic Commands can be created from Replys to commands which
                 we did not send. Those are assigned to .actorName
       cmdrMID - the Commander's MID
+
+    Lots of Commands get created, so we use __slots__, and do not subclass CPL.Object, whose
+    __del__ gets in the way of the garbage collector.
     """
 
+    __slots__ = ('debug', 'xid', 'ctime',
+                 'cmdrID', 'cmdrName', 'cmdrCid', 'cmdrMid',
+                 'actorName', 'cmd', 'actorCid', 'actorMid',
+                 'neverEnd', 'bcastCmdInfo',
+                 'argv', 'argDict', '_dcmd',
+                 'followers')
+
+    # How much of long commands to show in keywords and logs.
+    maxDisplayLength = 1000
+
     def __init__(self, cmdrID, cid, mid, tgt, cmd, **argv):
         """
         On commands from a Commander:
@@ -38,7 +52,7 @@ class Command(CPL.Object):
             - cmdrID is .actorname.
         """
 
-        CPL.Object.__init__(self, **argv)
+        self.debug = argv.get('debug', 0)
 
         # An internally unique identifier for the command. We could use cmdr + the Commander's
         # CID + MID, but that would leave us trusting the Cmdr.
@@ -71,20 +85,11 @@ class Command(CPL.Object):
         # Some Commands are essentially permanent.
         self.neverEnd = argv.get('neverEnd', False)
         
-        # Register ourselves in a convenient place.
-        # g.pendingCommands[self.xid] = self
-        
-        if self.cmdrCid == None:
-            cid_s = "None"
-        else:
-            cid_s = self.cmdrCid
-
-        if self.cmd == None:
-            cmd_s = ""
-        else:
-            cmd_s = self.cmd
-
         self.argDict = None
+        self._dcmd = None
+
+        # Identical Commands which are waiting on our replies instead of being sent themselves.
+        self.followers = None
         
         # We need to put this silly test here, 'cuz the hub creates g.hubcmd at startup,
         # and g.hubcmd does not yet exist when it is being created...
@@ -92,24 +97,23 @@ class Command(CPL.Object):
         self.bcastCmdInfo = argv.get('bcastCmdInfo', True)
         
         if g.hubcmd != None and self.bcastCmdInfo:
-            if self.cmd == None:
-                dcmd = None
-            else:
-                dcmd = self.cmd if len(self.cmd) < 1000 else self.cmd[:1000] + "...."
-            g.hubcmd.diag("CmdIn=%s,%s,%s" %
-                          (CPL.qstr(self.cmdrCid), 
-                           CPL.qstr(self.actorName),
-                           CPL.qstr(dcmd)),
+            g.hubcmd.diag(kv('CmdIn', (self.cmdrCid, self.actorName, self.dcmd()), quote=True),
                           src='cmds')
             
+    def dcmd(self):
+        """ Return the command text for display, truncated if it is very long. """
+
+        if self._dcmd is None and self.cmd is not None:
+            if len(self.cmd) < self.maxDisplayLength:
+                self._dcmd = self.cmd
+            else:
+                self._dcmd = self.cmd[:self.maxDisplayLength] + "...."
+        return self._dcmd
+
     def __str__(self):
-        if self.cmd == None:
-            dcmd = None
-        else:
-            dcmd = self.cmd if len(self.cmd) < 1000 else self.cmd[:1000] + "...."
         return "Command(xid=%s, cmdr=%s, cmdrCid=%s, cmdrMid=%s, actor=%s, cmd=%s)" % \
                (self.xid, self.cmdrName, self.cmdrCid, self.cmdrMid, self.actorName,
-                CPL.qstr(dcmd))
+                CPL.qstr(self.dcmd()))
 
 
     def _names(self):
@@ -129,15 +133,28 @@ class Command(CPL.Object):
 
     def reportQueued(self):
         if g.hubcmd != None and self.bcastCmdInfo:
-
-            dcmd = self.cmd if len(self.cmd) < 1000 else self.cmd[:1000] + "...."
-            g.hubcmd.diag(("CmdQueued=%d,%0.2f,%s,%s,%s,%s,%s" %
-                           (self.xid, self.ctime,
-                            CPL.qstr(self.cmdrCid), self.cmdrMid,
-                            CPL.qstr(self.actorName), self.actorMid,
-                            CPL.qstr(dcmd))),
+            g.hubcmd.diag(kv('CmdQueued', (self.xid, "%0.2f" % (self.ctime),
+                                           CPL.qstr(self.cmdrCid), self.cmdrMid,
+                                           CPL.qstr(self.actorName), self.actorMid,
+                                           CPL.qstr(self.dcmd()))),
                           src='cmds')
 
+    # What handoverState() carries, apart from the followers.
+    handoverSlots = ('debug', 'xid', 'ctime',
+                     'cmdrID', 'cmdrName', 'cmdrCid', 'cmdrMid',
+                     'actorName', 'cmd', 'actorCid', 'actorMid',
+                     'neverEnd', 'bcastCmdInfo')
+
+    def handoverState(self):
+        """ Return ourselves as plain data, for a new hub process to rebuild us from. """
+
+        state = dict([(k, getattr(self, k)) for k in self.handoverSlots])
+        if self.followers:
+            state['followers'] = [f.handoverState() for f in self.followers]
+        else:
+            state['followers'] = None
+        return state
+
     def connectToActor(self, cid, mid):
         """ Note the parts of the command we can only figure out when connected to the target. """
         
@@ -170,14 +187,10 @@ class Command(CPL.Object):
     def cmdr(self):
         """ Return our commander. """
 
-        for c in list(g.commanders.values()):
-            CPL.log("Command.cmdr()" , "checking %s in %s" % (self.cmdrName, c))
-            if self.cmdrName == c.name:
-                CPL.log("Command.cmdr()" , "matched %s in %s" % (self.cmdrName, c))
-                return c
-
-        CPL.log("Command.cmdr()" , "no cmdr %s in %s" % (self.cmdrName, g.commanders))
-        return None
+        c = g.commanders.findByName(self.cmdrName)
+        if c is None:
+            CPL.log("Command.cmdr()" , "no cmdr %s in %s" % (self.cmdrName, g.commanders))
+        return c
         
         
     def eatAVee(self, s):
@@ -200,7 +213,7 @@ class Command(CPL.Object):
         if matches:
             return matches.groupdict()
         else:
-            g.hubcmd.inform('ParseError=%s' % (CPL.qstr("Consuming all trailing text '%s'" % (s))),
+            g.hubcmd.inform(qKV('ParseError', "Consuming all trailing text '%s'" % (s)),
                             src='hub')
         return {'val':CPL.qstr(s), 'rest':''}
 
@@ -249,7 +262,7 @@ class Command(CPL.Object):
         if c == "\\" and level % 2 == 1:
             add += "\\"
        
-        g.hubcmd.inform([('ParseError', CPL.qstr('appended %s to string %s' % (add, s)))],
+        g.hubcmd.inform(qKV('ParseError', 'appended %s to string %s' % (add, s)),
                         src='hub')
         s += add
         return {'val':s, 'level':1, 'rest':''}
@@ -277,7 +290,7 @@ class Command(CPL.Object):
     
         match = self.kv_re.match(s)
         if match == None:
-            g.hubcmd.inform([('ParseError', CPL.qstr("No key-value found at '%s'" % (s)))],
+            g.hubcmd.inform(qKV('ParseError', "No key-value found at '%s'" % (s)),
                             src='hub')
             return None
         
@@ -352,7 +365,7 @@ class Command(CPL.Object):
         """ Parse a raw command string into an OrderedDict in .argDict. """
         
         if not self.argDict:
-            self.argDict = Parsing.parseArgs(self.cmd)
+            self.argDict = Parsing.argsCache.parse(self.cmd)
             
     def match(self, opts):
         """ Searches an OrderedDict for matches.
@@ -401,7 +414,9 @@ class Command(CPL.Object):
 
         """
 
-        if not hasattr(self, 'argv'):
+        try:
+            self.argv
+        except AttributeError:
             self.parse()
             
         CPL.log("MCCommand.coverArgs",
@@ -487,6 +502,34 @@ class Command(CPL.Object):
         r = Reply(self, flag, KVs, src=src, bcast=bcast)
         self.reply(r, **argv)
         
+    def follow(self, leader):
+        """ Have our replies come from another, identical, Command. """
+
+        if leader.followers is None:
+            leader.followers = []
+        leader.followers.append(self)
+
+        if self.bcastCmdInfo:
+            g.hubcmd.diag(kv('CmdCoalesced', (self.xid, leader.xid)), src="cmds")
+
+    def replyToFollowers(self, r):
+        """ Pass one of our Replys on to each of our followers.
+
+        The followers' commanders always get all the keys, even if they might have seen
+        some of them in our own Reply: that one can be trimmed by their key subscriptions,
+        changesOnly or conflation, and the replies to their own commands never are.
+        Other commanders only hear about the followers finishing.
+        """
+
+        followers = self.followers
+        if r.finishesCommand():
+            self.followers = None
+
+        for f in followers:
+            if not r.KVs and not r.finishesCommand():
+                continue
+            f.reply(Reply(f, r.flag, r.KVs, src=r.src, bcast=False), noRegister=True)
+
     def reply(self, r, **argv):
         """ Finally register a Reply's KVs and offer it to any interested parties."""
 
@@ -494,14 +537,32 @@ class Command(CPL.Object):
             CPL.log("Command.sendReply", "reply = %r" % (r))
 
         if not argv.get('noRegister', False):
+            r.unchangedKeys = g.KVs.unchangedKeysFromReply(r)
             g.KVs.setKVsFromReply(r)
 
         for c in list(g.commanders.values()):
             c.tasteReply(r)
+
+        if self.followers:
+            self.replyToFollowers(r)
             
         if r.finishesCommand():
-            # del g.pendingCommands[self.xid]
             if self.bcastCmdInfo:
-                g.hubcmd.diag("CmdDone=%s,%s" % (self.xid, CPL.qstr(r.flag.lower())),
+                g.hubcmd.diag(kv('CmdDone', (self.xid, CPL.qstr(r.flag.lower()))),
                               src="cmds")
             
+
+def commandFromHandoverState(state):
+    """ Rebuild a Command from its handoverState(), without announcing it again. """
+
+    cmd = Command.__new__(Command)
+    for k in Command.handoverSlots:
+        setattr(cmd, k, state[k])
+    cmd.argDict = None
+    cmd._dcmd = None
+    if state['followers']:
+        cmd.followers = [commandFromHandoverState(f) for f in state['followers']]
+    else:
+        cmd.followers = None
+
+    return cmd
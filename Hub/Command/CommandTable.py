@@ -0,0 +1,185 @@
+__all__ = ['CommandTable']
+
+import collections
+import time
+
+import CPL
+from Hub.Reply.KVBuilder import kv
+
+class CommandTable(CPL.Object):
+    """ The hub-wide table of Commands which have been sent to, or seen from, actors, indexed by XID.
+
+        The table lets us:
+          - fail Commands which the actor has not finished in time, with a timeout keyword.
+          - forget synthetic Commands (i.e. those which were created from Replys to commands we did
+            not send), either when there are too many of them or when they have not been heard from
+            for too long. Some actors never finish those.
+          - forget a commander's Commands when it disconnects.
+
+        The actors keep their own registries, and are told to forget Commands via .forgetCommand().
+    """
+
+    def __init__(self, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        # All entries, as { xid : (Command, ActorNub) }
+        self.commands = {}
+
+        # The deadlines of those Commands which can time out, as { xid : time }
+        self.deadlines = {}
+
+        # The synthetic Commands, least recently heard from first, as { xid : time }
+        self.external = collections.OrderedDict()
+
+        # How many of the above each actor has, as { actor : [all, timed, synthetic] }
+        self.actorCounts = {}
+
+        self.maxExternal = argv.get('maxExternal', 1000)
+        self.maxExternalAge = argv.get('maxExternalAge', 3600.0)
+        self.reapInterval = argv.get('reapInterval', 1.0)
+
+        # Some stats
+        self.timedOut = 0
+        self.reaped = 0
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __contains__(self, cmd):
+        return cmd.xid in self.commands
+
+    def add(self, cmd, actor, timeout=None, external=False):
+        """ Register a Command that an actor is working on.
+
+        Args:
+           cmd      - the Command.
+           actor    - the ActorNub it was sent to, or heard from.
+           timeout  - if set, fail the Command if it is not finished in this many seconds.
+           external - if True, the Command is synthetic, and can be forgotten if we
+                      stop hearing about it.
+        """
+
+        xid = cmd.xid
+        if xid in self.commands:
+            self.remove(cmd)
+        self.commands[xid] = (cmd, actor)
+        counts = self.actorCounts.get(actor, None)
+        if counts is None:
+            counts = self.actorCounts[actor] = [0, 0, 0]
+        counts[0] += 1
+        if timeout:
+            self.deadlines[xid] = cmd.ctime + timeout
+            counts[1] += 1
+        if external:
+            self.external[xid] = time.time()
+            counts[2] += 1
+            if len(self.external) > self.maxExternal:
+                oldXid = next(iter(self.external))
+                self._forget(oldXid)
+                self.reaped += 1
+
+    def touch(self, cmd):
+        """ Note that we have heard about a synthetic Command. """
+
+        xid = cmd.xid
+        if xid in self.external:
+            del self.external[xid]
+            self.external[xid] = time.time()
+
+    def remove(self, cmd):
+        """ Unregister a Command. Does not care if the Command is not registered. """
+
+        xid = cmd.xid
+        if xid not in self.commands:
+            return
+
+        actor = self.commands.pop(xid)[1]
+        counts = self.actorCounts[actor]
+        counts[0] -= 1
+        if xid in self.deadlines:
+            del self.deadlines[xid]
+            counts[1] -= 1
+        if xid in self.external:
+            del self.external[xid]
+            counts[2] -= 1
+        if counts[0] == 0:
+            del self.actorCounts[actor]
+
+    def _forget(self, xid):
+        """ Unregister a Command and have its actor forget it. """
+
+        cmd, actor = self.commands[xid]
+        self.remove(cmd)
+        actor.forgetCommand(cmd)
+
+    def countFor(self, actor):
+        """ Return the number of (all, timed, synthetic) Commands registered for an actor. """
+
+        return tuple(self.actorCounts.get(actor, (0, 0, 0)))
+
+    def dropCommander(self, cmdrName):
+        """ Forget all the Commands sent by a given commander.
+
+        Except for those which fill an actor's window of commands in flight: they are kept
+        until the actor finishes them or they time out, so that the actor is not sent more.
+        """
+
+        xids = [xid for xid, (cmd, actor) in self.commands.items() if cmd.cmdrName == cmdrName]
+        for xid in xids:
+            cmd, actor = self.commands[xid]
+            if actor.holdsSlot(cmd):
+                CPL.log("CommandTable.dropCommander", "keeping %s until %s finishes it" % (cmd, actor.name))
+                continue
+            CPL.log("CommandTable.dropCommander", "forgetting %s" % (cmd))
+            self._forget(xid)
+
+            # Any other commanders waiting on the command's replies still need them.
+            if cmd.followers:
+                actor.releaseFollowers(cmd)
+
+    def reap(self, now=None):
+        """ Fail any timed-out Commands, and forget any stale synthetic Commands. """
+
+        if now is None:
+            now = time.time()
+
+        expired = [xid for xid, deadline in self.deadlines.items() if deadline <= now]
+        for xid in expired:
+            cmd, actor = self.commands[xid]
+            self.timedOut += 1
+            self._forget(xid)
+            CPL.log("CommandTable.reap", "timing out %s" % (cmd))
+            cmd.fail(kv('timeout', '%0.1f' % (now - cmd.ctime)).addQuoted('text', "command timed out in %s" % (actor.name)),
+                     src=actor.name)
+
+        oldest = now - self.maxExternalAge
+        while self.external:
+            xid, lastSeen = next(iter(self.external.items()))
+            if lastSeen > oldest:
+                break
+            self._forget(xid)
+            self.reaped += 1
+
+    def startReaper(self, poller):
+        """ Arrange for .reap() to be called periodically from the poller. """
+
+        self._reapTimer(None, poller)
+
+    def _reapTimer(self, timer, poller=None):
+        if timer is not None:
+            poller = timer['token']
+            try:
+                self.reap()
+            except Exception as e:
+                CPL.tback("CommandTable.reap", e)
+
+        poller.addTimer({'time' : time.time() + self.reapInterval,
+                         'callback' : self._reapTimer,
+                         'token' : poller})
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        cmd.inform("pendingCmds=%d,%d,%d,%d,%d" % (len(self.commands), len(self.deadlines),
+                                                   len(self.external),
+                                                   self.timedOut, self.reaped))
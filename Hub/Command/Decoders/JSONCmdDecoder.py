@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+__all__ = ['JSONCmdDecoder']
+
+import json
+
+import CPL
+from Hub.Command import Command
+import g
+
+from .CommandDecoder import CommandDecoder
+
+class JSONCmdDecoder(CommandDecoder):
+    """ Decode commands sent as single-line JSON objects:
+
+        {"target":"tcc","command":"show status","mid":12,"cid":"myScript"}
+
+    "target" and "command" are required. Without a "mid", commands are numbered for the
+    client. Without a "cid", the command is identified by the connection's name. Replies to
+    the command carry the cid and mid back.
+    """
+
+    def __init__(self, **argv):
+        CommandDecoder.__init__(self, **argv)
+
+        self.EOL = argv.get('EOL', '\n')
+        self.mid = 1
+
+    def decode(self, buf, newData):
+        """ Find and extract a single complete command from the given buffer.
+
+        Returns:
+           - a Command instance, or None if no complete command was found.
+           - the unconsumed part of the buffer.
+        """
+
+        if newData:
+            buf += newData
+
+        # Skip over blank and unparseable lines, so that they do not hold up the commands
+        # behind them.
+        #
+        while True:
+            eol = buf.find(self.EOL)
+            if self.debug > 2:
+                CPL.log('JSONCmdDecoder.decode', "EOL at %d in buffer %r" % (eol, buf))
+
+            if eol == -1:
+                return None, buf
+
+            cmdString = buf[:eol]
+            buf = buf[eol+len(self.EOL):]
+
+            # json.loads() ignores the '\r' of '\r\n' line ends.
+            if not cmdString.strip():
+                continue
+
+            try:
+                d = json.loads(cmdString)
+                tgt = d['target']
+                cmd = d['command']
+                if not isinstance(tgt, str) or not isinstance(cmd, str):
+                    raise ValueError("target and command must be strings")
+
+                mid = d.get('mid', None)
+                if mid is None:
+                    mid = self.mid
+                    self.mid += 1
+                cid = d.get('cid', None)
+                if cid is None:
+                    cid = self.name
+            except Exception as e:
+                g.hubcmd.fail('ParseError=%s' % \
+                              (CPL.qstr('Command from %s could not be parsed (%s): %r' % \
+                                        (self.name, e, cmdString))),
+                              src='hub')
+                continue
+
+            return Command(self.nubID, str(cid), str(mid), tgt.strip(), cmd), buf
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+__all__ = ['WireCmdDecoder']
+
+import CPL
+from Hub.Command import Command
+from Hub.KV.WireFormat import WireReader, WireError
+import g
+
+from .ASCIICmdDecoder import ASCIICmdDecoder
+
+class WireCmdDecoder(ASCIICmdDecoder):
+    """ Decode commands sent either as binary frames (see Hub/KV/WireFormat.py) or as ASCII lines.
+
+    Frames always start with a 0 byte, so each command can be recognized for what it is, and
+    ASCII lines are handled with all the ASCIICmdDecoder options. The needCID and needMID
+    options apply to frames too: if they are not set, the frame's cid or mid is replaced just
+    as it would be for an ASCII line.
+    """
+
+    def __init__(self, **argv):
+        ASCIICmdDecoder.__init__(self, **argv)
+
+        self.reader = WireReader(name='wireCmds')
+
+    def decode(self, buf, newData):
+        """ Find and extract a single complete command from the given buffer.
+
+        Returns:
+           - a Command instance, or None if no complete command was found.
+           - the unconsumed part of the buffer, as a bytearray.
+
+        Commands which cannot be parsed are failed, and skipped.
+        """
+
+        if not isinstance(buf, bytearray):
+            buf = bytearray(buf.encode('latin-1') if isinstance(buf, str) else buf)
+        if newData:
+            buf += newData.encode('latin-1') if isinstance(newData, str) else newData
+
+        while buf:
+            if buf[0] != 0:
+                EOL = self.EOL.encode('latin-1')
+                eol = buf.find(EOL)
+                if eol == -1:
+                    return None, buf
+                line = buf[:eol + len(EOL)].decode('latin-1')
+                del buf[:eol + len(EOL)]
+
+                # This might adjust our .EOL for telnet connections.
+                cmd, leftover = ASCIICmdDecoder.decode(self, line, None)
+                if cmd is None:
+                    continue
+                return cmd, buf
+
+            try:
+                ftype, body = self.reader.readFrame(buf)
+                if ftype is None:
+                    return None, buf
+                if ftype != 'C':
+                    raise WireError("unexpected %r frame" % (ftype))
+                cid, mid, tgt, cmd = self.reader.unpackCommand(body)
+                if not tgt or not mid.isdigit():
+                    raise WireError("bad target or MID: %r %r" % (tgt, mid))
+            except WireError as e:
+                g.hubcmd.fail('ParseError=%s' % \
+                              (CPL.qstr('Command frame from %s could not be parsed: %s' % \
+                                        (self.name, e))),
+                              src='hub')
+                continue
+
+            if not self.needCID:
+                cid = self.name
+            if not self.needMID:
+                mid = str(self.mid)
+                self.mid += 1
+
+            return Command(self.nubID, cid, mid, tgt, cmd), buf
+
+        return None, buf
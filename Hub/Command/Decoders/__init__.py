@@ -2,3 +2,5 @@ from __future__ import absolute_import
 from .CommandDecoder import CommandDecoder
 from .ASCIICmdDecoder import ASCIICmdDecoder
 from .RawCmdDecoder import RawCmdDecoder
+from .WireCmdDecoder import WireCmdDecoder
+from .JSONCmdDecoder import JSONCmdDecoder
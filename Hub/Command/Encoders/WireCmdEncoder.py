@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+__all__ = ['WireCmdEncoder']
+
+import CPL
+from Hub.KV.WireFormat import WireWriter
+from .ASCIICmdEncoder import ASCIICmdEncoder
+
+class WireCmdEncoder(ASCIICmdEncoder):
+    """ Encode commands as binary frames (see Hub/KV/WireFormat.py), once the actor has agreed to them.
+
+    Until then, and for good if the actor does not agree, commands are encoded as ASCII lines,
+    with all the ASCIICmdEncoder options. Agreement is reached by sending .negotiateCmd
+    (normally as the first of the nub's initCmds): a WireReplyDecoder, given us as its
+    encoder, passes us the replies, and we switch to frames when that command finishes
+    successfully. Actors in frame mode must still accept ASCII lines, which covers any commands
+    sent before the reply arrives.
+
+    A frame's cid is the commander name or CID, as the sendCommander and sendCommanderCID
+    options say, and its tgt is only filled in if useTarget is set.
+    """
+
+    negotiateCmd = 'wire binary'
+
+    def __init__(self, **argv):
+        ASCIICmdEncoder.__init__(self, **argv)
+
+        self.writer = WireWriter()
+        self.binary = argv.get('binary', False)
+
+        # The MID of our negotiateCmd, while we are waiting for it to finish.
+        self.negotiatingMid = None
+
+    def encode(self, cmd):
+        if not self.binary:
+            if cmd.cmd == self.negotiateCmd:
+                self.negotiatingMid = str(cmd.actorMid)
+            return ASCIICmdEncoder.encode(self, cmd)
+
+        if self.sendCmdrCID:
+            cid = cmd.cmdrCid
+        elif self.sendCmdr:
+            cid = cmd.cmdrName
+        else:
+            cid = ''
+
+        e = self.writer.packCommand(cid, cmd.actorMid,
+                                    cmd.actorName if self.useTarget else '',
+                                    cmd.cmd)
+        if self.debug > 5:
+            CPL.log("WireCmdEncoder", "encoded: %r" % (e))
+
+        return e
+
+    def checkReply(self, reply):
+        """ Switch to frames if reply successfully finishes our negotiateCmd. """
+
+        if reply['mid'] != self.negotiatingMid:
+            return
+
+        flag = reply['flag']
+        if flag == ':':
+            CPL.log("WireCmdEncoder", "%s accepted binary frames" % (self.nubID))
+            self.binary = True
+        elif flag in 'f!':
+            CPL.log("WireCmdEncoder", "%s refused binary frames; staying with ASCII" % (self.nubID))
+        else:
+            return
+        self.negotiatingMid = None
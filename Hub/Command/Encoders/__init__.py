@@ -3,4 +3,5 @@ from .CommandEncoder import *
 from .BinaryCmdEncoder import *
 from .ASCIICmdEncoder import *
 from .RawCmdEncoder import *
+from .WireCmdEncoder import *
 
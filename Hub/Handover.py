@@ -0,0 +1,451 @@
+__all__ = ['Handover']
+
+import os
+import pickle
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+import CPL
+import IO
+from Hub.Command.Command import commandFromHandoverState
+from Hub.Reply.KVBuilder import kv, qKV
+import g
+import hub
+
+class HandoverLink(IO.IOHandler):
+    """ The old hub's end of the Unix socket to the new hub process, while that is starting up. """
+
+    def __init__(self, poller, handover, sock, **argv):
+        IO.IOHandler.__init__(self, poller, **argv)
+        self.handover = handover
+        self.buffer = ''
+        self.setInputFile(sock)
+
+    def copeWithInput(self, s):
+        self.buffer += s
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            self.handover.childSaid(line)
+
+    def detach(self):
+        """ Stop listening to the socket, and return it. """
+
+        sock = self.in_f
+        self.poller.removeInput(self)
+        self.in_f = None
+        self.in_fd = None
+        return sock
+
+    def shutdown(self, **argv):
+        self.ioshutdown(**argv)
+        self.handover.childGone(argv.get('why', 'closed'))
+
+class Handover(CPL.Object):
+    """ Restart the hub by handing all its connections over to a new hub process.
+
+    The old hub starts a new one (with the same command line), and gives it one end of a
+    Unix socket. While the new hub starts up, the old one carries on. When the new one is
+    ready, the old hub stops, and sends it:
+      - the state of each nub and its commands, and the hub's keywords and permissions,
+        as a pickle of plain data (see the nubs' handoverState() methods),
+      - the listening and connected sockets, as SCM_RIGHTS ancillary data.
+    The new hub rebuilds its nubs around the sockets, says "ok", and starts running. The old
+    hub then exits without closing any connections. If the new hub fails before saying
+    "ok", the old one just carries on.
+
+    Clients only see a pause while the state is handed over. Anything they send meanwhile
+    waits in the kernel's socket buffers.
+    """
+
+    # Linux will not pass more than 253 descriptors in one message.
+    maxFdsPerMessage = 200
+
+    # The environment variable telling a new hub which descriptor to take over from.
+    envName = 'TRON_HANDOVER_FD'
+
+    def __init__(self, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        # Old hub: the new hub process, our link to it, and the command which asked for the restart.
+        self.child = None
+        self.link = None
+        self.cmd = None
+        self.timeout = 30.0
+        self.started = None
+
+        # New hub: the inherited sockets not yet claimed, as { (kind, name) : socket }
+        self.sockets = {}
+
+        # New hub: how the last handover went, as (snapshot, restore, gap) seconds, and
+        # how many (listeners, actors, commanders, commands) were taken over.
+        self.times = None
+        self.counts = None
+
+    def isUnderWay(self):
+        """ Are we waiting for a new hub to take over from us? """
+
+        return self.link is not None
+
+    def isInherited(self):
+        """ Were we started to take over from an old hub? """
+
+        return self.envName in os.environ
+
+    def takeSocket(self, kind, name):
+        """ Return an inherited socket for a given nub, or None. """
+
+        return self.sockets.pop((kind, name), None)
+
+    # The old hub's side.
+    #
+    def start(self, cmd=None, timeout=None):
+        """ Start a new hub process and arrange to hand over to it once it is ready.
+
+        Args:
+           cmd      - the command asking for the restart, which is finished when we hand over.
+           timeout  - how many seconds the new hub has to take over.
+
+        Raises:
+           RuntimeError if a handover is already under way, or whatever starting the new process raises.
+        """
+
+        if self.link is not None:
+            raise RuntimeError("a handover to process %s is already under way" % (self.child.pid))
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        env = dict(os.environ)
+        env[self.envName] = str(theirs.fileno())
+        argv = getattr(sys, 'orig_argv', None) or [sys.executable] + sys.argv
+        try:
+            self.child = subprocess.Popen(argv, pass_fds=(theirs.fileno(),), env=env,
+                                          cwd=g.rootDir)
+        except:
+            ours.close()
+            raise
+        finally:
+            theirs.close()
+
+        CPL.log('Handover.start', 'started new hub process %d: %s' % (self.child.pid, argv))
+        self.cmd = cmd
+        self.timeout = timeout if timeout is not None else CPL.cfg.get('hub', 'handoverTimeout', 30.0)
+        self.started = time.time()
+        self.link = HandoverLink(g.poller, self, ours)
+        g.poller.callMeIn(self._checkTimeout, self.timeout)
+
+    def childSaid(self, line):
+        if line == 'ready':
+            self.handOver()
+        else:
+            self.abandon("the new hub said %r" % (line))
+
+    def childGone(self, why):
+        if self.link is not None:
+            self.link = None
+            self.abandon("the new hub went away before taking over: %s" % (why))
+
+    def _checkTimeout(self):
+        if self.link is not None and time.time() - self.started >= self.timeout:
+            self.abandon("the new hub was not ready after %0.1fs" % (self.timeout))
+
+    def abandon(self, why):
+        """ Give up on handing over, and carry on ourselves. """
+
+        CPL.log('Handover.abandon', why)
+        if self.link is not None:
+            link = self.link
+            self.link = None
+            link.ioshutdown()
+        if self.child is not None:
+            try:
+                self.child.kill()
+                self.child.wait(1.0)
+            except Exception as e:
+                CPL.log('Handover.abandon', 'could not reap process %s: %s' % (self.child.pid, e))
+            self.child = None
+
+        text = "hub restart failed, so the old hub is still running: %s" % (why)
+        if self.cmd is not None:
+            self.cmd.fail(qKV('text', text))
+            self.cmd = None
+        else:
+            g.hubcmd.warn(qKV('text', text))
+
+    def handOver(self):
+        """ The new hub is ready: stop, and send it everything. Only returns if the new hub fails. """
+
+        # We might have given up while waiting for the images below.
+        if self.link is None:
+            return
+
+        # Let any images being written finish first.
+        #
+        if g.imageWriter.nQueued > 0:
+            CPL.log('Handover.handOver', 'waiting for %d images to be written' % (g.imageWriter.nQueued))
+            g.poller.callMeIn(self.handOver, 0.1)
+            return
+
+        sock = self.link.detach()
+        self.link = None
+
+        if self.cmd is not None:
+            self.cmd.finish(qKV('text', "handing over to new hub process %d" % (self.child.pid)))
+            self.cmd = None
+
+        try:
+            t0 = time.time()
+            state, socks = self.snapshot()
+            state['snapshotTime'] = t0
+            state['snapshotDuration'] = time.time() - t0
+
+            sock.setblocking(True)
+            sock.settimeout(self.timeout)
+            self._send(sock, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL),
+                       [s.fileno() for s in socks])
+            answer = self._readLine(sock)
+        except Exception as e:
+            CPL.tback('Handover.handOver', e)
+            answer = "no answer (%s)" % (e)
+
+        if answer == 'ok':
+            CPL.log('Handover.handOver', 'process %d has taken over after %0.3fs; exiting.' % \
+                    (self.child.pid, time.time() - t0))
+            os._exit(0)
+
+        sock.close()
+        self.abandon("the new hub could not take over: %s" % (answer))
+
+    def snapshot(self):
+        """ Return the state of the whole hub, and the sockets it refers to by index. """
+
+        socks = []
+        def addSocket(f):
+            socks.append(f)
+            return len(socks) - 1
+
+        listeners = []
+        listenerPorts = {}
+        for name, acceptor in g.acceptors.items():
+            listener = getattr(acceptor, 'listener', None)
+            if listener is None or listener.listenFd is None:
+                continue
+            listeners.append(dict(name=acceptor.name, sock=addSocket(listener.listenFd)))
+            listenerPorts[listener.listenFd.getsockname()[1]] = acceptor.name
+
+        actors = []
+        for name, nub in g.actors.items():
+            if not hasattr(nub, 'handoverState'):
+                continue
+            state = nub.handoverState()
+            state['sock'] = None
+            if isinstance(nub.in_f, socket.socket) and nub.in_f is nub.out_f:
+                state['sock'] = addSocket(nub.in_f)
+            actors.append(state)
+
+        # Commanders can only be rebuilt by the listener which accepted them, which is the one
+        # on the same port.
+        #
+        commanders = []
+        for cmdrID, nub in g.commanders.items():
+            f = nub.in_f
+            if not isinstance(f, socket.socket) or f is not nub.out_f:
+                continue
+            try:
+                listenerName = listenerPorts.get(f.getsockname()[1], None)
+                addr = f.getpeername()
+            except socket.error:
+                continue
+            if listenerName is None:
+                continue
+
+            # Get rid of anything which is waiting on a timer.
+            #
+            nub.conflator.flush()
+            if nub.bootstrap.isActive():
+                nub.bootstrap.cmd.fail(qKV('text', "the hub restarted before all the keys were sent; please ask again"))
+                nub.bootstrap.cancel()
+
+            state = nub.handoverState()
+            state['listener'] = listenerName
+            state['addr'] = addr
+            state['sock'] = addSocket(f)
+            commanders.append(state)
+
+        state = dict(counters=dict(xids=g.xids.id, nubIDs=g.nubIDs.id, hubMIDs=g.hubMIDs.id),
+                     KVs=g.KVs.handoverState(),
+                     perms=g.perms.handoverState(),
+                     listeners=listeners,
+                     actors=actors,
+                     commanders=commanders)
+
+        return state, socks
+
+    def _send(self, sock, data, fds):
+        sock.sendall(struct.pack('!II', len(data), len(fds)))
+        for i in range(0, len(fds), self.maxFdsPerMessage):
+            socket.send_fds(sock, [b'F'], fds[i:i+self.maxFdsPerMessage])
+        sock.sendall(data)
+
+    def _readLine(self, sock):
+        line = b''
+        while not line.endswith(b'\n'):
+            c = sock.recv(1)
+            if not c:
+                raise RuntimeError("connection closed")
+            line += c
+        return line.decode('latin-1').strip()
+
+    # The new hub's side.
+    #
+    def takeOver(self):
+        """ Take over from the old hub which started us. Must be called once the hub is initialized.
+
+        If anything goes wrong, tell the old hub, and exit without touching any connections.
+        """
+
+        fd = int(os.environ.pop(self.envName))
+        sock = socket.socket(fileno=fd)
+        try:
+            sock.settimeout(CPL.cfg.get('hub', 'handoverTimeout', 30.0))
+            sock.sendall(b'ready\n')
+            state, fds = self._receive(sock)
+
+            t0 = time.time()
+            self.restore(state, [socket.socket(fileno=fd) for fd in fds])
+            t1 = time.time()
+            sock.sendall(b'ok\n')
+        except Exception as e:
+            CPL.tback('Handover.takeOver', e)
+            try:
+                sock.sendall(("failed: %s\n" % (e)).encode('latin-1', 'replace'))
+            except Exception:
+                pass
+            os._exit(1)
+        sock.close()
+
+        self.times = (state['snapshotDuration'], t1 - t0, t1 - state['snapshotTime'])
+        CPL.log('Handover.takeOver', 'took over: snapshot=%0.3fs restore=%0.3fs gap=%0.3fs' % self.times)
+        self.genKeys(g.hubcmd)
+
+    def _receive(self, sock):
+        header = self._recvAll(sock, 8)
+        nBytes, nFds = struct.unpack('!II', header)
+        fds = []
+        while len(fds) < nFds:
+            msg, newFds, flags, addr = socket.recv_fds(sock, 1, self.maxFdsPerMessage)
+            if not msg:
+                raise RuntimeError("connection closed after %d of %d sockets" % (len(fds), nFds))
+            fds.extend(newFds)
+        state = pickle.loads(self._recvAll(sock, nBytes))
+
+        return state, fds
+
+    def _recvAll(self, sock, n):
+        chunks = []
+        while n > 0:
+            chunk = sock.recv(min(n, 1 << 20))
+            if not chunk:
+                raise RuntimeError("connection closed")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b''.join(chunks)
+
+    def restore(self, state, socks):
+        """ Rebuild the old hub from its snapshot() and sockets. """
+
+        counters = state['counters']
+        g.xids.id = counters['xids']
+        g.nubIDs.id = counters['nubIDs']
+        g.hubMIDs.id = counters['hubMIDs']
+        g.KVs.restoreHandoverState(state['KVs'])
+        g.perms.restoreHandoverState(state['perms'])
+
+        for l in state['listeners']:
+            self.sockets[('listener', l['name'])] = socks[l['sock']]
+        for a in state['actors']:
+            if a['sock'] is not None:
+                self.sockets[('actor', a['name'])] = socks[a['sock']]
+
+        nListeners = 0
+        for l in state['listeners']:
+            if self._startNub(l['name']):
+                nListeners += 1
+
+        # Actors which cannot be started again are dropped, with their commands.
+        #
+        nActors = nCommands = 0
+        lostCommands = []
+        for a in state['actors']:
+            nub = None
+            if self._startNub(a['name'], hostname=a.get('host', None), port=a.get('port', None)):
+                nub = hub.findActor(a['name'])
+            adopted = a['sock'] is None or ('actor', a['name']) not in self.sockets
+            if nub is None or not adopted:
+                lostCommands.extend([(c, a['name']) for c, ours in a['liveCommands'] if ours])
+                lostCommands.extend([(c, a['name']) for c, doRegister, queueTime in a['cmdQueue']])
+                continue
+            nub.restoreHandoverState(a)
+            nActors += 1
+            nCommands += len(a['liveCommands']) + len(a['cmdQueue'])
+
+        # Rebuild each commander the way its listener would, then make it the old one.
+        # Nobody needs to hear about each one coming back.
+        #
+        nCommanders = 0
+        g.commanders.quiet = True
+        try:
+            for c in state['commanders']:
+                f = socks[c['sock']]
+                socks[c['sock']] = None
+                listener = hub.findAcceptor(c['listener'])
+                if listener is None:
+                    CPL.log('Handover.restore', 'no listener %s for %s' % (c['listener'], c['name']))
+                    f.close()
+                    continue
+                listener.acceptOne(f, c['addr'])
+                nub = None
+                for n in reversed(list(g.commanders.values())):
+                    if n.in_f is f:
+                        nub = n
+                        break
+                if nub is None:
+                    CPL.log('Handover.restore', 'listener %s did not rebuild %s' % (c['listener'], c['name']))
+                    continue
+                hub.dropCommander(nub, doShutdown=False)
+                nub.restoreHandoverState(c)
+                hub.addCommander(nub)
+                nCommanders += 1
+        finally:
+            g.commanders.quiet = False
+
+        # Close whatever nobody claimed, and tell the commanders about commands which were lost.
+        #
+        for key, f in list(self.sockets.items()):
+            CPL.log('Handover.restore', 'closing unclaimed %s socket for %s' % key)
+            f.close()
+        self.sockets = {}
+        for cmdState, actorName in lostCommands:
+            cmd = commandFromHandoverState(cmdState)
+            cmd.fail(qKV('text', "%s could not be reconnected when the hub restarted" % (actorName)),
+                     src='hub')
+
+        self.counts = (nListeners, nActors, nCommanders, nCommands)
+        CPL.log('Handover.restore', 'took over %d listeners, %d actors, %d commanders, %d commands' % self.counts)
+
+    def _startNub(self, name, hostname=None, port=None):
+        """ Start a nub as hub.startNub does. Return whether it worked. """
+
+        try:
+            ok = hub.startNub(name, hostname=hostname, port=port)
+        except Exception as e:
+            CPL.tback('Handover.restore', e)
+            return False
+        return ok is not False
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        if self.times is None:
+            return
+        cmd.inform(kv('handover', ['%0.3f' % (t) for t in self.times] + list(self.counts)))
@@ -4,13 +4,14 @@ from builtins import str
 from builtins import map
 from builtins import range
 from builtins import object
-__all__ = ['KV', 'KVDict',
-           'kvAsASCII']
+__all__ = ['KV', 'KVDict', 'EncodedKVs',
+           'kvAsASCII', 'kvASCIILength']
 
 import collections
 import time
 
 import CPL
+from CPL.codec import escapeEOL
 from Misc.cdict import cdict
 
 """ Rethought a bit.
@@ -21,23 +22,6 @@ from Misc.cdict import cdict
   and also to flush all such keys when the source disconnects.
 """
 
-knownEscapes = { '\r' : '\\r',
-                 '\n' : '\\n' }
-
-def _doEscape(s, escape):
-    """ If it exists in the string s, replace the escape string by an escaped version of itself. """
-
-    if not escape:
-        return s
-    
-    i = s.find(escape)
-    while i >= 0:
-        repl = ''.join([knownEscapes[c] for c in escape])
-        s = s[:i] + repl + s[i+len(escape):]
-        i = s.find(escape)
-
-    return s
-    
 def kvAsASCII(key, val, escape=None):
     """ Return a canonical form of a keyword + value.
     """
@@ -47,10 +31,10 @@ def kvAsASCII(key, val, escape=None):
         return key
 
     if isinstance(val, KV):
-        val = val.val
+        return val.asASCII(escape)
         
     if type(val) not in (list, tuple):
-        return "%s=%s" % (key, _doEscape(val, escape))
+        return "%s=%s" % (key, escapeEOL(val, escape))
         # raise Exception("type(%s) for key(%s) value is not legit: %r" % (type(val), key, val))
 
     # "grammar" misfeature: empty lists show as "key", not as "key="
@@ -62,13 +46,38 @@ def kvAsASCII(key, val, escape=None):
         if v == None:
             values.append('')
         else:
-            values.append(_doEscape(v, escape))
+            values.append(escapeEOL(v, escape))
 
     if values:
         return "%s=%s" % (key, ','.join(values))
     else:
         return str(key)
 
+def kvASCIILength(key, val):
+    """ Return the length of kvAsASCII(key, val), without building the string.
+
+    Escapes are not accounted for, so this can come up a little short for values with embedded EOLs.
+    """
+
+    if val == None:
+        return len(key)
+
+    if isinstance(val, KV):
+        val = val.val
+
+    if type(val) not in (list, tuple):
+        return len(key) + 1 + len(str(val))
+
+    if len(val) == 0:
+        return len(key)
+
+    n = len(key) + len(val)
+    for v in val:
+        if v != None:
+            n += len(str(v))
+
+    return n
+
 class KV(object):
     def __init__(self, key, val, reply):
         """ Create a single key-value variable. The key must be a string,
@@ -79,6 +88,9 @@ class KV(object):
         self.val = val
         self.reply = reply
 
+        # Our kvAsASCII() encodings, built as needed, as { escape : string }
+        self.encoded = None
+
 #    def __str__(self):
 #        return "%s=%s" % (self.key, self.val)
     
@@ -90,6 +102,18 @@ class KV(object):
 
     def valAs(self, converter):
         return converter(self.val)
+
+    def asASCII(self, escape=None):
+        """ Return our canonical ASCII form, as kvAsASCII() would. Only built once per escape. """
+
+        if self.encoded is None:
+            self.encoded = {}
+        try:
+            return self.encoded[escape]
+        except KeyError:
+            s = kvAsASCII(self.key, self.val, escape=escape)
+            self.encoded[escape] = s
+            return s
     
     def __str__(self):
         if self.reply:
@@ -101,6 +125,37 @@ class KV(object):
             
         return "KV(key=%s, val=%s, ctime=%0.4f, cmd=%s)" % (self.key, self.val, t, cmd)
     
+class EncodedKVs(collections.OrderedDict):
+    """ An OrderedDict of values fetched from the KVDict, which also carries the stored KVs.
+
+    It can be passed as a Reply's KVs like any other OrderedDict. The ASCII encoders then
+    just join the KVs' cached encodings, instead of building them afresh. Copies and pickles
+    are plain OrderedDicts.
+    """
+
+    def __init__(self):
+        collections.OrderedDict.__init__(self)
+        self.kvs = {}
+
+    def __reduce__(self):
+        return (collections.OrderedDict, (list(self.items()),))
+
+    def addKV(self, key, kv):
+        self[key] = kv.val
+        self.kvs[key] = kv
+
+    def asASCII(self, escape=None):
+        """ Return the same string that kvAsASCII() would build for each of our keys, joined with '; '. """
+
+        values = []
+        for k, v in self.items():
+            kv = self.kvs.get(k, None)
+            if kv is None or kv.val is not v:
+                values.append(kvAsASCII(k, v, escape=escape))
+            else:
+                values.append(kv.asASCII(escape))
+
+        return "; ".join(values)
         
 class KVDict(CPL.Object):
     """ The main Key=Value dictionary. 
@@ -110,6 +165,32 @@ class KVDict(CPL.Object):
         CPL.Object.__init__(self, **argv)
         self.sources = cdict(dictType=collections.OrderedDict)
 
+        # How many values each source has sent, and how many of those were unchanged,
+        # as { src : [total, unchanged] }
+        self.changeStats = {}
+
+        # Bumped every time a set of values is saved, so that anyone streaming our contents
+        # can say how current they are.
+        self.generation = 0
+
+    def handoverState(self):
+        """ Return our keys and values as plain data, for a new hub process. """
+
+        sources = [(src, [(kv.key, kv.val) for kv in d.values()]) for src, d in self.sources.items()]
+        return dict(sources=sources,
+                    changeStats=dict([(src, list(stats)) for src, stats in self.changeStats.items()]),
+                    generation=self.generation)
+
+    def restoreHandoverState(self, state):
+        """ Take over the old hub process's keys and values. They no longer know their Replys. """
+
+        for src, kvs in state['sources']:
+            d = self.sources[src] = cdict(dictType=collections.OrderedDict)
+            for key, val in kvs:
+                d[key] = KV(key, val, None)
+        self.changeStats = state['changeStats']
+        self.generation = state['generation']
+
     def keyNamesForKVs(self, KVs):
         """ Return the key names for a list of raw KVs. """
 
@@ -125,11 +206,54 @@ class KVDict(CPL.Object):
         if self.debug > 5:
             CPL.log("KVDict.setKV", "src=%r, key=%r, val=%r" % (src, key, val))
             
-        if src not in self.sources:
-            self.sources[src] = cdict(dictType=collections.OrderedDict)
-            
-        self.sources[src][key] = KV(key, val, reply)
+        d = self.sources.get(src, None)
+        if d is None:
+            d = self.sources[src] = cdict(dictType=collections.OrderedDict)
+
+        kv = KV(key, val, reply)
+
+        # Keep the old encodings if the value has not changed, and if the key is still
+        # spelled the same way.
+        #
+        try:
+            oldKey, old = d.fetch(key)
+            if old.encoded is not None and oldKey == key and old.val == val:
+                kv.encoded = old.encoded
+        except KeyError:
+            pass
+        d[key] = kv
         
+    def unchangedKeysFromReply(self, reply, src=None):
+        """ Return the names of the Reply's keys whose values are the same as the ones we hold.
+
+        Must be called before the Reply's KVs are set. Also counts the source's
+        total and unchanged values.
+        """
+
+        if src == None:
+            src = reply.src
+
+        d = self.sources.get(src, None)
+        unchanged = set()
+        if d is not None:
+            for k, v in reply.KVs.items():
+                old = d.get(k, None)
+                if old is not None and old.val == v:
+                    unchanged.add(k)
+
+        stats = self.changeStats.get(src, None)
+        if stats is None:
+            stats = self.changeStats[src] = [0, 0]
+        stats[0] += len(reply.KVs)
+        stats[1] += len(unchanged)
+
+        return unchanged
+
+    def getChangeStats(self, src):
+        """ Return the (total, unchanged) value counts for a source. """
+
+        return tuple(self.changeStats.get(src, (0, 0)))
+
     def setKVsFromReply(self, reply, src=None):
         if src == None:
             src = reply.src
@@ -139,6 +263,7 @@ class KVDict(CPL.Object):
         if self.debug > 7:
             CPL.log("KVDict.setKVs", "src = %r, keys = %r" % (src, KVs))
         
+        self.generation += 1
         for key, val in KVs.items():
             self.setKV(src, key, val, reply)
         
@@ -236,6 +361,39 @@ class KVDict(CPL.Object):
                 
         return vals, unmatched
 
+    def getEncodedValues(self, src, keys):
+        """ Return an EncodedKVs of values for the given list of keys.
+
+        Args:
+           src  - the key source to search.
+           keys - a list of keys to fetch. If empty, fetch all the source's keys.
+
+        Returns:
+           - an EncodedKVs of matched keys and values.
+           - a list of unmatched key names.
+        """
+
+        vals = EncodedKVs()
+
+        d = self.sources.get(src, None)
+        if d == None:
+            return vals, keys
+
+        if not keys:
+            keys = list(d.keys())
+
+        unmatched = []
+        for k in keys:
+            if k == None:
+                continue
+            try:
+                casek, kv = d.fetch(k)
+                vals.addKV(casek, kv)
+            except KeyError as e:
+                unmatched.append(k)
+
+        return vals, unmatched
+
 if __name__ == "__main__":
     d = KVDict()
 #    d.setKV('hub', 'a', 1)
@@ -0,0 +1,718 @@
+from __future__ import print_function
+__all__ = ['WireError', 'WireWriter', 'WireReader', 'WireReply',
+           'isFrameStart', 'frameLength', 'maxFrameLength']
+
+""" The compact binary protocol, which actors and commanders can switch to instead of ASCII lines.
+
+  Every message is a frame: a 4-byte big-endian length, then that many bytes of body. The
+  body starts with a type byte, 'C' for a command or 'R' for a reply. Frames are limited to
+  16MB, so the first byte of a frame is always 0, which no ASCII line starts with: a
+  connection which has switched to frames can still accept the odd ASCII line, and the
+  switch needs no careful synchronization.
+
+  Inside a body, integers are varints (7 bits per byte, least significant first, the top bit
+  set on all but the last byte) and strings are a varint length and that many latin-1 bytes.
+
+    command: 'C' cid mid tgt cmd                  all strings
+    reply:   'R' cid mid src flag nKeys key...    strings, one flag byte, a varint
+    full reply:
+             'F' cmdrName cmdrMid cmdrCid actorName actorMid actorCid src flag nKeys key...
+
+  A full reply carries all of a FullReply's fields, and is encoded once for all its
+  readers: its keywords are always sent by name.
+
+  Each key is a varint keyword reference and the key's value:
+
+    ref  0 - a new keyword, whose name follows as a string. It gets the next id on this
+             connection, starting at 0.
+         1 - a keyword name which follows as a string, and is not remembered.
+         n - keyword id n-2.
+
+  Each side of a connection numbers the keywords it sends itself, so a frequent keyword
+  costs a byte or two after the first time it is sent.
+
+  A value is a shape byte, and then:
+
+    0 - nothing: a valueless keyword.
+    1 - a single typed value.
+    2 - a varint count, then that many typed values.
+    3 - a varint count, a struct code ('q' or 'd'), then that many packed big-endian 64-bit
+        integers or doubles.
+
+  and a typed value is a tag byte, and then:
+
+    'N' - nothing: a missing value, as in "k=1,,3".
+    'i' - a 4-byte signed integer.
+    'q' - an 8-byte signed integer.
+    'd' - an 8-byte double.
+    's' - a string, which is the content of a quoted string value.
+    'w' - a string, which is any other unquoted value.
+
+  The hub keeps keyword values as the raw tokens which the ASCII parser returns, and only
+  sends a number as a number when its token is exactly what str() or repr() make of it:
+  decoding any frame gives back exactly the tokens which were encoded, and a connection's
+  replies mean the same thing whichever protocol they are sent with.
+"""
+
+import collections
+import struct
+
+from CPL.codec import qstr, dequote
+from Parsing.cache import ParseCache
+from .KVDict import KV, kvAsASCII
+
+# Frames are limited so that their first byte is always 0.
+maxFrameLength = (1 << 24) - 1
+
+class WireError(Exception):
+    """ Raised for a frame which cannot be encoded or decoded. """
+    pass
+
+_int32 = struct.Struct('>i')
+_int64 = struct.Struct('>q')
+_double = struct.Struct('>d')
+_length = struct.Struct('>I')
+
+_smallVarints = [bytes((i,)) for i in range(0x80)]
+
+def packVarint(n):
+    if n < 0x80:
+        return _smallVarints[n]
+    parts = bytearray()
+    while n >= 0x80:
+        parts.append((n & 0x7f) | 0x80)
+        n >>= 7
+    parts.append(n)
+    return bytes(parts)
+
+def packStr(s):
+    b = s.encode('latin-1', 'replace')
+    n = len(b)
+    if n < 0x80:
+        return _smallVarints[n] + b
+    return packVarint(n) + b
+
+def unpackVarint(b, i):
+    """ Return the varint at b[i], and the index after it. """
+
+    n = b[i]
+    i += 1
+    if n < 0x80:
+        return n, i
+
+    n &= 0x7f
+    shift = 7
+    while True:
+        c = b[i]
+        i += 1
+        n |= (c & 0x7f) << shift
+        if c < 0x80:
+            return n, i
+        shift += 7
+
+def unpackStr(b, i):
+    """ Return the string at b[i], and the index after it. """
+
+    n = b[i]
+    if n < 0x80:
+        i += 1
+    else:
+        n, i = unpackVarint(b, i)
+    return b[i:i+n].decode('latin-1'), i+n
+
+def packToken(v):
+    """ Return the typed encoding of a single raw token. """
+
+    if v is None:
+        return b'N'
+
+    c = v[:1]
+    if c == '"':
+        s = dequote(v)
+        if qstr(s) == v:
+            return b's' + packStr(s)
+    elif v.isdigit() or (c == '-' and v[1:].isdigit()):
+        try:
+            i = int(v)
+        except ValueError:
+            i = None
+        if str(i) == v:
+            if -0x80000000 <= i <= 0x7fffffff:
+                return b'i' + _int32.pack(i)
+            if -0x8000000000000000 <= i <= 0x7fffffffffffffff:
+                return b'q' + _int64.pack(i)
+    elif c.isdigit() or c == '-':
+        try:
+            f = float(v)
+        except ValueError:
+            pass
+        else:
+            if repr(f) == v:
+                return b'd' + _double.pack(f)
+
+    return b'w' + packStr(v)
+
+_floatTags = set((0x64,))
+_intTags = set((0x69, 0x71))
+
+# The encodings of recently sent and received values, as { value : bytes }. It is simply
+# emptied when it fills up.
+#
+_valueCache = {}
+maxCachedValues = 50000
+
+def _packValue(val):
+    if val is None:
+        return b'\x00'
+    if not isinstance(val, tuple):
+        return b'\x01' + packToken(val)
+
+    # Send all-integer and all-float values as arrays. 0x69, 0x71 and 0x64 are the
+    # 'i', 'q' and 'd' tags.
+    #
+    tokens = [packToken(v) for v in val]
+    if len(tokens) > 1:
+        tags = set([t[0] for t in tokens])
+        if tags == _floatTags:
+            return b'\x03' + packVarint(len(val)) + b'd' + b''.join([t[1:] for t in tokens])
+        if tags <= _intTags:
+            return b'\x03' + packVarint(len(val)) + b'q' + \
+                struct.pack('>%dq' % (len(val)), *[int(v) for v in val])
+    return b'\x02' + packVarint(len(val)) + b''.join(tokens)
+
+def packValue(val):
+    """ Return the encoding of a keyword value: None, a single raw token, or a list or tuple of them.
+
+    Values are only classified and packed the first time they are seen. And values which
+    arrived as frames are sent on in the form they arrived in.
+    """
+
+    try:
+        return _valueCache[val]
+    except KeyError:
+        pass
+    except TypeError:
+        # A list.
+        val = tuple(val)
+        try:
+            return _valueCache[val]
+        except KeyError:
+            pass
+
+    if isinstance(val, KV):
+        return packValue(val.val)
+    if isinstance(val, tuple):
+        if not all([v is None or isinstance(v, str) for v in val]):
+            return packValue(tuple([v if v is None else str(v) for v in val]))
+    elif val is not None and not isinstance(val, str):
+        return packValue(str(val))
+
+    encoded = _packValue(val)
+    if len(_valueCache) >= maxCachedValues:
+        _valueCache.clear()
+    _valueCache[val] = encoded
+    return encoded
+
+def packKeyName(key):
+    """ Return the reference for a keyword which is sent by name, and not numbered. """
+
+    return b'\x01' + packStr(key)
+
+def isFrameStart(buf):
+    """ Does the non-empty buffer start with a frame, rather than with an ASCII line? """
+
+    return buf[0] == 0
+
+def frameLength(buf):
+    """ Return the full length of the frame at the start of buf, or 0 if it is not all there yet. """
+
+    if len(buf) < 4:
+        return 0
+    n = _length.unpack_from(buf, 0)[0]
+    if n > maxFrameLength:
+        raise WireError("frame length %d is too long" % (n))
+    if len(buf) < n + 4:
+        return 0
+    return n + 4
+
+def frame(parts):
+    """ Return the frame for a list of body parts. """
+
+    body = b''.join(parts)
+    if len(body) > maxFrameLength:
+        raise WireError("frame length %d is too long" % (len(body)))
+    return _length.pack(len(body)) + body
+
+class WireReply(dict):
+    """ A decoded reply dictionary, which only builds its ASCII RawText if it is asked for. """
+
+    def __missing__(self, key):
+        if key != 'RawText':
+            raise KeyError(key)
+        KVs = self['KVs']
+        text = "%s %s %s %s" % (self['cid'], self['mid'], self['flag'],
+                                "; ".join([kvAsASCII(k, v) for k, v in KVs.items()]))
+        self['RawText'] = text
+        return text
+
+class WireWriter(object):
+    """ Encode frames for one connection, keeping its keyword dictionary. """
+
+    def __init__(self, maxKeys=10000):
+        """
+        Args:
+           maxKeys   - how many keyword names to number. Any others are always sent in full.
+        """
+
+        self.maxKeys = maxKeys
+
+        # The references to our numbered keywords, as { name : varint-bytes }
+        self.keyRefs = {}
+
+    def packKey(self, key):
+        try:
+            return self.keyRefs[key]
+        except KeyError:
+            pass
+
+        if len(self.keyRefs) < self.maxKeys:
+            self.keyRefs[key] = packVarint(len(self.keyRefs) + 2)
+            return b'\x00' + packStr(key)
+        return b'\x01' + packStr(key)
+
+    def keyNames(self):
+        """ Return our numbered keyword names, in the order of their ids. """
+
+        names = [None] * len(self.keyRefs)
+        for k, ref in self.keyRefs.items():
+            names[unpackVarint(ref, 0)[0] - 2] = k
+        return names
+
+    def setKeyNames(self, names):
+        """ Carry on with the keyword numbering of another writer, from its keyNames(). """
+
+        self.keyRefs = dict([(k, packVarint(i + 2)) for i, k in enumerate(names)])
+
+    def packCommand(self, cid, mid, tgt, cmd):
+        return frame((b'C', packStr(str(cid)), packStr(str(mid)), packStr(str(tgt)), packStr(cmd)))
+
+    def packReply(self, cid, mid, src, flag, KVs):
+        """ Return the frame for a reply.
+
+        Args:
+           cid, mid, src, flag  - the reply's header fields.
+           KVs                  - an OrderedDict of raw keyword values, or None.
+        """
+
+        parts = [b'R', packStr(str(cid)), packStr(str(mid)), packStr(str(src)),
+                 flag.encode('latin-1')]
+        self.packKVs(parts, KVs)
+
+        return frame(parts)
+
+    def packFullReply(self, fields, flag, KVs):
+        """ Return the frame for a full reply. It does not depend on our keyword dictionary.
+
+        Args:
+           fields  - the cmdrName, cmdrMid, cmdrCid, actorName, actorMid, actorCid and src.
+                     They are sent as strings, with None as an empty string.
+           flag    - the reply flag.
+           KVs     - an OrderedDict of raw keyword values, or None.
+        """
+
+        parts = [b'F']
+        for f in fields:
+            parts.append(packStr('' if f is None else str(f)))
+        parts.append(flag.encode('latin-1'))
+        self.packKVs(parts, KVs, byName=True)
+
+        return frame(parts)
+
+    def packKVs(self, parts, KVs, byName=False):
+        """ Append the encoded keywords to the list of frame parts. """
+
+        if not KVs:
+            parts.append(b'\x00')
+            return
+
+        parts.append(packVarint(len(KVs)))
+        packKey = packKeyName if byName else self.packKey
+        for k, v in KVs.items():
+            parts.append(packKey(k))
+            parts.append(packValue(v))
+
+class WireReader(object):
+    """ Decode frames from one connection, keeping its keyword dictionary.
+
+    Actors repeat the same keywords and values over and over, so the decoded keywords are
+    kept in a ParseCache, keyed by their encoded bytes. That is safe because a keyword's id
+    never changes, and a keyword definition is only ever sent once.
+    """
+
+    def __init__(self, name='wire', cacheBytes=200000):
+        """
+        KWArgs:
+           name        - what to call our ParseCache.
+           cacheBytes  - the rough memory limit for our cache of decoded keywords.
+        """
+
+        # The connection's numbered keywords, in order.
+        self.keys = []
+
+        self.cache = ParseCache(self.unpackKVs, name=name, maxBytes=cacheBytes)
+
+    def setKeyNames(self, names):
+        """ Carry on with the numbered keywords of another reader. """
+
+        self.keys = list(names)
+        self.cache.clear()
+
+    def readFrame(self, buf):
+        """ Extract the first complete frame from the bytearray buf.
+
+        Returns:
+          - the frame type ('C' or 'R'), or None if no frame is complete.
+          - the frame body, as bytes.
+
+        Raises WireError for an impossible frame length, after dropping the whole buffer:
+        there is no way of finding the next frame.
+        """
+
+        try:
+            n = frameLength(buf)
+        except WireError:
+            del buf[:]
+            raise
+        if n == 0:
+            return None, None
+        body = bytes(buf[4:n])
+        del buf[:n]
+        if not body:
+            raise WireError("empty frame")
+        return chr(body[0]), body
+
+    def unpackCommand(self, body):
+        """ Return the (cid, mid, tgt, cmd) strings of a command body.
+
+        Like unpackReply(), raises WireError for a body which cannot be decoded.
+        """
+
+        try:
+            cid, i = unpackStr(body, 1)
+            mid, i = unpackStr(body, i)
+            tgt, i = unpackStr(body, i)
+            cmd, i = unpackStr(body, i)
+        except IndexError as e:
+            raise WireError("truncated command: %s" % (e))
+        return cid, mid, tgt, cmd
+
+    def unpackReply(self, body):
+        """ Return a WireReply dictionary for a reply body, with cid, mid, src, flag and KVs entries.
+
+        The KVs are a shared, read-only, FrozenKVs.
+        """
+
+        try:
+            cid, i = unpackStr(body, 1)
+            mid, i = unpackStr(body, i)
+            src, i = unpackStr(body, i)
+            flag = chr(body[i])
+        except IndexError as e:
+            raise WireError("truncated reply header: %s" % (e))
+
+        return WireReply(cid=cid, mid=mid, src=src, flag=flag,
+                         KVs=self.cache.parse(body[i+1:]))
+
+    def unpackFullReply(self, body):
+        """ Return the fields, the flag and the KVs of a full reply body. See WireWriter.packFullReply(). """
+
+        fields = []
+        try:
+            i = 1
+            for f in range(7):
+                s, i = unpackStr(body, i)
+                fields.append(s)
+            flag = chr(body[i])
+        except IndexError as e:
+            raise WireError("truncated full reply: %s" % (e))
+
+        return fields, flag, self.cache.parse(body[i+1:])
+
+    def unpackKVs(self, b):
+        """ Return an OrderedDict of raw values for the encoded keywords in b. """
+
+        keys = self.keys
+        valueCache = _valueCache
+        KVs = collections.OrderedDict()
+        try:
+            nKeys, i = unpackVarint(b, 0)
+            for k in range(nKeys):
+                ref = b[i]
+                if ref < 0x80:
+                    i += 1
+                else:
+                    ref, i = unpackVarint(b, i)
+                if ref >= 2:
+                    key = keys[ref-2]
+                else:
+                    key, i = unpackStr(b, i)
+                    if ref == 0:
+                        keys.append(key)
+
+                start = i
+                shape = b[i]
+                if shape == 1:
+                    val, i = _unpackToken(b, i+1)
+                elif shape == 0:
+                    val = None
+                    i += 1
+                elif shape == 3:
+                    n, i = unpackVarint(b, i+1)
+                    code = b[i]
+                    if code == 0x64:    # 'd'
+                        val = tuple(map(repr, struct.unpack_from('>%dd' % (n), b, i+1)))
+                    elif code == 0x71:  # 'q'
+                        val = tuple(map(str, struct.unpack_from('>%dq' % (n), b, i+1)))
+                    else:
+                        raise WireError("unknown array type %r" % (chr(code)))
+                    i += 1 + 8*n
+                elif shape == 2:
+                    n, i = unpackVarint(b, i+1)
+                    vals = []
+                    for j in range(n):
+                        v, i = _unpackToken(b, i)
+                        vals.append(v)
+                    val = tuple(vals)
+                else:
+                    raise WireError("unknown value shape %d" % (shape))
+                KVs[key] = val
+                if len(valueCache) < maxCachedValues:
+                    valueCache[val] = b[start:i]
+        except (IndexError, struct.error) as e:
+            raise WireError("truncated or corrupt keywords: %s" % (e))
+
+        if i != len(b):
+            raise WireError("%d bytes left over after keywords" % (len(b) - i))
+
+        return KVs
+
+def _unpackToken(b, i):
+    """ Return the raw token for the typed value at b[i], and the index after it. """
+
+    tag = b[i]
+    if tag == 0x64:         # 'd'
+        return repr(_double.unpack_from(b, i+1)[0]), i+9
+    elif tag == 0x69:       # 'i'
+        return str(_int32.unpack_from(b, i+1)[0]), i+5
+    elif tag == 0x77:       # 'w'
+        return unpackStr(b, i+1)
+    elif tag == 0x73:       # 's'
+        s, i = unpackStr(b, i+1)
+        return qstr(s), i
+    elif tag == 0x71:       # 'q'
+        return str(_int64.unpack_from(b, i+1)[0]), i+9
+    elif tag == 0x4e:       # 'N'
+        return None, i+1
+    raise WireError("unknown value tag %r" % (chr(tag)))
+
+#
+# Tests and benchmarks against the ASCII path.
+#
+
+def _randomKVs(rng, n):
+    """ Return an OrderedDict of n keywords with the sorts of raw values which actors send. """
+
+    words = ('OK', 'idle', 'a.b', 'nan', 'inf', '0x1f', 'T', '1e5', '-0', '+3', '007', '1_0', '2.50')
+    strings = ('', 'exposure done', 'quote " in', 'back \\ slash', u'caf\xe9', "it's")
+    def token():
+        c = rng.randint(0, 5)
+        if c == 0:
+            return str(rng.randint(-2**40, 2**40))
+        elif c == 1:
+            return str(rng.randint(-1000, 1000))
+        elif c == 2:
+            return repr(rng.uniform(-1e6, 1e6))
+        elif c == 3:
+            return '%0.3f' % (rng.uniform(-100, 100))
+        elif c == 4:
+            return qstr(rng.choice(strings))
+        return rng.choice(words)
+
+    KVs = collections.OrderedDict()
+    for k in range(n):
+        shape = rng.randint(0, 5)
+        if shape == 0:
+            val = None
+        elif shape == 1:
+            val = token()
+        elif shape == 2:
+            val = tuple([str(rng.randint(0, 2**33)) for j in range(rng.randint(2, 8))])
+        elif shape == 3:
+            val = tuple([repr(rng.uniform(0, 1)) for j in range(rng.randint(2, 8))])
+        elif shape == 4:
+            val = tuple([rng.choice((None, token())) for j in range(rng.randint(0, 4))])
+        else:
+            val = [token(), token()]
+        KVs['key%d' % (rng.randint(0, 40))] = val
+    return KVs
+
+def testWire(n=5000, seed=None):
+    """ Check that frames decode to exactly the tokens which were encoded. """
+
+    import random
+
+    rng = random.Random(seed)
+    writer = WireWriter(maxKeys=20)
+    reader = WireReader()
+    buf = bytearray()
+    sent = []
+    failures = 0
+
+    for i in range(n):
+        KVs = _randomKVs(rng, rng.randint(0, 6))
+        sent.append(('R', ('cid%d' % (i), str(i), 'src', rng.choice(':fiwd>!'), KVs)))
+        buf += writer.packReply(*sent[-1][1])
+        if rng.random() < 0.1:
+            fields = ['tron.me', str(i), '0', 'tcc', str(i + 1), '', 'tcc']
+            sent.append(('F', (fields, rng.choice(':fiw'), _randomKVs(rng, rng.randint(0, 4)))))
+            buf += writer.packFullReply(*sent[-1][1])
+        if rng.random() < 0.2:
+            cmd = ('tron.me', str(i), rng.choice(('', 'actor')), 'expose time=%d "name"' % (i))
+            sent.append(('C', cmd))
+            buf += writer.packCommand(*cmd)
+
+    # Decode the whole stream in ragged pieces.
+    stream = bytearray()
+    got = []
+    while buf or stream:
+        k = rng.randint(1, 300)
+        stream += buf[:k]
+        del buf[:k]
+        while stream:
+            assert isFrameStart(stream)
+            ftype, body = reader.readFrame(stream)
+            if ftype is None:
+                break
+            if ftype == 'C':
+                got.append(('C', reader.unpackCommand(body)))
+            elif ftype == 'F':
+                got.append(('F', reader.unpackFullReply(body)))
+            else:
+                r = reader.unpackReply(body)
+                got.append(('R', (r['cid'], r['mid'], r['src'], r['flag'], r['KVs'])))
+
+    for s, r in zip(sent, got):
+        if s[0] in 'RF':
+            s = (s[0], s[1][:-1] + (collections.OrderedDict([(k, tuple(v) if isinstance(v, list) else v)
+                                                              for k, v in s[1][-1].items()]),))
+        if s != r:
+            failures += 1
+            print("MISMATCH: sent=%r\n          got=%r" % (s, r))
+    if len(sent) != len(got):
+        failures += 1
+        print("MISMATCH: sent %d frames, got %d" % (len(sent), len(got)))
+
+    print("tested %d frames: %d mismatches" % (len(sent), failures))
+    return failures == 0
+
+def benchmark(n=10000, nCmdrs=10):
+    """ Time status replies as ASCII lines and as frames: encoding them, decoding them, and
+    relaying them from an actor to nCmdrs commanders.
+
+    Each is timed for replies whose values repeat and for ones whose values keep changing, and
+    printed per reply, with the frames' times and sizes as fractions of the ASCII lines'. """
+
+    import random
+    import time
+
+    from Parsing import parseASCIIReply
+    from Parsing.keys import kvsCache
+
+    rng = random.Random(1)
+
+    def reply(i, changing):
+        KVs = collections.OrderedDict()
+        x = rng.uniform(0, 360) if changing else 121.5
+        KVs['TCCPos'] = (repr(x), repr(x / 3.0), '45.0')
+        KVs['AxePos'] = (repr(x + 1), repr(x / 7.0), str(i if changing else 1))
+        KVs['ObjInstAng'] = ('%0.6f' % (x), '0.000000', '4915.104')
+        KVs['SecFocus'] = str(i if changing else 1)
+        KVs['TCCStatus'] = ('"TTT"', '"NNN"')
+        KVs['text'] = qstr('slewing to field %d' % (i if changing else 1))
+        return KVs
+
+    # The actor's format, which has no source: that is the only difference from the hub's.
+    def asciiEncode(i, KVs):
+        return "tron.me %d i %s\n" % (i, "; ".join([kvAsASCII(k, v, escape='\n') for k, v in KVs.items()]))
+
+    def asciiDecode(line):
+        return parseASCIIReply(line[:-1], cidFirst=True)
+
+    def wireDecode(reader, stream):
+        ftype, body = reader.readFrame(stream)
+        return reader.unpackReply(body)
+
+    for changing in False, True:
+        what = "changing" if changing else "repeated"
+        replies = [reply(i, changing) for i in range(n)]
+
+        lines = [asciiEncode(i, KVs) for i, KVs in enumerate(replies)]
+        writer = WireWriter()
+        frames = [writer.packReply('tron.me', str(i), 'tcc', 'i', KVs) for i, KVs in enumerate(replies)]
+
+        times = {}
+        for proto in 'ascii', 'wire':
+            _valueCache.clear()
+            kvsCache.clear()
+            t0 = time.time()
+            if proto == 'ascii':
+                for i, KVs in enumerate(replies):
+                    asciiEncode(i, KVs)
+                t1 = time.time()
+                for l in lines:
+                    asciiDecode(l)
+                t2 = time.time()
+            else:
+                writer = WireWriter()
+                for i, KVs in enumerate(replies):
+                    writer.packReply('tron.me', str(i), 'tcc', 'i', KVs)
+                t1 = time.time()
+                reader = WireReader()
+                stream = bytearray(b''.join(frames))
+                while stream:
+                    wireDecode(reader, stream)
+                t2 = time.time()
+
+            # An actor's replies, decoded once and encoded for each commander.
+            #
+            _valueCache.clear()
+            kvsCache.clear()
+            t3 = time.time()
+            if proto == 'ascii':
+                for i, l in enumerate(lines):
+                    r = asciiDecode(l)
+                    for c in range(nCmdrs):
+                        asciiEncode(i, r['KVs'])
+            else:
+                reader = WireReader()
+                writers = [WireWriter() for c in range(nCmdrs)]
+                stream = bytearray(b''.join(frames))
+                for i in range(n):
+                    r = wireDecode(reader, stream)
+                    for w in writers:
+                        w.packReply('tron.me', r['mid'], 'tcc', r['flag'], r['KVs'])
+            t4 = time.time()
+
+            nBytes = sum(map(len, lines if proto == 'ascii' else frames))
+            times[proto] = (t1 - t0, t2 - t1, t4 - t3, nBytes)
+            print("%s replies, %-5s: encode=%6.2fus decode=%6.2fus relay to %d=%7.2fus %6.1f bytes" %
+                  (what, proto, 1e6 * (t1 - t0) / n, 1e6 * (t2 - t1) / n,
+                   nCmdrs, 1e6 * (t4 - t3) / n, nBytes / n))
+
+        ratios = [w / a for w, a in zip(times['wire'], times['ascii'])]
+        print("%s replies, wire/ascii: encode=%5.2f  decode=%5.2f  relay to %d=%5.2f  bytes=%5.2f" %
+              (what, ratios[0], ratios[1], nCmdrs, ratios[2], ratios[3]))
+
+if __name__ == "__main__":
+    testWire()
+    benchmark()
@@ -3,9 +3,12 @@ from builtins import str
 from past.builtins import basestring
 __all__ = ['ActorNub']
 
+import collections
 import re
+import time
 
-from Hub.Command.Command import Command
+from Hub.Command.Command import Command, commandFromHandoverState
+from Hub.Reply.KVBuilder import kv, qKV
 from .CoreNub import CoreNub
 
 import CPL
@@ -25,6 +28,14 @@ class ActorNub(CoreNub):
         replyCallback - func(cmd, reply)
             If set, called with eachreply line _instead of_ the cmd callback.
         logDir     - Log all I/O to the given directory
+        timeout    - if set, fail commands which have not finished after this many seconds.
+        cmdTimeouts - dict of { commandVerb : seconds }, overriding timeout for individual commands.
+        maxInFlight - if set, the most of our commands which the actor is sent at once. Others wait
+            in a queue.
+        urgentCmds - a regexp. Matching commands jump the queue, and are sent at once.
+        coalesceCmds - a regexp of read-only commands. A matching command which is identical to
+            one which is already queued or in flight is not sent; it gets copies of the first
+            one's replies instead. Defaults to safeCmds.
         """
         
         self.cid = None
@@ -53,8 +64,12 @@ class ActorNub(CoreNub):
             self.safeCmds = re.compile(safeCmds)
             CPL.log("ActorNub.init", "added safeCmds %s from %s" % (self.safeCmds, safeCmds))
             
+        self.timeout = argv.get('timeout', None)
+        self.cmdTimeouts = argv.get('cmdTimeouts', None) or {}
+
         # All active commands that we are aware of, either because
         # we sent them, or because the actor replied to it.
+        # Both registries are indexed by .keyForCommand() and .keyForReply()
         #
         self.liveCommands = {}
         
@@ -62,6 +77,39 @@ class ActorNub(CoreNub):
         #
         self.ourCommands = {}
 
+        # CIDs can be any token, so we map them to small integers for the command keys.
+        # Other than our own, they are forgotten once no live command uses them.
+        #
+        self.cidIndexes = {}
+        self.lastCidIndex = 0
+        self.cidUses = {}
+
+        # Commands waiting for a free slot, as (Command, doRegister, queueTime).
+        #
+        self.maxInFlight = argv.get('maxInFlight', None)
+        urgentCmds = argv.get('urgentCmds', None)
+        if urgentCmds:
+            self.urgentCmds = re.compile(urgentCmds)
+        else:
+            self.urgentCmds = None
+        self.cmdQueue = collections.deque()
+
+        # Commands which later identical commands can be attached to, as { normalized text : Command }
+        #
+        coalesceCmds = argv.get('coalesceCmds', None)
+        if coalesceCmds:
+            self.coalesceCmds = re.compile(coalesceCmds)
+        else:
+            self.coalesceCmds = self.safeCmds
+        self.coalescing = {}
+        self.coalescedCmds = 0
+
+        # Some queue stats.
+        self.queuedCmds = 0
+        self.dequeuedCmds = 0
+        self.totalQueueWait = 0.0
+        self.maxQueueWait = 0.0
+
     def __str__(self):
         return "ActorNub(%s, cid=%s, mid=%s)" % (self.ID, self.cid, self.mid)
     
@@ -102,7 +150,103 @@ class ActorNub(CoreNub):
 
         Optional args:
           doRegister - if True (the default), keep track of replies.
+
+        If we have a .maxInFlight window and it is full, or other commands are already waiting,
+        the command is queued. Urgent commands are always sent at once.
+
+        If an identical read-only command is already queued or in flight, the command is
+        attached to that instead.
         """
+
+        if doRegister and self.coalesceCmds is not None and c.cmd is not None \
+               and self.coalesceCmds.search(c.cmd):
+            text = ' '.join(c.cmd.split())
+            leader = self.coalescing.get(text, None)
+            if leader is not None:
+                c.follow(leader)
+                self.coalescedCmds += 1
+                return
+            self.coalescing[text] = c
+
+        if self.maxInFlight and not self.isUrgent(c) \
+               and (self.cmdQueue or len(self.ourCommands) >= self.maxInFlight):
+            self.queueCommand(c, doRegister)
+        else:
+            self.dispatchCommand(c, doRegister)
+
+    def isUrgent(self, c):
+        """ Should the given command jump the queue? """
+
+        return self.urgentCmds is not None and c.cmd is not None \
+               and self.urgentCmds.search(c.cmd) is not None
+
+    def queueCommand(self, c, doRegister):
+        """ Hold a command until there is room for it. """
+
+        self.cmdQueue.append((c, doRegister, time.time()))
+        self.queuedCmds += 1
+        if c.bcastCmdInfo:
+            g.hubcmd.diag(kv('CmdWaiting', (c.xid, CPL.qstr(self.name), len(self.cmdQueue))),
+                          src='cmds')
+
+    def dispatchQueued(self):
+        """ Send as many queued commands as our window allows. """
+
+        while self.cmdQueue and len(self.ourCommands) < self.maxInFlight:
+            c, doRegister, queueTime = self.cmdQueue.popleft()
+            wait = time.time() - queueTime
+            self.dequeuedCmds += 1
+            self.totalQueueWait += wait
+            if wait > self.maxQueueWait:
+                self.maxQueueWait = wait
+            self.dispatchCommand(c, doRegister)
+
+    def dropQueuedCommands(self, cmdrName):
+        """ Forget any queued or coalesced commands from the given commander. """
+
+        cmdQueue = self.cmdQueue
+        self.cmdQueue = collections.deque()
+        for q in cmdQueue:
+            if q[0].cmdrName != cmdrName:
+                self.cmdQueue.append(q)
+            else:
+                self.releaseFollowers(q[0])
+
+        for leader in list(self.coalescing.values()):
+            if leader.followers:
+                leader.followers = [f for f in leader.followers if f.cmdrName != cmdrName]
+
+    def stopCoalescing(self, cmd):
+        """ Do not attach any more commands to the given one. """
+
+        if cmd.cmd is None:
+            return
+        text = ' '.join(cmd.cmd.split())
+        if self.coalescing.get(text, None) is cmd:
+            del self.coalescing[text]
+
+    def releaseFollowers(self, cmd):
+        """ The given command will not be replied to, so send its followers after all. """
+
+        self.stopCoalescing(cmd)
+        followers = cmd.followers
+        cmd.followers = None
+        if followers:
+            for f in followers:
+                self.sendCommand(f)
+
+    def ioshutdown(self, **argv):
+        """ Fail any commands which are still waiting to be sent. """
+
+        cmdQueue = self.cmdQueue
+        self.cmdQueue = collections.deque()
+        for c, doRegister, queueTime in cmdQueue:
+            c.fail(qKV('text', "%s disconnected before the command was sent" % (self.name)),
+                   src='hub')
+        CoreNub.ioshutdown(self, **argv)
+
+    def dispatchCommand(self, c, doRegister=True):
+        """ Actually send a command to the actor. """
         
         # Check whether we can encode the command first:
         #
@@ -155,13 +299,62 @@ class ActorNub(CoreNub):
             cmd = self.getCmdForReply(reply)
             cmd.addReply(reply)
         
+    def cidIndex(self, cid):
+        """ Return the integer standing in for a CID, which may be an int or a string. """
+
+        try:
+            return self.cidIndexes[cid]
+        except KeyError:
+            pass
+
+        cidString = str(cid)
+        idx = self.cidIndexes.get(cidString, None)
+        if idx is None:
+            self.lastCidIndex += 1
+            idx = self.lastCidIndex
+        self.cidIndexes[cid] = self.cidIndexes[cidString] = idx
+
+        return idx
+    
+    def forgetCid(self, cid):
+        """ Forget the index of a CID which no live command uses, e.g. that of a commander which has gone. """
+
+        idx = self.cidIndexes.get(cid, None)
+        if idx is not None and idx not in self.cidUses:
+            self.__releaseCidIndex(idx)
+
+    def __useKey(self, key, n):
+        """ Count a live command key in or out, and forget its CID when nothing uses it. """
+
+        idx = key[0] if isinstance(key, tuple) else key >> 32
+        uses = self.cidUses.get(idx, 0) + n
+        if uses > 0:
+            self.cidUses[idx] = uses
+            return
+        self.cidUses.pop(idx, None)
+        self.__releaseCidIndex(idx)
+
+    def __releaseCidIndex(self, idx):
+        if self.cid is not None and self.cidIndexes.get(self.cid, None) == idx:
+            return
+        for k in [k for k, i in self.cidIndexes.items() if i == idx]:
+            del self.cidIndexes[k]
+
+    def keyFor(self, cid, mid):
+        """ Return the key for a CID and MID: an integer, or a tuple for MIDs which do not fit in 32 bits. """
+
+        mid = int(mid)
+        if 0 <= mid <= 0xffffffff:
+            return (self.cidIndex(cid) << 32) | mid
+        return (self.cidIndex(cid), mid)
+    
     def keyForCommand(self, cmd):
         """ Generate an immutable unique key for this command.
 
         This should perhaps go into the encoder?
         """
 
-        return (str(cmd.actorCid), str(cmd.actorMid))
+        return self.keyFor(cmd.actorCid, cmd.actorMid)
     
     def keyForReply(self, reply):
         """ Extract the key for this reply. Must match what .keyForCommand() is doing.
@@ -169,7 +362,17 @@ class ActorNub(CoreNub):
         This should perhaps go into the decoder?
         """
 
-        return (str(reply['cid']), str(reply['mid']))
+        return self.keyFor(reply['cid'], reply['mid'])
+    
+    def timeoutForCommand(self, cmd):
+        """ Return how long the given command may take, or None. """
+
+        if self.cmdTimeouts and cmd.cmd:
+            words = cmd.cmd.split(None, 1)
+            if words and words[0] in self.cmdTimeouts:
+                return self.cmdTimeouts[words[0]]
+
+        return self.timeout
     
     def __registerCmd(self, cmd, ours):
         """ """
@@ -182,8 +385,30 @@ class ActorNub(CoreNub):
             raise RuntimeError("Duplicate command key for %s: %s" % (self, key))
 
         self.liveCommands[key] = cmd
+        self.__useKey(key, 1)
         if ours:
             self.ourCommands[key] = cmd
+            g.pendingCommands.add(cmd, self, timeout=self.timeoutForCommand(cmd))
+        else:
+            g.pendingCommands.add(cmd, self, external=True)
+
+    def holdsSlot(self, cmd):
+        """ Is the given command taking up one of the places in our .maxInFlight window? """
+
+        return bool(self.maxInFlight) and self.ourCommands.get(self.keyForCommand(cmd), None) is cmd
+
+    def forgetCommand(self, cmd):
+        """ Drop a command from our registries, e.g. when it has timed out. """
+
+        self.stopCoalescing(cmd)
+        key = self.keyForCommand(cmd)
+        if self.liveCommands.get(key, None) is cmd:
+            del self.liveCommands[key]
+            self.__useKey(key, -1)
+        if self.ourCommands.get(key, None) is cmd:
+            del self.ourCommands[key]
+            if self.cmdQueue:
+                self.dispatchQueued()
         
     def __registerOurCmd(self, cmd, doRegister):
         """ We keep a registry of active commands, both ones that we sent and ones that we have detected.
@@ -201,7 +426,7 @@ class ActorNub(CoreNub):
     def __registerExternalCmd(self, cid, mid):
         """ Whenever we see input from a command that we did not send, create a Command to match. """
 
-        key = (str(cid), str(mid))
+        key = self.keyFor(cid, mid)
         cmd = self.liveCommands.get(key)
         if not cmd:
             fullName = ".%s" % (self.name)
@@ -220,18 +445,65 @@ class ActorNub(CoreNub):
         cmd = self.liveCommands.get(key, None)
         if cmd == None and self.replyCallback == None:
             cmd = self.__registerExternalCmd(reply['cid'], reply['mid'])
+        elif cmd is not None and key not in self.ourCommands:
+            g.pendingCommands.touch(cmd)
         
         if self.flagFinishesCommand(reply['flag']):
             if cmd:
                 del self.liveCommands[key]
+                self.__useKey(key, -1)
+                g.pendingCommands.remove(cmd)
+                self.stopCoalescing(cmd)
             
             try:
                 del self.ourCommands[key]
             except:
                 pass
+
+            if self.cmdQueue:
+                self.dispatchQueued()
             
         return cmd
     
+    def handoverState(self):
+        """ Add our command registries to what the new hub process needs. """
+
+        state = CoreNub.handoverState(self)
+        state['cid'] = self.cid
+        state['mid'] = self.mid
+        state['cidIndexes'] = dict(self.cidIndexes)
+        state['lastCidIndex'] = self.lastCidIndex
+        state['liveCommands'] = [(c.handoverState(), key in self.ourCommands)
+                                 for key, c in self.liveCommands.items()]
+        state['cmdQueue'] = [(c.handoverState(), doRegister, queueTime)
+                             for c, doRegister, queueTime in self.cmdQueue]
+        state['coalescing'] = dict([(text, c.xid) for text, c in self.coalescing.items()])
+
+        return state
+
+    def restoreHandoverState(self, state):
+        """ Carry on from the old hub process's handoverState(), including its commands. """
+
+        self.cid = state['cid']
+        self.mid = state['mid']
+        self.cidIndexes = state['cidIndexes']
+        self.lastCidIndex = state['lastCidIndex']
+
+        byXid = {}
+        for cmdState, ours in state['liveCommands']:
+            cmd = commandFromHandoverState(cmdState)
+            byXid[cmd.xid] = cmd
+            self.__registerCmd(cmd, ours)
+        for cmdState, doRegister, queueTime in state['cmdQueue']:
+            cmd = commandFromHandoverState(cmdState)
+            byXid[cmd.xid] = cmd
+            self.cmdQueue.append((cmd, doRegister, queueTime))
+        for text, xid in state['coalescing'].items():
+            if xid in byXid:
+                self.coalescing[text] = byXid[xid]
+
+        CoreNub.restoreHandoverState(self, state)
+
     def tasteReply(self, r):
         assert False, "A reply was sent to an Actor(%s): %s" % (self, r)
 
@@ -242,6 +514,12 @@ class ActorNub(CoreNub):
         CoreNub.statusCmd(self, cmd, doFinish=False)
         self.listCommandsCmd(cmd, doFinish=False)
 
+        # How many of our keyword values were just repeats of what we already had.
+        total, unchanged = g.KVs.getChangeStats(self.name)
+        cmd.inform('actorUnchangedKeys=%s,%d,%d,%0.3f' % \
+                   (CPL.qstr(self.name), total, unchanged,
+                    (float(unchanged) / total) if total else 0.0))
+
         if doFinish:
             cmd.finish()
 
@@ -251,9 +529,21 @@ class ActorNub(CoreNub):
 
         cmd.inform('actorCmds=%s,%d,%d' % \
                    (CPL.qstr(self.name), len(self.liveCommands), len(self.ourCommands)))
+        cmd.inform('actorPendingCmds=%s,%d,%d,%d' % \
+                   ((CPL.qstr(self.name),) + g.pendingCommands.countFor(self)))
+        dispatched = self.dequeuedCmds
+        cmd.inform('actorCoalesced=%s,%d' % (CPL.qstr(self.name), self.coalescedCmds))
+        cmd.inform('actorQueue=%s,%d,%d,%d,%d,%0.3f,%0.3f' % \
+                   (CPL.qstr(self.name), len(self.cmdQueue),
+                    len(self.ourCommands), self.maxInFlight or 0,
+                    self.queuedCmds,
+                    (self.totalQueueWait / dispatched) if dispatched else 0.0,
+                    self.maxQueueWait))
 
         for id, ourCmd in self.ourCommands.items():
             cmd.inform('actorCmd=%s,%s,%s' % \
-                   (CPL.qstr(self.name), CPL.qstr(id), CPL.qstr(ourCmd)))
+                   (CPL.qstr(self.name),
+                    CPL.qstr((str(ourCmd.actorCid), str(ourCmd.actorMid))),
+                    CPL.qstr(ourCmd)))
             
 
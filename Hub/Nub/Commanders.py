@@ -7,6 +7,10 @@ __all__ = ['CommanderNub',
 from .NubAuth import NubAuth
 from .CoreNub import CoreNub
 from Hub.Reply.ReplyTaster import ReplyTaster
+from Hub.Reply.ReplyConflator import ReplyConflator
+from Hub.Reply.ReplyBootstrap import ReplyBootstrap
+from Hub.Reply.Encoders.WireReplyEncoder import WireReplyEncoder
+from Hub.Command.Decoders.WireCmdDecoder import WireCmdDecoder
 import CPL
 
 import g
@@ -21,6 +25,7 @@ class CommanderNub(CoreNub):
         KWArgs:
            isUser    - if True, we should be listed as a logged-in user.
            forceUser - override any automatically derived username.
+           conflate  - an (interval, patterns) pair of keywords to rate-limit.
         """
 
         CoreNub.__init__(self, poller, **argv)
@@ -31,6 +36,18 @@ class CommanderNub(CoreNub):
         self.taster = ReplyTaster(self)
         self.taster.setFilter((), (self.name,), (self.name,))
 
+        # Optionally rate-limit fast keywords.
+        #
+        conflateArgs = {}
+        if argv.get('conflate'):
+            conflateArgs['conflate'] = argv['conflate']
+        self.conflator = ReplyConflator(self, **conflateArgs)
+
+        # Stream the keyword dictionary to us on request.
+        #
+        self.bootstrap = ReplyBootstrap(self,
+                                        chunkSize=CPL.cfg.get('hub', 'bootstrapChunkSize', 100))
+
         self.isUser = argv.get('isUser', False)
 
         if 'forceUser' in argv:
@@ -51,10 +68,84 @@ class CommanderNub(CoreNub):
         self.taster.addToFilter([], [newName], [newName])
         self.setName(newName)
 
+    def useWireCodecs(self):
+        """ Switch to an encoder and decoder which can also speak binary frames. Replies stay
+        ASCII until the encoder is told otherwise. """
+
+        if isinstance(self.encoder, WireReplyEncoder):
+            return
+
+        # The input loop picks up our new decoder, and passes it what has not been decoded yet.
+        #
+        e = self.encoder
+        self.encoder = WireReplyEncoder(EOL=e.EOL, simple=e.simple, noSrc=e.noSrc,
+                                        CIDfirst=e.CIDfirst, debug=e.debug)
+        self.encoder.setNub(e.nubID)
+        self.encoder.setName(e.name)
+
+        d = self.decoder
+        self.decoder = WireCmdDecoder(EOL=d.EOL, needCID=d.needCID, needMID=d.needMID,
+                                      hackEOL=d.hackEOL, debug=d.debug)
+        self.decoder.setNub(d.nubID)
+        self.decoder.setName(d.name)
+        if not d.needMID:
+            self.decoder.mid = d.mid
+
+    def handoverState(self):
+        """ Add what we listen to, and how, to what the new hub process needs. """
+
+        state = CoreNub.handoverState(self)
+        actors, cmdrs, sources = self.taster.listeningTo()
+        state['taster'] = dict(actors=actors, cmdrs=cmdrs, sources=sources,
+                               keys=dict([(a, dict(keys)) for a, keys in self.taster.keys.items()]),
+                               changesOnly=self.taster.changesOnly)
+        state['conflation'] = (self.conflator.interval, list(self.conflator.patterns))
+        state['isUser'] = self.isUser
+        state['mid'] = getattr(self, 'mid', None)
+
+        return state
+
+    def restoreHandoverState(self, state):
+        """ Take over the identity and settings of the same commander in the old hub process.
+
+        We must not be in g.commanders while our ID changes.
+        """
+
+        if state['encoder']['class'] == 'WireReplyEncoder':
+            self.useWireCodecs()
+        self.ID = state['ID']
+        self.encoder.setNub(self.ID)
+        self.decoder.setNub(self.ID)
+
+        # The encoder and decoder can go by other names than ours, and get theirs back below.
+        self.name = state['name']
+
+        taster = state['taster']
+        self.taster.setFilter(taster['actors'], taster['cmdrs'], taster['sources'])
+        self.taster.keys = taster['keys']
+        self.taster.setChangesOnly(taster['changesOnly'])
+
+        interval, patterns = state['conflation']
+        if patterns:
+            self.conflator.setConflation(interval, patterns)
+
+        self.isUser = state['isUser']
+        if state['mid'] is not None:
+            self.mid = state['mid']
+
+        CoreNub.restoreHandoverState(self, state)
+
+    def ioshutdown(self, **argv):
+        self.conflator.cancel()
+        self.bootstrap.cancel()
+        CoreNub.ioshutdown(self, **argv)
+
     def setName(self, newName):
         """ Change our username(s). """
 
+        oldName = self.name
         self.name = newName
+        g.commanders.renamed(self, oldName)
         self.encoder.setName(self.name)
         self.decoder.setName(self.name)
 
@@ -116,10 +207,13 @@ class CommanderNub(CoreNub):
         # whether to include keys.
         #
         if r.bcast or r.cmd.cmdrID == self.ID:
-            er = self.encoder.encode(r, self)
-            self.queueForOutput(er)
-            if self.log:
-                self.log.log(er, note='>')
+            KVs = self.taster.filterKVs(r)
+            if KVs is None:
+                return
+            KVs = self.conflator.conflate(r, KVs)
+            if KVs is None:
+                return
+            self.sendReply(r, KVs)
         else:
             CPL.log("CommanderNub.reply", "not bcast; rID=%s selfID=%s" % (r.cmd.cmdrID, self.ID))
             if r.finishesCommand():
@@ -128,6 +222,14 @@ class CommanderNub(CoreNub):
                 if self.log:
                     self.log.log(er, note='>')
         
+    def sendReply(self, r, KVs):
+        """ Encode and queue a Reply, with the given KVs replacing the Reply's own. """
+
+        er = self.encoder.encode(r, self, KVs=KVs)
+        self.queueForOutput(er)
+        if self.log:
+            self.log.log(er, note='>')
+
     def tasteReply(self, r):
         if self.debug > 3:
             CPL.log('ActorNub.tasteReply', "%s tasting %s" % (self, r))
@@ -147,6 +249,15 @@ class AuthCommanderNub(CommanderNub, NubAuth):
     def __init__(self, poller, **argv):
         CommanderNub.__init__(self, poller, **argv)
         NubAuth.__init__(self, **argv)
+
+    def handoverState(self):
+        state = CommanderNub.handoverState(self)
+        state['auth'] = self.authState()
+        return state
+
+    def restoreHandoverState(self, state):
+        CommanderNub.restoreHandoverState(self, state)
+        self.restoreAuthState(state['auth'])
         
 class StdinNub(CommanderNub):
     def __init__(self, poller, in_f, out_f, **argv):
@@ -84,6 +84,69 @@ class CoreNub(IO.IOHandler):
         else:
             self.ioshutdown(**argv)
 
+    # The encoder and decoder attributes which can change while we are connected.
+    codecAttributes = ('name', 'EOL', 'hackEOL', 'mid', 'binary', 'negotiatingMid')
+
+    def codecState(self, codec):
+        state = dict([(k, getattr(codec, k)) for k in self.codecAttributes if hasattr(codec, k)])
+        state['class'] = codec.__class__.__name__
+
+        # The binary protocol's keywords are numbered once per connection, and the other
+        # end carries on using those numbers.
+        if hasattr(codec, 'writer'):
+            state['writerKeys'] = codec.writer.keyNames()
+        if hasattr(codec, 'reader'):
+            state['readerKeys'] = list(codec.reader.keys)
+        return state
+
+    def restoreCodecState(self, codec, state):
+        """ Carry on from codecState().
+
+        Raises:
+           RuntimeError if the codec cannot carry on with the connection's keyword numbering.
+        """
+
+        if 'writerKeys' in state or 'readerKeys' in state:
+            if codec.__class__.__name__ != state['class']:
+                raise RuntimeError("%s cannot take over the keywords of a %s for %s"
+                                   % (codec.__class__.__name__, state['class'], self.name))
+            if 'writerKeys' in state:
+                codec.writer.setKeyNames(state['writerKeys'])
+            if 'readerKeys' in state:
+                codec.reader.setKeyNames(state['readerKeys'])
+
+        for k in self.codecAttributes:
+            if k not in state or not hasattr(codec, k):
+                continue
+            if k == 'binary' and hasattr(codec, 'setBinary'):
+                codec.setBinary(state[k])
+            else:
+                setattr(codec, k, state[k])
+
+    def handoverState(self):
+        """ Return what a new hub process needs to carry on with our connection, as plain data. """
+
+        return dict(ID=self.ID, name=self.name,
+                    userInfo=self.userInfo,
+                    otherIP=self.otherIP, otherFQDN=self.otherFQDN,
+                    inputBuffer=self.inputBuffer,
+                    outQueue=list(self.outQueue),
+                    encoder=self.codecState(self.encoder),
+                    decoder=self.codecState(self.decoder))
+
+    def restoreHandoverState(self, state):
+        """ Carry on from the handoverState() of the same connection in the old hub process. """
+
+        self.userInfo = state['userInfo']
+        self.otherIP = state['otherIP']
+        self.otherFQDN = state['otherFQDN']
+        self.restoreCodecState(self.encoder, state['encoder'])
+        self.restoreCodecState(self.decoder, state['decoder'])
+
+        self.inputBuffer = state['inputBuffer']
+        for s in state['outQueue']:
+            self.queueForOutput(s)
+
     def flagFinishesCommand(self, f):
         """ Return True if a reply flag completes the command. """
         
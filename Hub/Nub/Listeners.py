@@ -4,6 +4,7 @@ __all__ = ['SocketListener']
 import CPL
 
 import IO
+import g
 import hub
 
 class SocketListener(object):
@@ -17,7 +18,10 @@ class SocketListener(object):
         self.poller = poller
         self.ID = self.name
         self.callback = callback
-        self.listener = IO.PollAccept(poller, host, port, callback=self.acceptOne)    
+
+        # A new hub process takes over the old one's listening socket. See Hub.Handover.
+        sock = g.handover.takeSocket('listener', name)
+        self.listener = IO.PollAccept(poller, host, port, callback=self.acceptOne, sock=sock)
 
     def __del__(self):
         self.listener = None
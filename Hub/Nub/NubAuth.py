@@ -2,7 +2,10 @@ from builtins import map
 from builtins import object
 __all__ = ['NubAuth']
 
+import base64
 import hashlib
+import hmac
+import secrets
 
 import g
 import hub
@@ -23,43 +26,22 @@ class NubAuth(object):
         
         self.state = self.NOT_CONNECTED
         self.nonce = None
-        self.passwords = {}
         
-    def readPasswordFile(self):
-        """ Read the password file into the .passwords dictionary. """
-        
-        try:
-            path = CPL.cfg.get('hub', 'passwordFile')
-            pw_f = open(path, "r")
-        except Exception as e:
-            g.hubcmd.inform('HubError=%s' % (CPL.qstr("Could not read the password file: %s" % e)),
-                            src="hub")
+    def authState(self):
+        """ Return our login state, for a new hub process to carry on with. """
 
-            return "Could not read the password file."
-        
-        passwords = {}
-        for l in pw_f:
-            # Ignore blank lines and comment lines.
-            #
-            l = l.strip()
-            if len(l) == 0 or l[0] == '#':
-                continue
-                
-            try:
-                (program, password) = l.split()
-            except Exception as e:
-                g.hubcmd.inform('HubError=%s' % (CPL.qstr("password file line cannot be parsed: %s" % l)),
-                                src="hub")
+        return dict(state=self.state, nonce=self.nonce,
+                    clientType=getattr(self, 'clientType', None),
+                    clientVersion=getattr(self, 'clientVersion', None),
+                    clientPlatform=getattr(self, 'clientPlatform', None))
+
+    def restoreAuthState(self, state):
+        self.state = state['state']
+        self.nonce = state['nonce']
+        for k in 'clientType', 'clientVersion', 'clientPlatform':
+            if state[k] is not None:
+                setattr(self, k, state[k])
 
-                continue
-            program = program.upper()
-            passwords[program] = password
-        
-        self.passwords = passwords
-        pw_f.close()
-        
-        return True
-    
     def rejectClient(self, cmd, clientType, clientVersion, clientPlatform):
         return False
 
@@ -108,7 +90,9 @@ class NubAuth(object):
         if "program" not in matched or "password" not in matched:
             return "not all arguments to login were found."
         
-        ret = self.readPasswordFile()
+        # The passwords are only reread if the file has changed.
+        #
+        ret = g.passwords.refresh()
         if ret != True:
             return ret
         
@@ -116,14 +100,15 @@ class NubAuth(object):
         #
         program = matched["program"].upper()
 
-        ourPW = self.passwords.get(program, None)
+        ourPW = g.passwords.get(program)
         if ourPW is None:
             return "unknown program"
         
         enc = hashlib.sha1()
         pw = self.nonce + ourPW
         enc.update(pw.encode('latin-1'))
-        if enc.hexdigest() != matched['password']:
+        if not hmac.compare_digest(enc.hexdigest().encode('latin-1'),
+                                   matched['password'].encode('latin-1', 'replace')):
             return "incorrect password"
         
         # Register our IDs. 
@@ -176,17 +161,7 @@ class NubAuth(object):
     def makeMyNonce(self):
         """ Generate an ASCIIfied large random number. Put it in .nonce """
         
-        import base64
-        
-        f = open('/dev/urandom', 'r')
-        bits = f.read(64)
-        s = base64.encodestring(bits)
-        
-        # base64 encoding inserts and appends NLs. Strip these.
-        #
-        self.nonce = s.replace('\n', '')
-
-        f.close()
+        self.nonce = base64.b64encode(secrets.token_bytes(64)).decode('ascii')
         
     def interceptReply(self, reply):
         """ Trap and handle the login/logout commands here. 
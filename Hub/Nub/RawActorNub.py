@@ -8,33 +8,35 @@ import CPL
 import g
 
 class RawActorNub(SocketActorNub, ActorNub):
+    """ An actor which does not identify its replies, and which must therefore only be sent
+    one command at a time. By default, maxInFlight is 1.
+    """
+
+    def __init__(self, poller, host, port, **argv):
+        argv.setdefault('maxInFlight', 1)
+        SocketActorNub.__init__(self, poller, host, port, **argv)
 
     def getCmdForReply(self, r):
-        """ Assign the current (and _only_) command ID to the reply, and set flag appropriately """
+        """ Assign the reply to the current (and _only_) command, and set flag appropriately.
 
-        try:
-            activeMid = self.activeMid
-        except:
-            self.activeMid = activeMid = 1
+        Replies which arrive when no command is active are assigned to MID 0.
+        """
 
-        cmdDone = False
         try:
             replyText = r['RawText']
             if replyText == " OK":
                 CPL.log('rawReply', 'converting reply flag')
                 r['flag'] = ':'
-                cmdDone = True
-                self.activeMid += 1
             else:
                 CPL.log('rawReply', 'not converting reply flag :%s:' % (replyText))
         except Exception as e:
             CPL.log('rawReply', 'ignoring exceptoin: %s' % (e))
-        
+
+        if self.ourCommands:
+            activeMid = next(iter(self.ourCommands.values())).actorMid
+        else:
+            activeMid = 0
+            
         r['cid'] = 0
         r['mid'] = activeMid
-        cmd = ActorNub.getCmdForReply(self, r)
-
-        if cmdDone:
-            self.checkQueue()
-
-        return cmd
+        return ActorNub.getCmdForReply(self, r)
@@ -2,23 +2,139 @@ from __future__ import absolute_import
 __all__ = ['SocketActorNub']
 
 import socket
+import time
 
+import CPL
+import IO
+import g
+from Hub.Reply.KVBuilder import qKV
 from .ActorNub import ActorNub
 
 class SocketActorNub(ActorNub):
     def __init__(self, poller, host, port, **argv):
-        """ 
         """
-        
+        KWArgs:
+           connectTimeout - if set, connect in the background, giving up after this many
+                            seconds. Commands sent before we are connected wait in
+                            the command queue.
+                            Otherwise, connect before returning.
+        """
+
         ActorNub.__init__(self, poller, **argv)
         self.host = host
         self.port = port
-        
+
+        # While we are connecting in the background, the connector and the callbacks
+        # waiting for it.
+        self.connector = None
+        self.connectCallbacks = []
+        self.connectError = None
+
+        # A new hub process carries on with the old one's connection, without sending
+        # the initCmds again. See Hub.Handover.
+        #
+        f = g.handover.takeSocket('actor', self.name)
+        if f is not None:
+            f.setblocking(0)
+            self.setInputFile(f)
+            self.setOutputFile(f)
+            return
+
+        connectTimeout = argv.get('connectTimeout', None)
+        if connectTimeout is not None:
+            self.connector = IO.PollConnect(poller, host, port,
+                                            callback=self.finishConnect,
+                                            timeout=connectTimeout)
+            return
+
         f = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         f.connect((host, port))
         f.setblocking(0)
-        
+
         self.setInputFile(f)
         self.setOutputFile(f)
 
         self.connected()
+
+    def isConnecting(self):
+        return self.connector is not None
+
+    def handoverState(self):
+        state = ActorNub.handoverState(self)
+        state['host'] = self.host
+        state['port'] = self.port
+        return state
+
+    def whenConnected(self, callback):
+        """ Call callback(nub, error) once we have connected or failed to, or now if we already have. """
+
+        if self.connector is None:
+            callback(self, self.connectError)
+        else:
+            self.connectCallbacks.append(callback)
+
+    def dispatchCommand(self, c, doRegister=True):
+        """ Send a command to the actor, or queue it until we are connected. """
+
+        if self.connector is not None:
+            self.queueCommand(c, doRegister)
+            return
+        ActorNub.dispatchCommand(self, c, doRegister=doRegister)
+
+    def dispatchQueued(self):
+        """ Send as many queued commands as our window allows, if we are connected. """
+
+        if self.connector is not None:
+            return
+        if self.maxInFlight:
+            ActorNub.dispatchQueued(self)
+            return
+
+        # Without a window, commands are only ever queued while we are connecting.
+        #
+        while self.cmdQueue:
+            c, doRegister, queueTime = self.cmdQueue.popleft()
+            wait = time.time() - queueTime
+            self.dequeuedCmds += 1
+            self.totalQueueWait += wait
+            if wait > self.maxQueueWait:
+                self.maxQueueWait = wait
+            ActorNub.dispatchCommand(self, c, doRegister=doRegister)
+
+    def finishConnect(self, sock, error):
+        """ PollConnect callback: start talking to the actor, or give up on it. """
+
+        self.connector = None
+        self.connectError = error
+
+        if error:
+            CPL.log("SocketActorNub.finishConnect", "failed to connect %s to %s:%s: %s" % (self.name, self.host, self.port, error))
+            g.hubcmd.warn(qKV('text', "failed to connect to %s at %s:%s: %s" % (self.name, self.host, self.port, error)))
+        else:
+            self.setInputFile(sock)
+            self.setOutputFile(sock)
+            self.connected()
+            self.dispatchQueued()
+
+        callbacks = self.connectCallbacks
+        self.connectCallbacks = []
+        for callback in callbacks:
+            try:
+                callback(self, error)
+            except Exception as e:
+                CPL.tback("SocketActorNub.connectCallback", e)
+
+        if error:
+            self.shutdown(why=error)
+
+    def ioshutdown(self, **argv):
+        if self.connector is not None:
+            connector = self.connector
+            self.connector = None
+            self.connectError = argv.get('why', 'shut down')
+            connector.shutdown()
+            callbacks = self.connectCallbacks
+            self.connectCallbacks = []
+            for callback in callbacks:
+                callback(self, self.connectError)
+        ActorNub.ioshutdown(self, **argv)
@@ -1,18 +1,17 @@
 from __future__ import absolute_import
-from builtins import range
 __all__ = ['BinaryReplyDecoder']
 
 import collections
-import os
 import re
 import struct
-import tempfile
-import pixel16
+
+import numpy as np
 
 import g
 import CPL
 from Parsing import *
 
+from Hub.Reply.KVBuilder import kv
 from .ReplyDecoder import ReplyDecoder
 
 class BinaryReplyDecoder(ReplyDecoder):
@@ -28,7 +27,16 @@ class BinaryReplyDecoder(ReplyDecoder):
         # Where do we save scratch data.
         #
         self.scratchDir = scratchDir
-        self.imageBuf = None
+
+        # The FITSWriter which saves our images. If None, use the hub's.
+        self.writer = argv.get('writer', None)
+
+        # Decoded replies, in order, waiting for any image replies ahead of them to be
+        # saved; the ids of the image replies still being saved; and whether we have
+        # stopped reading from our actor while the writer catches up.
+        self.held = collections.deque()
+        self.unsaved = set()
+        self.paused = False
 
         # Whether to byte-swap or sign-flip the data.
         self.doByteSwapFirst = argv.get('byteSwapFirst', False)
@@ -36,63 +44,160 @@ class BinaryReplyDecoder(ReplyDecoder):
         self.doSignFlip = argv.get('signFlip', False)
         self.BZERO = argv.get('BZERO', 0.0)
         
-    def saveImageData(self, image, xpix, ypix, bitpix):
-        """ Save image data to a scratch FITS file, register and return the file name. """
-
-        f, fname = tempfile.mkstemp('.fits', "%s-" % (self.nubID), self.scratchDir)
-
-        # Create a minimal header.
-        hdr = []
-        fmt = "%-08s=%21s / %-47s"
-        hdr.append(fmt % ('SIMPLE', 'T', ''))
-        hdr.append(fmt % ('BITPIX', repr(bitpix), 'Number of bits/data pixel'))
-        hdr.append(fmt % ('NAXIS', '2', 'An image'))
-        hdr.append(fmt % ('NAXIS1', repr(xpix), 'The number of columns'))
-        hdr.append(fmt % ('NAXIS2', repr(ypix), 'The number of rows'))
-
-        if self.BZERO != 0.0:
-            hdr.append(fmt % ('BSCALE', 1.0, ''))
-            hdr.append(fmt % ('BZERO', repr(self.BZERO), ''))
-            
-        hdr.append('%-80s' % ('END'))
-        
-        hdr_s = ''.join(hdr)
-        remain = len(hdr_s) % 2880
-        os.write(f, hdr_s + ' ' * (2880 - remain))
+    def fiddleImageData(self, image, bitpix):
+        """ Byte-swap and/or sign-flip image data in place, as configured.
+
+        Args:
+           image    - a writable buffer holding the pixels, in the sender's byte order.
+           bitpix   - the FITS BITPIX of the pixels. Sign-flipping is only done for integers.
+        """
+
+        if not (self.doByteSwapFirst or self.doSignFlip or self.doByteSwapLast):
+            return
+
+        # Work on the pixels as native unsigned integers, which is what the old C pixel16
+        # routines did for 16-bit data.
+        #
+        itemSize = abs(bitpix) // 8
+        pixels = np.frombuffer(image, dtype='u%d' % (itemSize), count=len(image) // itemSize)
 
-        # Possibly fiddle the data bits.
         if self.doByteSwapFirst:
             CPL.log("Binary.saveImage", "byteswap first")
-            pixel16.byteswap(image)
+            pixels.byteswap(inplace=True)
         if self.doSignFlip:
-            CPL.log("Binary.saveImage", "signflip")
-            pixel16.uflip(image)
+            if bitpix > 0:
+                CPL.log("Binary.saveImage", "signflip")
+                pixels ^= pixels.dtype.type(1 << (8 * itemSize - 1))
+            else:
+                CPL.log("Binary.saveImage", "not signflipping floating point (BITPIX=%d) data" % (bitpix))
         if self.doByteSwapLast:
             CPL.log("Binary.saveImage", "byteswap last")
-            pixel16.byteswap(image)
+            pixels.byteswap(inplace=True)
 
-        written = os.write(f, image)
-        assert (written == len(image)), "SHORT WRITE ON IMAGE DATA: written=%d len(image)=%d" % (written, len(image))
-        
-        # Pad data to FITS 2880-byte block.
-        remain = len(image) % 2880
+    def saveImageData(self, d, image, xpix, ypix, bitpix):
+        """ Start saving an image to a scratch FITS file, and hold back the reply for it until
+        the file has been written.
+
+        Args:
+           d        - the reply dictionary. Its scratchFile value is filled in when we are done.
+           image    - a writable buffer holding the pixels, which we give to the writer.
+           xpix, ypix, bitpix - the image geometry.
+        """
+
+        writer = self.writer if self.writer is not None else g.imageWriter
 
-        if remain > 0:
-            CPL.log("Binary.saveImage", "padding %d-byte data with %d null bytes" % (len(image), 2880-remain))
-            os.write(f, '\000' * (2880 - remain))
-                 
-        os.close(f)
+        self.unsaved.add(id(d))
+        writer.write(image, xpix, ypix, bitpix,
+                     lambda fname, error: self.imageSaved(d, fname, error),
+                     BZERO=self.BZERO, fiddle=self.fiddleImageData,
+                     scratchDir=self.scratchDir, prefix="%s-" % (self.nubID))
+
+        # If the disks are not keeping up, stop reading from the actor until they do.
+        #
+        if writer.isFull():
+            self.pauseInput(writer)
+
+    def imageSaved(self, d, fname, error):
+        """ FITSWriter callback: fill in and release the reply for a saved image. """
+
+        self.unsaved.discard(id(d))
+        KVs = d['KVs']
+        if error is None:
+            KVs['scratchFile'] = fname
+
+            # Register the filename. We probably eventually want to register the data, but this is safer.
+            #
+            g.KVs.setKV('images', '%sFile' % (self.nubID), fname, None)
+        else:
+            del KVs['scratchFile']
+            d['flag'] = 'w'
+            KVs['text'] = CPL.qstr("could not save image: %s" % (error))
 
-        # Register the filename. We probably eventually want to register the data, but this is safer.
+        # Have our nub pick up any replies which were waiting for this one.
         #
-        g.KVs.setKV('images', '%sFile' % (self.nubID), fname, None)
+        nub = self.getNub()
+        if nub is not None:
+            nub.copeWithInput(None)
 
-        return fname
+    def getNub(self):
+        """ Return the ActorNub we decode for, or None if it has gone away. """
+
+        nub = g.actors.get(self.nubID, None)
+        if nub is None or nub.decoder is not self:
+            return None
+        return nub
+
+    def pauseInput(self, writer):
+        """ Stop reading from our actor until the writer has room again. """
+
+        nub = self.getNub()
+        if nub is None or self.paused:
+            return
+
+        CPL.log("Binary.pauseInput", "pausing input from %s until %d images are saved" % (self.nubID, writer.nQueued))
+        self.paused = True
+        nub.poller.removeInput(nub)
+        writer.waitForRoom(self.resumeInput)
+
+    def resumeInput(self):
+        """ Start reading from our actor again, and decode whatever we had buffered. """
+
+        self.paused = False
+        nub = self.getNub()
+        if nub is None:
+            return
+
+        CPL.log("Binary.resumeInput", "resuming input from %s" % (self.nubID))
+        if nub.in_fd is not None:
+            nub.poller.addInput(nub)
+        nub.copeWithInput(None)
+
+    def checksum(self, buf, start, end):
+        """ Return the 1-byte XOR of buf[start:end], without copying it. """
+
+        if end <= start:
+            return 0
+        return int(np.bitwise_xor.reduce(np.frombuffer(buf, dtype=np.uint8,
+                                                        count=end - start, offset=start)))
 
     def decode(self, buf, newData):
+        """ Return the next complete reply, in order.
 
+        Returns:
+          - a reply dictionary, or None if there is no reply ready yet.
+          - the buffer, with any decoded packets removed.
+
+        The input is kept in a bytearray, which is grown and consumed in place. Images
+        can arrive as many megabytes of small reads, and neither appending to nor
+        unpacking from the buffer copies what is already there.
+
+        Image replies are only returned once the image has been saved, and the replies
+        which follow them are held back until then.
+        """
+
+        if not isinstance(buf, bytearray):
+            buf = bytearray(buf.encode('latin-1') if isinstance(buf, str) else buf)
         if newData:
-            buf += newData
+            buf += newData.encode('latin-1') if isinstance(newData, str) else newData
+
+        while True:
+            if self.held and id(self.held[0]) not in self.unsaved:
+                return self.held.popleft(), buf
+            if self.paused:
+                return None, buf
+
+            d, buf = self.decodePacket(buf)
+            if d is None:
+                return None, buf
+            self.held.append(d)
+
+    def decodePacket(self, buf):
+        """ Find and extract a single complete packet from the bytearray buf.
+
+        Returns:
+          - a reply dictionary, or None if buf does not hold a complete packet.
+          - the buffer, with the packet removed.
+        """
         
         # The binary protocol encapsulates each message in a 10-byte header and a 2-byte trailer:
         #
@@ -126,7 +231,7 @@ class BinaryReplyDecoder(ReplyDecoder):
         # Examine first part, especially the length
         #
         dummy, is_file, length, cid, mid = \
-               struct.unpack('>BBihh', buf[:10])
+               struct.unpack_from('>BBihh', buf, 0)
         if dummy != 1:
             # Complain, but don't fail.
             CPL.log('Hub.decap', 'dummy=%d is_file=%d length=%d mid=%d cid=%d' % \
@@ -150,22 +255,20 @@ class BinaryReplyDecoder(ReplyDecoder):
             headerLength = 10
 
         if is_file:
-            xpix, ypix, bitpix = struct.unpack('>hhh', buf[10:16])
-        msg = buf[headerLength:fullLength - 2]
+            xpix, ypix, bitpix = struct.unpack_from('>hhh', buf, 10)
+            msg = None
+        else:
+            msg = buf[headerLength:fullLength - 2].decode('latin-1')
 
         # Trailer parts.
-        csum, trailer = struct.unpack('>BB', buf[fullLength-2:fullLength])
+        csum, trailer = struct.unpack_from('>BB', buf, fullLength - 2)
 
-        # Calculate & check checksum of message body.
-        #   Because images come through here, we need to C this. -- CPL
+        # Calculate & check checksum of everything between the header and the trailer.
         #
-        my_csum = 0
-        if not is_file:
-            for i in range(10, fullLength - 10 + 1):
-                my_csum ^= ord(buf[i])
-            if my_csum != csum:
-                CPL.log('Hub.decap', 'csum(%d) != calculated csum(%d)' %
-                        (csum, my_csum))
+        my_csum = self.checksum(buf, 10, fullLength - 2)
+        if my_csum != csum:
+            CPL.log('Hub.decap', 'csum(%d) != calculated csum(%d)' %
+                    (csum, my_csum))
 
         # Magic trailer value. I don't know what this means, but ctrl-d can be Unix EOF.    
         #
@@ -174,7 +277,14 @@ class BinaryReplyDecoder(ReplyDecoder):
             CPL.log('Hub.decap', "mid=%d cid=%d len=%d msg='%s'" \
                     % (mid, cid, length, msg))
 
-        buf = buf[fullLength:]
+        if is_file:
+            # The buffer starts with this packet. Hand all of it over to the image writer,
+            # and carry on with a copy of whatever follows the packet.
+            #
+            image = memoryview(buf)[headerLength:fullLength - 2]
+            buf = buf[fullLength:]
+        else:
+            del buf[:fullLength]
         
         if self.debug >= 7:
             CPL.log("Binary.decap", "csum=%d match=%s trailer=%d left=%d (%r) msg=(%r)" %\
@@ -190,13 +300,9 @@ class BinaryReplyDecoder(ReplyDecoder):
         if is_file:
             d['flag'] = 'i'
             d['rest'] = ''
-            KVs = collections.OrderedDict()
-            KVs['xpix'] = xpix
-            KVs['ypix'] = ypix
-            KVs['bitpix'] = bitpix
-            KVs['scratchFile'] = self.saveImageData(msg, xpix, ypix, bitpix)
+            d['KVs'] = kv('xpix', xpix).add('ypix', ypix).add('bitpix', bitpix).add('scratchFile')
 
-            d['KVs'] = KVs
+            self.saveImageData(d, image, xpix, ypix, bitpix)
         else:
             match = self.msg_re.match(msg)
             if match == None:
@@ -225,5 +331,3 @@ class BinaryReplyDecoder(ReplyDecoder):
             d['KVs'] = KVs
 
         return d, buf
-    
-
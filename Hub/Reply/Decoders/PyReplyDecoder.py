@@ -7,27 +7,71 @@ import pickle
 
 import CPL
 import g
+from Hub.KV.WireFormat import WireReader, WireError
+from Hub.Reply.FullReply import FullReply
 from .ReplyDecoder import ReplyDecoder
 
 class PyReplyDecoder(ReplyDecoder):
-    """ Encode Replys as single-line pickled python objects.
+    """ Decode the FullReplys sent by a PyReplyEncoder.
+
+    By default, we read full reply frames, which only ever produce FullReplys of strings.
+    With pickle=True we unpickle .EOL-terminated replies instead, which must only be used
+    for trusted peers.
     """
 
     def __init__(self, **argv):
         ReplyDecoder.__init__(self, **argv)
-        
-        # How do we terminate encoded lines?
+
+        # How do we terminate pickled replies?
         #
         self.EOL = argv.get('EOL', '\f')
-
+        self.usePickle = argv.get('pickle', False)
+        self.reader = WireReader(name='fullReplies')
 
     def decode(self, buf, newData):
-        """ Find and extract a single complete command in the inputBuffer.
+        """ Find and extract a single complete reply in the input buffer.
+
+        Returns:
+          - a FullReply, or None if no complete reply was found.
+          - the unconsumed part of the buffer.
         """
 
+        if self.usePickle:
+            return self.decodePickle(buf, newData)
+
+        if not isinstance(buf, bytearray):
+            buf = bytearray(buf.encode('latin-1') if isinstance(buf, str) else buf)
+        if newData:
+            buf += newData.encode('latin-1') if isinstance(newData, str) else newData
+
+        while buf:
+            try:
+                ftype, body = self.reader.readFrame(buf)
+                if ftype is None:
+                    return None, buf
+                if ftype != 'F':
+                    raise WireError("unexpected %r frame" % (ftype))
+                fields, flag, KVs = self.reader.unpackFullReply(body)
+            except WireError as e:
+                # Skip the frame. Or the whole buffer, if we cannot even find the frame.
+                CPL.log("PyReply.decoder", "bad frame from %s: %s" % (self.name, e))
+                continue
+
+            r = FullReply()
+            r.initFromFields(fields, flag, KVs)
+            if self.debug > 5:
+                CPL.log('PyReply.decoder', "extracted %s" % (r))
+
+            return r, buf
+
+        return None, buf
+
+    def decodePickle(self, buf, newData):
+        """ Find and extract a single complete pickled reply in the input buffer. """
+
         if newData:
             buf += newData
-        
+
         if self.debug > 3:
             CPL.log('PyReply.decoder', "called with EOL=%r and buf=%r" % (self.EOL, buf))
 
@@ -47,11 +91,11 @@ class PyReplyDecoder(ReplyDecoder):
         # Make sure to consume unparseable junk up to the next EOL.
         #
         try:
-            r = pickle.loads(replyString)
-        except SyntaxError as e:
-            CPL.log("PyReply.decoder", "Failed to unpickle %r" % (replyString))
+            r = pickle.loads(replyString.encode('latin-1'))
+        except Exception as e:
+            CPL.log("PyReply.decoder", "Failed to unpickle %r: %s" % (replyString, e))
             return None, buf
-        
+
         if self.debug > 5:
             CPL.log('PyReply.decoder', "extracted %r, returning %r" % (r, buf))
 
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+__all__ = ['WireReplyDecoder']
+
+import collections
+
+import CPL
+from Hub.KV.WireFormat import WireReader, WireError
+from .ASCIIReplyDecoder import ASCIIReplyDecoder
+
+class WireReplyDecoder(ASCIIReplyDecoder):
+    """ Decode replies sent either as binary frames (see Hub/KV/WireFormat.py) or as ASCII lines.
+
+    Frames always start with a 0 byte, so each reply can be recognized for what it is, and
+    ASCII lines are handled with all the ASCIIReplyDecoder options.
+
+    KWArgs:
+       encoder   - the nub's WireCmdEncoder, which switches to frames when the actor says it can.
+    """
+
+    def __init__(self, **argv):
+        ASCIIReplyDecoder.__init__(self, **argv)
+
+        self.encoder = argv.get('encoder', None)
+        self.reader = WireReader(name='wireReplies')
+
+    def decode(self, buf, newData):
+        """ Find and extract a single complete reply in the buf.
+
+        Returns:
+          - a reply dictionary. None if no complete reply is in buf.
+          - the content of buf with the first complete reply removed.
+
+        The buffer is kept as a bytearray. A frame which cannot be decoded is returned as a
+        warning, in the same form as parseASCIIReply() uses for junk.
+        """
+
+        if not isinstance(buf, bytearray):
+            buf = bytearray(buf.encode('latin-1') if isinstance(buf, str) else buf)
+        if newData:
+            buf += newData.encode('latin-1') if isinstance(newData, str) else newData
+
+        while buf:
+            if buf[0] == 0:
+                try:
+                    ftype, body = self.reader.readFrame(buf)
+                    if ftype is None:
+                        return None, buf
+                    if ftype != 'R':
+                        raise WireError("unexpected %r frame" % (ftype))
+                    r = self.reader.unpackReply(body)
+                except WireError as e:
+                    CPL.log("WireReplyDecoder", "bad frame from %s: %s" % (self.nubID, e))
+                    r = self.badFrame(e)
+            else:
+                EOL = self.EOL.encode('latin-1')
+                eol = buf.find(EOL)
+                if eol == -1:
+                    return None, buf
+                line = buf[:eol + len(EOL)].decode('latin-1')
+                del buf[:eol + len(EOL)]
+
+                r, leftover = ASCIIReplyDecoder.decode(self, line, None)
+                if r is None:
+                    continue
+
+            if self.encoder is not None and self.encoder.negotiatingMid is not None:
+                self.encoder.checkReply(r)
+
+            return r, buf
+
+        return None, buf
+
+    def badFrame(self, e):
+        """ Return a warning reply for an undecodable frame. """
+
+        KVs = collections.OrderedDict()
+        KVs['UNPARSEDTEXT'] = [CPL.qstr("bad frame: %s" % (e))]
+
+        return {'mid' : 0,
+                'cid' : 0,
+                'flag' : 'w',
+                'RawText' : "bad frame: %s" % (e),
+                'KVs' : KVs}
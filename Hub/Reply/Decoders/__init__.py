@@ -3,6 +3,7 @@ from .ReplyDecoder import ReplyDecoder
 from .ASCIIReplyDecoder import ASCIIReplyDecoder
 from .RawReplyDecoder import RawReplyDecoder
 from .PyReplyDecoder import PyReplyDecoder
+from .WireReplyDecoder import WireReplyDecoder
 
 #from BinaryReplyDecoder import *
 
@@ -5,7 +5,7 @@ __all__ = ['ASCIIReplyEncoder']
 import re
 
 import CPL
-from Hub.KV.KVDict import kvAsASCII
+from Hub.KV.KVDict import kvAsASCII, EncodedKVs
 from .ReplyEncoder import ReplyEncoder
 
 class ASCIIReplyEncoder(ReplyEncoder):
@@ -32,11 +32,13 @@ class ASCIIReplyEncoder(ReplyEncoder):
         
         self.CIDfirst = argv.get('CIDfirst', False)
 
-    def encodeSimple(self, r, nub, noKeys=False):
+    def encodeSimple(self, r, nub, noKeys=False, KVs=None):
         """ Encode a reply for a given nub.
         
         The simple encoding returns the minimum that a selfish ICC needs to know about --
         whether the reply is to one of its commands, and if so which one.
+
+        If KVs is set, it replaces the Reply's own KVs.
         """
 
         cmd = r.cmd
@@ -60,7 +62,7 @@ class ASCIIReplyEncoder(ReplyEncoder):
         if noKeys:
             keys = ''
         else:
-            keys = self.encodeKeys(r.src, r.KVs)
+            keys = self.encodeKeys(r.src, r.KVs if KVs is None else KVs)
             
         if self.noSrc:
             return "%s %s %s%s" % (id_s, \
@@ -69,10 +71,11 @@ class ASCIIReplyEncoder(ReplyEncoder):
             return "%s %s %s %s%s" % (id_s, \
                                       r.src, r.flag, keys, self.EOL)
 
-    def encodeFull(self, r, nub, noKeys=False):
+    def encodeFull(self, r, nub, noKeys=False, KVs=None):
         """ Encode a reply for a given nub.
         
         Encode all the information required to track the source of the command and the reply.
+        If KVs is set, it replaces the Reply's own KVs.
         """
 
         cmd = r.cmd
@@ -80,7 +83,7 @@ class ASCIIReplyEncoder(ReplyEncoder):
         if noKeys:
             keys = ''
         else:
-            keys = self.encodeKeys(r.src, r.KVs)
+            keys = self.encodeKeys(r.src, r.KVs if KVs is None else KVs)
             
         return "%s %s %s %s %s %s %s %s %s%s" % (cmd.cmdrName, cmd.cmdrMid, cmd.cmdrCid, 
                                                  cmd.actorName, cmd.actorMid, cmd.actorCid,
@@ -101,6 +104,8 @@ class ASCIIReplyEncoder(ReplyEncoder):
             CPL.log("ASCIIReplyEnc.encode", "encoding %r" % (KVs,))
         if KVs == None:
             return ""
+        if isinstance(KVs, EncodedKVs):
+            return KVs.asASCII(escape=self.EOL)
         
         keylist = []
         for k, v in KVs.items():
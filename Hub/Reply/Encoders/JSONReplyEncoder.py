@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+__all__ = ['JSONReplyEncoder', 'jsonValue']
+
+import json
+import math
+
+import CPL
+from CPL.codec import qstr, dequote
+from Hub.KV.KVDict import KV
+from .ReplyEncoder import ReplyEncoder
+
+class JSONReplyEncoder(ReplyEncoder):
+    """ Encode Replys as single-line JSON objects, for clients which would rather not parse our ASCII.
+
+    Each line is an object with all the information required to track the command and the reply:
+
+        {"commander":"TUI.me","cid":"TUI.me","mid":12,"actor":"tcc","src":"tcc","flag":":",
+         "keywords":{"TCCPos":[10.5,-3.25,45],"TCCStatus":["TTT","NNN"],"Slewing":[]}}
+
+    Each keyword value is a list, empty for a valueless keyword. Numbers are sent as JSON
+    numbers, quoted strings as their unquoted content, and anything else (including the
+    empty value in "k=1,,3") as the string it arrived as.
+
+    The line does not depend on the commander, so it is built once per Reply and shared by
+    every JSON commander which gets the unfiltered keywords.
+    """
+
+    def __init__(self, **argv):
+        ReplyEncoder.__init__(self, **argv)
+
+        # How do we terminate encoded lines?
+        #
+        self.EOL = argv.get('EOL', '\n')
+
+    def encode(self, r, nub, noKeys=False, KVs=None):
+        """ Encode a reply for a given nub. If KVs is set, it replaces the Reply's own KVs. """
+
+        # Only the Reply's own encoding is shared: commanders which filter keys get their own.
+        #
+        shared = KVs is None or KVs is r.KVs
+        if shared:
+            fmt = 'json-nokeys' if noKeys else 'json'
+            if r.encoded is None:
+                r.encoded = {}
+            else:
+                try:
+                    return r.encoded[fmt]
+                except KeyError:
+                    pass
+
+        cmd = r.cmd
+        if noKeys:
+            KVs = None
+        elif KVs is None:
+            KVs = r.KVs
+
+        d = dict(commander=cmd.cmdrName,
+                 cid=cmd.cmdrCid,
+                 mid=jsonID(cmd.cmdrMid),
+                 actor=cmd.actorName,
+                 src=r.src,
+                 flag=r.flag,
+                 keywords=self.encodeKeys(KVs))
+        e = (_encoder.encode(d) + self.EOL).encode('latin-1')
+
+        if self.debug > 5:
+            CPL.log('JSONReplyEncoder.encode', 'encoding %s as %r' % (r, e))
+
+        if shared:
+            r.encoded[fmt] = e
+        return e
+
+    def encodeKeys(self, KVs):
+        """ Return a dictionary of lists of typed values for the given KVs. """
+
+        if not KVs:
+            return {}
+
+        return dict([(k, jsonValue(v)) for k, v in KVs.items()])
+
+# ensure_ascii keeps the lines plain ASCII, whatever the keyword strings contain.
+#
+_encoder = json.JSONEncoder(ensure_ascii=True, check_circular=False,
+                            separators=(',', ':'))
+
+def jsonID(mid):
+    """ Return an integer MID as a JSON number, and anything else as it is. """
+
+    if isinstance(mid, str) and mid.isdigit():
+        return int(mid)
+    return mid
+
+def jsonToken(v):
+    """ Return the JSON value for a single raw token.
+
+    As with the wire format, a token only becomes a number if it is exactly what str() or
+    repr() would make of that number, and a quoted string is only unquoted if qstr() would
+    quote it back the same way.
+    """
+
+    if v is None:
+        return None
+
+    c = v[:1]
+    if c == '"':
+        s = dequote(v)
+        if qstr(s) == v:
+            return s
+    elif v.isdigit() or (c == '-' and v[1:].isdigit()):
+        try:
+            i = int(v)
+        except ValueError:
+            i = None
+        if str(i) == v:
+            return i
+    elif c.isdigit() or c == '-':
+        try:
+            f = float(v)
+        except ValueError:
+            pass
+        else:
+            if repr(f) == v and math.isfinite(f):
+                return f
+
+    return v
+
+# The JSON values of recently sent keyword values, as { value : list }. It is simply
+# emptied when it fills up. The lists are only ever read.
+#
+_valueCache = {}
+maxCachedValues = 50000
+
+def jsonValue(val):
+    """ Return the list of JSON values for a keyword value: None, a single raw token, or a list or tuple of them. """
+
+    try:
+        return _valueCache[val]
+    except KeyError:
+        pass
+    except TypeError:
+        # A list.
+        val = tuple(val)
+        try:
+            return _valueCache[val]
+        except KeyError:
+            pass
+
+    if isinstance(val, KV):
+        return jsonValue(val.val)
+
+    if val is None:
+        values = []
+    elif isinstance(val, tuple):
+        values = [jsonToken(v if v is None else str(v)) for v in val]
+    else:
+        values = [jsonToken(str(val))]
+
+    if len(_valueCache) >= maxCachedValues:
+        _valueCache.clear()
+    _valueCache[val] = values
+    return values
+
+if __name__ == "__main__":
+    import Parsing
+
+    tests = (('TCCPos=10.5,-3.25,45', [10.5, -3.25, 45]),
+             ('Slewing', []),
+             ('text="oh, \\"no\\"; really"', ['oh, "no"; really']),
+             ('k=1,,3', [1, '', 3]),
+             ('k=1.50,01,abc', ['1.50', '01', 'abc']),
+             ('k=-inf,nan,1e3', ['-inf', 'nan', '1e3']),
+             ('k=\'single\'', ["'single'"]))
+
+    for s, expected in tests:
+        parsed = Parsing.parseKVs(s)
+        for k, v in parsed.items():
+            if isinstance(v, list):
+                v = tuple(v)
+            got = jsonValue(v)
+            print("%s: %r -> %s" % ("OK" if got == expected else "MISMATCH", s, _encoder.encode(got)))
@@ -2,38 +2,87 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 __all__ = ['PyReplyEncoder']
-           
+
 import pickle
 
 import CPL
+from Hub.KV.WireFormat import WireWriter
 from Hub.Reply.FullReply import FullReply
 from .ReplyEncoder import ReplyEncoder
 
 class PyReplyEncoder(ReplyEncoder):
-    """ Encode Replys as single-line pickled python objects.
+    """ Encode Replys as FullReplys, for python clients.
+
+    By default, each FullReply is sent as a full reply frame of the wire format (see
+    Hub/KV/WireFormat.py): a fixed set of length-prefixed fields, which can be decoded safely
+    and without scanning. The frame does not depend on the commander, so it is only built
+    once per Reply, and shared.
+
+    With pickle=True, FullReplys are pickled and terminated with .EOL, as they used to be.
+    That is only for existing clients: the pickles can contain the EOL, and unpickling
+    is not safe for untrusted input.
     """
-    
+
     def __init__(self, **argv):
         ReplyEncoder.__init__(self, **argv)
-        
-        # How do we terminate encoded lines?
+
+        # How do we terminate pickled replies?
         #
         self.EOL = argv.get('EOL', '\f')
+        self.usePickle = argv.get('pickle', False)
+        self.writer = WireWriter(maxKeys=0)
         self.encode = self.encodeFull
 
-    def encodeFull(self, r, nub, noKeys=False):
+    def encodeFull(self, r, nub, noKeys=False, KVs=None):
         """ Encode a reply for a given nub.
-        
+
         Encode all the information required to track the source of the command and the reply.
+        If KVs is set, it replaces the Reply's own KVs.
         """
 
+        if self.usePickle:
+            return self.encodePickle(r, noKeys, KVs)
+
+        # Only the Reply's own encoding is shared: commanders which filter keys get their own.
+        #
+        shared = KVs is None or KVs is r.KVs
+        if shared:
+            fmt = 'full-nokeys' if noKeys else 'full'
+            if r.encoded is None:
+                r.encoded = {}
+            else:
+                try:
+                    return r.encoded[fmt]
+                except KeyError:
+                    pass
+
         fullReply = FullReply()
         fullReply.initFromReply(r, noKeys)
+        if KVs is not None and not noKeys:
+            fullReply.KVs = KVs
+        e = self.writer.packFullReply(fullReply.fields(), fullReply.flag, fullReply.KVs)
+
+        if self.debug > 6:
+            CPL.log('PyEncode.encode', 'encoding FullReply %s as %r' % (fullReply, e))
+        elif self.debug > 3:
+            CPL.log('PyEncode.encode', 'encoding FullReply %s' % (fullReply,))
+
+        if shared:
+            r.encoded[fmt] = e
+        return e
+
+    def encodePickle(self, r, noKeys, KVs):
+        """ Encode a reply as a pickled FullReply, terminated by .EOL. """
+
+        fullReply = FullReply()
+        fullReply.initFromReply(r, noKeys)
+        if KVs is not None and not noKeys:
+            fullReply.KVs = KVs
         fullPickle = pickle.dumps(fullReply)
 
         if self.debug > 6:
             CPL.log('PyEncode.encode', 'encoding FullReply %s as %r' % (fullReply, fullPickle))
         elif self.debug > 3:
             CPL.log('PyEncode.encode', 'encoding FullReply %s' % (fullReply,))
-        
-        return "%s%s" % (fullPickle, self.EOL)
+
+        return fullPickle + self.EOL.encode('latin-1')
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 __all__ = ['RawReplyEncoder']
            
 import CPL
-from Hub.KV.KVDict import kvAsASCII
+from Hub.KV.KVDict import kvAsASCII, EncodedKVs
 from .ReplyEncoder import ReplyEncoder
 from .ASCIIReplyEncoder import ASCIIReplyEncoder
 from Parsing.dequote import dequote
@@ -23,15 +23,18 @@ class RawReplyEncoder(ReplyEncoder):
         self.EOL = argv.get('EOL', '\n')
         self.keyName = argv.get('keyName', None)
         
-    def encode(self, r, nub, noKeys=False):
-        """ Encode a protocol-free reply for a given nub.  """
+    def encode(self, r, nub, noKeys=False, KVs=None):
+        """ Encode a protocol-free reply for a given nub. If KVs is set, it replaces the Reply's own KVs. """
 
+        if KVs is None:
+            KVs = r.KVs
+            
         if self.keyName:
-            rawVal = r.KVs.get(self.keyName, '')
+            rawVal = KVs.get(self.keyName, '')
             val = dequote(rawVal)
             CPL.log('RAWDEQUOTE', "rawVal=%r val=%r" % (rawVal, val))
         else:
-            val = self.encodeKeys(r.src, r.KVs)
+            val = self.encodeKeys(r.src, KVs)
             
         if val:
             return "%s%s" % (val, self.EOL)
@@ -52,6 +55,8 @@ class RawReplyEncoder(ReplyEncoder):
             CPL.log("ASCIIReplyEnc.encode", "encoding %r" % (KVs,))
         if KVs == None:
             return ""
+        if isinstance(KVs, EncodedKVs):
+            return KVs.asASCII()
         
         keylist = []
         for k, v in KVs.items():
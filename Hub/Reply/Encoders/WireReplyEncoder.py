@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+__all__ = ['WireReplyEncoder']
+
+from Hub.KV.WireFormat import WireWriter
+from .ASCIIReplyEncoder import ASCIIReplyEncoder
+
+class WireReplyEncoder(ASCIIReplyEncoder):
+    """ Encode Replys as binary frames (see Hub/KV/WireFormat.py), or as ASCII lines.
+
+    We start out encoding ASCII lines, with all the ASCIIReplyEncoder options, until
+    .setBinary() is called. Frames always carry the simple encoding's information.
+    """
+
+    def __init__(self, **argv):
+        ASCIIReplyEncoder.__init__(self, **argv)
+
+        self.writer = WireWriter()
+        self.encodeASCII = self.encode
+        self.setBinary(argv.get('binary', False))
+
+    def setBinary(self, binary):
+        """ Switch between frames and ASCII lines. """
+
+        self.binary = binary
+        if binary:
+            self.encode = self.encodeWire
+        else:
+            self.encode = self.encodeASCII
+
+    def encodeWire(self, r, nub, noKeys=False, KVs=None):
+        """ Encode a reply for a given nub. If KVs is set, it replaces the Reply's own KVs. """
+
+        cmd = r.cmd
+        cid = cmd.cmdrCid
+
+        # See ASCIIReplyEncoder.encodeSimple()
+        #
+        if cid == '0' and self.nubID != cmd.cmdrName:
+            cid = cmd.cmdrName
+
+        if noKeys:
+            KVs = None
+        elif KVs is None:
+            KVs = r.KVs
+
+        return self.writer.packReply(cid, cmd.cmdrMid,
+                                     '' if self.noSrc else r.src,
+                                     r.flag, KVs)
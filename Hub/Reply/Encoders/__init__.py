@@ -3,3 +3,5 @@ from .ReplyEncoder import *
 from .PyReplyEncoder import *
 from .ASCIIReplyEncoder import *
 from .RawReplyEncoder import *
+from .WireReplyEncoder import *
+from .JSONReplyEncoder import *
@@ -0,0 +1,235 @@
+__all__ = ['FITSWriter']
+
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import CPL
+
+class FITSWriter(CPL.Object):
+    """ Save images to scratch FITS files from a small pool of threads, off the poll loop.
+
+        Each image is optionally fiddled with in place, and written with its cached header
+        into a preallocated file. The completion callback is then called from the poll
+        loop, so it is free to set keywords and send replies.
+
+        The writes release the GIL, which copying into an mmap-ed file does not: that way
+        the poll loop is not held up by the writers.
+
+        The queue is not bounded as such: the caller already holds the pixels. But .isFull()
+        says when enough images are waiting that the caller should stop reading more, and
+        .waitForRoom() arranges to be told when it can start again.
+    """
+
+    def __init__(self, poller, **argv):
+        """
+        Args:
+           poller     - the PollHandler whose loop completion callbacks are called from.
+
+        KWArgs:
+           nThreads   - how many writer threads to run.
+           maxQueued  - how many images can be waiting or in progress before .isFull().
+        """
+
+        CPL.Object.__init__(self, **argv)
+
+        self.poller = poller
+        self.nThreads = argv.get('nThreads', 2)
+        self.maxQueued = argv.get('maxQueued', 4)
+
+        self.jobs = queue.Queue()
+        self.threads = []
+
+        # The FITS headers we have already built, as { (xpix, ypix, bitpix, BZERO) : header }
+        self.headers = {}
+
+        # Callbacks waiting for the queue to drain below .maxQueued.
+        self.waiters = []
+
+        # Some stats. Only changed from the poll loop.
+        self.nQueued = 0
+        self.written = 0
+        self.failed = 0
+        self.bytesWritten = 0
+        self.totalWriteTime = 0.0
+
+    def start(self):
+        """ Start our threads, and make sure that the poll loop wakes up for our callbacks. """
+
+        if self.threads:
+            return
+
+        if self.poller.loopback is None:
+            self.poller.startLoopback()
+
+        for i in range(self.nThreads):
+            t = threading.Thread(target=self._run, name="FITSWriter-%d" % (i))
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def isFull(self):
+        return self.nQueued >= self.maxQueued
+
+    def waitForRoom(self, callback):
+        """ Call callback() from the poll loop once we are no longer full. """
+
+        if not self.isFull():
+            callback()
+        elif callback not in self.waiters:
+            self.waiters.append(callback)
+
+    def header(self, xpix, ypix, bitpix, BZERO=0.0):
+        """ Return the padded FITS header for an image geometry, building it only once. """
+
+        key = (xpix, ypix, bitpix, BZERO)
+        hdr = self.headers.get(key, None)
+        if hdr is not None:
+            return hdr
+
+        # Create a minimal header.
+        hdr = []
+        fmt = "%-08s=%21s / %-47s"
+        hdr.append(fmt % ('SIMPLE', 'T', ''))
+        hdr.append(fmt % ('BITPIX', repr(bitpix), 'Number of bits/data pixel'))
+        hdr.append(fmt % ('NAXIS', '2', 'An image'))
+        hdr.append(fmt % ('NAXIS1', repr(xpix), 'The number of columns'))
+        hdr.append(fmt % ('NAXIS2', repr(ypix), 'The number of rows'))
+
+        if BZERO != 0.0:
+            hdr.append(fmt % ('BSCALE', 1.0, ''))
+            hdr.append(fmt % ('BZERO', repr(BZERO), ''))
+
+        hdr.append('%-80s' % ('END'))
+
+        hdr_s = ''.join(hdr)
+        remain = len(hdr_s) % 2880
+        hdr = (hdr_s + ' ' * (2880 - remain)).encode('latin-1')
+
+        self.headers[key] = hdr
+        return hdr
+
+    def write(self, image, xpix, ypix, bitpix, callback, **argv):
+        """ Queue an image to be saved. Must be called from the poll loop.
+
+        Args:
+           image     - a writable buffer holding the pixels, which we own from now on.
+           xpix, ypix, bitpix - the image geometry.
+           callback  - called as callback(filename, error) from the poll loop when we are
+                       done. One of filename and error is None.
+
+        KWArgs:
+           BZERO       - the FITS BZERO to declare.
+           fiddle      - if set, called as fiddle(image, bitpix) from a writer thread
+                         before the image is written.
+           scratchDir  - the directory to create the file in.
+           prefix      - the start of the file name.
+        """
+
+        self.start()
+
+        job = dict(image=image, nBytes=memoryview(image).nbytes,
+                   header=self.header(xpix, ypix, bitpix, argv.get('BZERO', 0.0)),
+                   bitpix=bitpix, callback=callback,
+                   fiddle=argv.get('fiddle', None),
+                   scratchDir=argv.get('scratchDir', None),
+                   prefix=argv.get('prefix', 'image-'))
+        self.nQueued += 1
+        self.jobs.put(job)
+
+    def _run(self):
+        """ Writer thread: save images forever. """
+
+        while True:
+            job = self.jobs.get()
+            t0 = time.time()
+            fname = error = None
+            try:
+                fname = self.saveImage(job)
+            except Exception as e:
+                CPL.tback("FITSWriter.saveImage", e)
+                error = str(e)
+            dt = time.time() - t0
+
+            self.poller.callMeIn(lambda job=job, fname=fname, error=error, dt=dt:
+                                     self._finished(job, fname, error, dt), 0.0)
+
+    def saveImage(self, job):
+        """ Write a single image to a new scratch file, and return the file name. """
+
+        header = job['header']
+        image = memoryview(job['image']).cast('B')
+
+        # Pad data to FITS 2880-byte block. Extending the file zero-fills it.
+        remain = len(image) % 2880
+        fileSize = len(header) + len(image) + (2880 - remain if remain else 0)
+
+        if job['fiddle']:
+            job['fiddle'](image, job['bitpix'])
+
+        f, fname = tempfile.mkstemp('.fits', job['prefix'], job['scratchDir'])
+        try:
+            try:
+                os.posix_fallocate(f, 0, fileSize)
+            except (AttributeError, OSError):
+                os.ftruncate(f, fileSize)
+
+            self._pwriteAll(f, header, 0)
+            self._pwriteAll(f, image, len(header))
+        except:
+            os.close(f)
+            os.remove(fname)
+            raise
+
+        os.close(f)
+        return fname
+
+    def _pwriteAll(self, f, data, offset):
+        """ Write all of data to the file descriptor f at offset.
+
+        pwrite() can return early on large writes, so keep going from where it stopped.
+        Raises IOError if it stops altogether.
+        """
+
+        data = memoryview(data)
+        written = 0
+        while written < len(data):
+            n = os.pwrite(f, data[written:], offset + written)
+            if n <= 0:
+                raise IOError("short write on image data: wrote %d of %d bytes" % (written, len(data)))
+            written += n
+
+    def _finished(self, job, fname, error, dt):
+        """ Poll loop callback for a completed job. """
+
+        self.nQueued -= 1
+        if error is None:
+            self.written += 1
+            self.bytesWritten += job['nBytes']
+            self.totalWriteTime += dt
+        else:
+            self.failed += 1
+
+        try:
+            job['callback'](fname, error)
+        except Exception as e:
+            CPL.tback("FITSWriter.callback", e)
+
+        # Let anyone who was waiting for room start up again.
+        while self.waiters and not self.isFull():
+            callback = self.waiters.pop(0)
+            try:
+                callback()
+            except Exception as e:
+                CPL.tback("FITSWriter.waiter", e)
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        cmd.inform("imageWriter=%d,%d,%d,%d,%d,%d,%0.3f" % (self.nQueued, self.maxQueued,
+                                                             len(self.threads),
+                                                             self.written, self.failed,
+                                                             self.bytesWritten,
+                                                             (self.totalWriteTime / self.written) if self.written else 0.0))
@@ -46,5 +46,21 @@ class FullReply(object):
             self.KVs = collections.OrderedDict()
         else:
             self.KVs = r.KVs
+
+    def fields(self):
+        """ Return our tracking fields, in the order the wire format sends them. """
+
+        return (self.cmdrName, self.cmdrMid, self.cmdrCid,
+                self.actorName, self.actorMid, self.actorCid,
+                self.src)
+
+    def initFromFields(self, fields, flag, KVs):
+        """ Fill ourselves in from the fields, flag and KVs of a decoded full reply frame. """
+
+        self.cmdrName, self.cmdrMid, self.cmdrCid, \
+            self.actorName, self.actorMid, self.actorCid, \
+            self.src = fields
+        self.flag = flag
+        self.KVs = KVs
         
         
@@ -0,0 +1,83 @@
+__all__ = ['KVs', 'kv', 'qKV']
+
+import collections
+
+import CPL
+
+class KVs(collections.OrderedDict):
+    """ Build a Reply's keywords directly, instead of formatting a string for Reply to parse.
+
+    The values are the same raw tokens that parsing the equivalent "key=v1,v2" string would
+    give: qstr()-ed strings keep their quotes, a single value is not wrapped in a tuple, and a
+    keyword with no value is None. So
+
+        cmd.inform(KVs().add('CmdDone', xid).addQuoted('flag', ':'))
+
+    is what cmd.inform('CmdDone=%d; flag=%s' % (xid, CPL.qstr(':'))) produces, but without
+    the round trip through the parser.
+    """
+
+    def add(self, key, value=None, quote=False):
+        """ Add a keyword, and return ourselves so that calls can be chained.
+
+        Args:
+           key    - the keyword name.
+           value  - None for a valueless keyword, a list or tuple of values, or a single value.
+                    Values are converted with str(), and an empty list gives the same
+                    empty value as "key=".
+           quote  - if True, qstr() each value.
+        """
+
+        if value is None:
+            pass
+        elif isinstance(value, (list, tuple)):
+            if quote:
+                values = tuple([CPL.qstr(v) for v in value])
+            else:
+                values = tuple([str(v) for v in value])
+            value = values[0] if len(values) == 1 else values
+        elif quote:
+            value = CPL.qstr(value)
+        elif not isinstance(value, str):
+            value = str(value)
+
+        self[key] = value
+        return self
+
+    def addQuoted(self, key, value):
+        """ Add a keyword with qstr()-ed values. """
+
+        return self.add(key, value, quote=True)
+
+def kv(key, value=None, quote=False):
+    """ Return a new KVs holding a single keyword. See KVs.add(). """
+
+    return KVs().add(key, value, quote=quote)
+
+def qKV(key, value):
+    """ Return a new KVs holding a single keyword with qstr()-ed values, e.g. qKV('text', msg). """
+
+    return KVs().add(key, value, quote=True)
+
+if __name__ == "__main__":
+    import Parsing
+
+    # Check that we build what the parser would have made of the formatted strings.
+    names = ['a.b', 'c "d"', 'e\\f']
+    tests = ((kv('Actors', [CPL.qstr(n) for n in names]), 'Actors=%s' % (','.join([CPL.qstr(n) for n in names]))),
+             (kv('Actors', names, quote=True), 'Actors=%s' % (','.join([CPL.qstr(n) for n in names]))),
+             (kv('Actors', names[:1], quote=True), 'Actors=%s' % (CPL.qstr(names[0]))),
+             (kv('Actors', [], quote=True), 'Actors='),
+             (kv('users'), 'users'),
+             (kv('CmdDone', 12).addQuoted('flag', ':'), 'CmdDone=12; flag=%s' % (CPL.qstr(':'))),
+             (qKV('text', 'oh, "no"; really'), 'text=%s' % (CPL.qstr('oh, "no"; really'))),
+             (kv('pos', [1, 2.5, '%0.2f' % 3.0]), 'pos=1,2.5,3.00'))
+
+    for built, s in tests:
+        parsed = Parsing.parseKVs(s)
+        for k in parsed:
+            if isinstance(parsed[k], list):
+                parsed[k] = tuple(parsed[k])
+        print("%s: %r" % ("OK" if built == parsed else "MISMATCH", s))
+        if built != parsed:
+            print("    built=%r\n    parsed=%r" % (built, parsed))
@@ -15,7 +15,14 @@ import Parsing
        - flag, actorCid, actorMid, src, KVs
 """
 
-class Reply(CPL.Object):
+class Reply(object):
+    """ A single response to a Command.
+
+    Lots of Replys get created, so we use __slots__, and do not subclass CPL.Object, whose
+    __del__ gets in the way of the garbage collector.
+    """
+
+    __slots__ = ('debug', 'ctime', 'cmd', 'flag', 'bcast', 'KVs', 'src', 'unchangedKeys', 'encoded')
     
     def __init__(self, cmd, flag, KVs, bcast=True, **argv):
         """ Create a parsed Reply.
@@ -27,7 +34,7 @@ class Reply(CPL.Object):
                   latter are parsed into OrderedDicts.
         """
 
-        CPL.Object.__init__(self, **argv)
+        self.debug = argv.get('debug', 0)
         
         self.ctime = time.time()
         self.cmd = cmd
@@ -41,6 +48,14 @@ class Reply(CPL.Object):
                 
         self.src = argv.get('src', cmd.actorName)
 
+        # The names of any keys whose values were already known. Filled in when the Reply is
+        # registered.
+        self.unchangedKeys = ()
+
+        # Encodings which do not depend on the commander, shared by all the encoders which
+        # use them, as { format : encoding }. Created when first needed.
+        self.encoded = None
+
     def finishesCommand(self):
         """ Return true if the given flag finishes a command. """
 
@@ -59,7 +74,7 @@ class Reply(CPL.Object):
         """
         
         if isinstance(kvl, str):
-            return Parsing.parseKVs(kvl)
+            return Parsing.kvsCache.parse(kvl)
 
         od = collections.OrderedDict()
         if kvl is not None:
@@ -0,0 +1,148 @@
+__all__ = ['ReplyBootstrap']
+
+import collections
+
+import CPL
+import g
+from .Reply import Reply
+
+class ReplyBootstrap(CPL.Object):
+    """ Stream the current contents of the keyword dictionary to a single commander.
+
+        The keywords are sent as ordinary Replys to the commander's own command, in chunks
+        of pre-encoded values, with the commander's ReplyTaster deciding which sources and
+        keys are wanted. Between chunks we go back to the poller, so that other connections
+        are not stalled while a large dictionary goes out.
+
+        The command gets a bootstrapStart=gen,nSources keyword before the first chunk and
+        a bootstrapDone=gen,nKeys,nReplies keyword after the last one. gen is the KVDict
+        generation at the time the keyword was sent: values sent before bootstrapDone are
+        no older than that generation, and everything after it is a live update.
+    """
+
+    def __init__(self, cmdr, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        self.cmdr = cmdr
+
+        # How many keys to send in each chunk, and how long to wait for the commander's
+        # output queue to drain before sending the next one.
+        self.chunkSize = argv.get('chunkSize', 100)
+        self.maxQueued = argv.get('maxQueued', 50)
+        self.drainDelay = argv.get('drainDelay', 0.05)
+
+        self.cmd = None
+        self.timer = None
+
+        # The remaining work, as a deque of (src, [keyName, ...])
+        self.todo = collections.deque()
+
+        # Some stats, for the current or last bootstrap.
+        self.nKeys = 0
+        self.nReplies = 0
+        self.nBootstraps = 0
+
+    def __str__(self):
+        return "ReplyBootstrap(cmdr=%s, cmd=%s, todo=%d)" % (self.cmdr.name, self.cmd, len(self.todo))
+
+    def isActive(self):
+        return self.cmd is not None
+
+    def start(self, cmd, sources=None):
+        """ Start streaming keywords to our commander. Finishes cmd when done.
+
+        Args:
+           cmd      - the commander's Command to reply to.
+           sources  - the key sources to send. If None or empty, all known sources. Either
+                      way, only the sources and keys which our commander's ReplyTaster
+                      accepts are sent.
+
+        Any bootstrap already in progress is abandoned, and its command failed.
+        """
+
+        if self.cmd is not None:
+            oldCmd = self.cmd
+            self.cancel()
+            oldCmd.fail('text="bootstrap superseded by a newer one"', bcast=False)
+
+        taster = self.cmdr.taster
+        if not sources:
+            sources = g.KVs.getSources()
+        sources = [src for src in sources if taster.wantsSource(src)]
+
+        # Only snapshot the key names: the values are fetched when each chunk is sent.
+        #
+        self.todo.clear()
+        for src in sources:
+            d = g.KVs.sources.get(src, None)
+            if d is None:
+                continue
+            keys = taster.filterKeyNames(src, list(d.keys()))
+            for i in range(0, len(keys), self.chunkSize):
+                self.todo.append((src, keys[i:i + self.chunkSize]))
+
+        self.cmd = cmd
+        self.nKeys = 0
+        self.nReplies = 0
+        self.nBootstraps += 1
+
+        cmd.inform('bootstrapStart=%d,%d' % (g.KVs.generation, len(sources)), bcast=False)
+        self._scheduleChunk(0.0)
+
+    def cancel(self):
+        """ Abandon any bootstrap in progress, without finishing its command. """
+
+        if self.timer is not None:
+            self.cmdr.poller.removeTimer(self.timer)
+            self.timer = None
+        self.todo.clear()
+        self.cmd = None
+
+    def _scheduleChunk(self, delay):
+        self.timer = self.cmdr.makeTimer(delay, self._chunkTimer, None)
+        self.cmdr.addTimer(self.timer)
+
+    def _chunkTimer(self, timer):
+        """ Timer callback: send the next chunk, or finish up. """
+
+        if timer is not self.timer:
+            return
+        self.timer = None
+
+        # Let the commander catch up before piling on more.
+        #
+        if len(self.cmdr.outQueue) > self.maxQueued:
+            self._scheduleChunk(self.drainDelay)
+            return
+
+        try:
+            self.sendChunk()
+        except Exception as e:
+            CPL.tback("ReplyBootstrap.sendChunk", e)
+            cmd = self.cmd
+            self.cancel()
+            cmd.fail('text=%s' % (CPL.qstr("bootstrap failed: %s" % (e))), bcast=False)
+            return
+
+        if self.todo:
+            self._scheduleChunk(0.0)
+        else:
+            cmd = self.cmd
+            self.cmd = None
+            cmd.finish('bootstrapDone=%d,%d,%d' % (g.KVs.generation, self.nKeys, self.nReplies),
+                       bcast=False)
+
+    def sendChunk(self):
+        """ Send the next chunk of keys, with their current values. """
+
+        while self.todo:
+            src, keys = self.todo.popleft()
+            KVs, unmatched = g.KVs.getEncodedValues(src, keys)
+            if not KVs:
+                continue
+
+            r = Reply(self.cmd, 'i', KVs, bcast=False, src=src)
+            self.cmdr.sendReply(r, KVs)
+            self.nKeys += len(KVs)
+            self.nReplies += 1
+            return
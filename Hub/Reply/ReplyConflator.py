@@ -0,0 +1,220 @@
+__all__ = ['ReplyConflator']
+
+import collections
+import fnmatch
+import re
+import time
+
+import CPL
+from .Reply import Reply
+
+class ReplyConflator(CPL.Object):
+    """ Rate-limit fast keywords for a single commander.
+
+        Keywords matching any of our actor.key glob patterns are sent at most once per interval.
+        Values which arrive inside the interval are held, with later values replacing earlier
+        ones, and the latest value is sent when the interval closes. Held values are never
+        encoded until they are sent, so superseded values cost nothing.
+
+        Replies which finish a command, and replies to the commander's own commands, are
+        always sent immediately, and in full.
+    """
+
+    def __init__(self, cmdr, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        self.cmdr = cmdr
+        self.interval = 0.0
+        self.patterns = []
+        self.matcher = None
+
+        # Memoized pattern matches, as { (src, lowercased key) : bool }
+        self.matches = {}
+        self.maxMatches = argv.get('maxMatches', 10000)
+
+        # When each conflated key was last sent, as { (src, lowercased key) : time }
+        self.lastSent = {}
+
+        # The held values, as { (src, lowercased key) : (key, value, Reply) }
+        self.pending = collections.OrderedDict()
+        self.timer = None
+
+        # Some stats: how many values we delayed, and how many of those were replaced before
+        # being sent.
+        self.delayed = 0
+        self.superseded = 0
+
+        if 'conflate' in argv:
+            interval, patterns = argv['conflate']
+            self.setConflation(interval, patterns)
+
+    def __str__(self):
+        return "ReplyConflator(interval=%0.2f patterns=%s pending=%d)" % (self.interval,
+                                                                          self.patterns,
+                                                                          len(self.pending))
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        cmd.inform("conflation=%s,%0.3f,%s" % (CPL.qstr(self.cmdr.name),
+                                               self.interval,
+                                               CPL.qstr(self.patterns)))
+        cmd.inform("conflationStats=%s,%d,%d,%d" % (CPL.qstr(self.cmdr.name),
+                                                    self.delayed, self.superseded,
+                                                    len(self.pending)))
+
+    def setConflation(self, interval, patterns):
+        """ Start conflating the given keywords.
+
+        Args:
+           interval  - the minimum time, in seconds, between updates of any one keyword.
+           patterns  - a list of actor.key glob patterns. Matching is case-insensitive.
+        """
+
+        interval = float(interval)
+        if interval <= 0.0:
+            raise Exception("conflation interval must be positive, not %s" % (interval))
+        for p in patterns:
+            if '.' not in p:
+                raise Exception("conflation patterns must be of the form actor.key, not %s" % (p))
+
+        self.flush()
+        self.interval = interval
+        self.patterns = list(patterns)
+        if self.patterns:
+            self.matcher = re.compile('|'.join([fnmatch.translate(p.lower()) for p in self.patterns]))
+        else:
+            self.matcher = None
+        self.matches = {}
+        self.lastSent = {}
+
+    def clearConflation(self):
+        """ Stop conflating anything. Any held values are sent immediately. """
+
+        self.flush()
+        self.interval = 0.0
+        self.patterns = []
+        self.matcher = None
+        self.matches = {}
+        self.lastSent = {}
+
+    def isConflated(self, src, key):
+        """ Does the given key match any of our patterns? """
+
+        try:
+            return self.matches[(src, key)]
+        except KeyError:
+            pass
+
+        if len(self.matches) > self.maxMatches:
+            self.matches = {}
+        match = self.matcher.match(("%s.%s" % (src, key)).lower()) is not None
+        self.matches[(src, key)] = match
+
+        return match
+
+    def conflate(self, r, KVs):
+        """ Return those of a Reply's KVs which we should send right now, or None if there are none.
+
+        Args:
+           r    - the Reply
+           KVs  - the Reply's KVs, possibly already trimmed down.
+
+        Any conflated keys which are held back are sent later, from a timer.
+        """
+
+        if self.matcher is None or not KVs:
+            return KVs
+
+        now = time.time()
+        src = r.src
+
+        # Always send command completion and our own replies, and have them pre-empt
+        # any older held values.
+        #
+        if r.finishesCommand() or r.cmd.cmdrName == self.cmdr.name:
+            for k in KVs:
+                lkey = (src, k.lower())
+                if self.isConflated(*lkey):
+                    self.lastSent[lkey] = now
+                    if lkey in self.pending:
+                        del self.pending[lkey]
+            return KVs
+
+        sendNow = None
+        for k, v in KVs.items():
+            lkey = (src, k.lower())
+            if not self.isConflated(*lkey):
+                continue
+
+            if sendNow is None:
+                sendNow = collections.OrderedDict(KVs)
+            if now - self.lastSent.get(lkey, 0.0) >= self.interval:
+                self.lastSent[lkey] = now
+                if lkey in self.pending:
+                    del self.pending[lkey]
+            else:
+                if lkey in self.pending:
+                    self.superseded += 1
+                    del self.pending[lkey]
+                self.delayed += 1
+                self.pending[lkey] = (k, v, r)
+                del sendNow[k]
+
+        if sendNow is None:
+            return KVs
+
+        self.scheduleFlush()
+        if not sendNow:
+            return None
+        return sendNow
+
+    def scheduleFlush(self):
+        """ Make sure that a timer is set for the earliest held value. """
+
+        if self.timer is not None or not self.pending:
+            return
+
+        when = min([self.lastSent.get(lkey, 0.0) for lkey in self.pending]) + self.interval
+        self.timer = self.cmdr.makeTimerForTime(when, self._flushTimer, None)
+        self.cmdr.addTimer(self.timer)
+
+    def _flushTimer(self, timer):
+        """ Timer callback: send the held values whose interval has closed. """
+
+        if timer is not self.timer:
+            return
+        self.timer = None
+        self.flush(time.time())
+        self.scheduleFlush()
+
+    def cancel(self):
+        """ Drop any held values and timer, e.g. when our commander goes away. """
+
+        if self.timer is not None:
+            self.cmdr.poller.removeTimer(self.timer)
+            self.timer = None
+        self.pending.clear()
+
+    def flush(self, now=None):
+        """ Send held values. If now is set, only send those whose interval has closed by then,
+        otherwise send everything. """
+
+        if self.timer is not None and now is None:
+            self.cmdr.poller.removeTimer(self.timer)
+            self.timer = None
+
+        # Resend the held values grouped by their original Replies, so that the source and flag
+        # are preserved.
+        #
+        replies = collections.OrderedDict()
+        for lkey, (k, v, r) in list(self.pending.items()):
+            if now is not None and self.lastSent.get(lkey, 0.0) + self.interval > now:
+                continue
+            del self.pending[lkey]
+            self.lastSent[lkey] = time.time()
+            replies.setdefault(id(r), (r, collections.OrderedDict()))[1][k] = v
+
+        for r, KVs in replies.values():
+            newReply = Reply(r.cmd, r.flag, KVs, bcast=r.bcast, src=r.src)
+            self.cmdr.sendReply(newReply, KVs)
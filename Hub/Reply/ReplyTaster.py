@@ -1,10 +1,19 @@
 __all__ = ['ReplyTaster']
 
+import collections
+
 import CPL
+from Hub.KV.KVDict import kvASCIILength
 
 class ReplyTaster(CPL.Object):
     """ Control which Replys we should accept. So far, we can list match against a number
         of actors and commanders.
+
+        We can also subscribe to individual keywords of an actor. Once any keys of an actor
+        are subscribed to, Replys from that actor are trimmed down to just those keys, and are
+        dropped entirely if none of them are left.
+
+        In changes-only mode, keys whose values have not changed are also trimmed.
     """
   
     def __init__(self, cmdr, **argv):
@@ -14,15 +23,39 @@ class ReplyTaster(CPL.Object):
         self.actors = {}
         self.cmdrs = {}
         self.sources = {}
+
+        # Keyword subscriptions, as { actorName : { lowercased keyName : keyName } }
+        self.keys = {}
+
+        # Some stats: how much the keyword subscriptions have saved us.
+        self.keyBytesSaved = 0
+        self.keyRepliesDropped = 0
+
+        # Whether to skip unchanged keys, and how much that has saved us.
+        self.changesOnly = False
+        self.unchangedKeysDropped = 0
+        self.unchangedRepliesDropped = 0
         
     def __str__(self):
-        return ("ReplyTaster(actors=%s; cmdrs=%s; sources=%s)" % (list(self.actors.keys()),
-                                                                  list(self.cmdrs.keys()),
-                                                                  list(self.sources.keys()))
-                                                                  )
+        return ("ReplyTaster(actors=%s; cmdrs=%s; sources=%s; keys=%s)" % (list(self.actors.keys()),
+                                                                           list(self.cmdrs.keys()),
+                                                                           list(self.sources.keys()),
+                                                                           self.keyNames())
+                                                                           )
     def listeningTo(self):
         return list(self.actors.keys()), list(self.cmdrs.keys()), list(self.sources.keys())
     
+    def keyNames(self):
+        """ Return our keyword subscriptions as a sorted list of actor.key names. """
+
+        names = []
+        for actor, keys in self.keys.items():
+            for k in keys.values():
+                names.append("%s.%s" % (actor, k))
+        names.sort()
+
+        return names
+    
     def genKeys(self, cmd):
         """ generate the keys describing ourselves. """
 
@@ -32,6 +65,14 @@ class ReplyTaster(CPL.Object):
                                             CPL.qstr(list(self.cmdrs.keys()))))
         cmd.inform("tasterSources=%s,%s" % (CPL.qstr(self.cmdr.name),
                                             CPL.qstr(list(self.sources.keys()))))
+        cmd.inform("tasterKeys=%s,%s" % (CPL.qstr(self.cmdr.name),
+                                         CPL.qstr(self.keyNames())))
+        cmd.inform("tasterKeysSaved=%s,%d,%d" % (CPL.qstr(self.cmdr.name),
+                                                 self.keyBytesSaved, self.keyRepliesDropped))
+        cmd.inform("tasterChangesOnly=%s,%s,%d,%d" % (CPL.qstr(self.cmdr.name),
+                                                      CPL.qstr("on" if self.changesOnly else "off"),
+                                                      self.unchangedKeysDropped,
+                                                      self.unchangedRepliesDropped))
         
     def removeFromFilter(self, actors, cmdrs, sources):
         """ Remove a list of actors and commanders to accept Replys from. """
@@ -71,6 +112,54 @@ class ReplyTaster(CPL.Object):
         self.actors = {}
         self.addToFilter(actors, [], [])
         
+    def _splitKeyNames(self, names):
+        """ Split a list of actor.key names into (actor, key) pairs.
+
+        Raises:
+           Exception - if any name is not of the form actor.key
+        """
+
+        pairs = []
+        for n in names:
+            parts = n.split('.', 1)
+            if len(parts) != 2 or parts[0] == '' or parts[1] == '':
+                raise Exception("keyword names must be of the form actor.key, not %s" % (n))
+            pairs.append((parts[0], parts[1]))
+
+        return pairs
+    
+    def addKeys(self, names):
+        """ Subscribe to a list of actor.key keywords. """
+
+        for actor, key in self._splitKeyNames(names):
+            self.keys.setdefault(actor, {})[key.lower()] = key
+            
+    def removeKeys(self, names):
+        """ Unsubscribe from a list of actor.key keywords. An actor with no keys left is no
+        longer trimmed. """
+
+        for actor, key in self._splitKeyNames(names):
+            actorKeys = self.keys.get(actor, None)
+            if actorKeys is None:
+                continue
+            if key.lower() in actorKeys:
+                del actorKeys[key.lower()]
+            if not actorKeys:
+                del self.keys[actor]
+
+    def setKeys(self, names):
+        """ Replace all our keyword subscriptions. """
+
+        pairs = self._splitKeyNames(names)
+        self.keys = {}
+        for actor, key in pairs:
+            self.keys.setdefault(actor, {})[key.lower()] = key
+        
+    def setChangesOnly(self, changesOnly):
+        """ Turn changes-only mode on or off. """
+
+        self.changesOnly = bool(changesOnly)
+
     def taste(self, reply):
         """ Do we accept the given Reply? """
         
@@ -79,4 +168,63 @@ class ReplyTaster(CPL.Object):
                or cmd.cmdrID in self.cmdrs \
                or '*' in self.sources or '*' in self.actors \
                or cmd.actorName in self.actors \
-               or reply.src in self.sources
+               or reply.src in self.sources \
+               or reply.src in self.keys
+
+    def wantsSource(self, src):
+        """ Do we want to hear the keys from the given source? """
+
+        return '*' in self.sources or '*' in self.actors \
+               or src in self.actors \
+               or src in self.sources \
+               or src in self.keys
+
+    def filterKeyNames(self, src, keys):
+        """ Return those of a source's key names which we want to see. """
+
+        wantedKeys = self.keys.get(src, None) if self.keys else None
+        if wantedKeys is None:
+            return keys
+
+        return [k for k in keys if k.lower() in wantedKeys]
+
+    def filterKVs(self, reply):
+        """ Return the part of a Reply's KVs which we want to see, or None if we want nothing.
+
+        Replies to our own commands are never trimmed. Replies from actors we have no
+        keyword subscriptions for are passed through unmolested, unless we are in changes-only
+        mode. A finishing Reply to a command from a commander we are listening to is not
+        dropped just because all its keys were unchanged.
+        """
+
+        wantedKeys = self.keys.get(reply.src, None) if self.keys else None
+        dropUnchanged = self.changesOnly and reply.unchangedKeys
+        if wantedKeys is None and not dropUnchanged:
+            return reply.KVs
+        if reply.cmd.cmdrName == self.cmdr.name:
+            return reply.KVs
+
+        KVs = collections.OrderedDict()
+        saved = 0
+        unchanged = 0
+        for k, v in reply.KVs.items():
+            if wantedKeys is not None and k.lower() not in wantedKeys:
+                # Count the key and its "; " separator.
+                saved += kvASCIILength(k, v) + 2
+            elif dropUnchanged and k in reply.unchangedKeys:
+                unchanged += 1
+            else:
+                KVs[k] = v
+        self.keyBytesSaved += saved
+        self.unchangedKeysDropped += unchanged
+
+        if not KVs:
+            if unchanged == 0:
+                self.keyRepliesDropped += 1
+                return None
+            cmd = reply.cmd
+            if not (reply.finishesCommand() and (cmd.cmdrName in self.cmdrs or cmd.cmdrID in self.cmdrs)):
+                self.unchangedRepliesDropped += 1
+                return None
+
+        return KVs
@@ -0,0 +1,124 @@
+__all__ = ['Startup']
+
+import collections
+import time
+
+import CPL
+from Hub.Reply.KVBuilder import kv, qKV
+import g
+import hub
+
+class Startup(CPL.Object):
+    """ Bring up the listeners and the actor connections all together, and report how long each took.
+
+    Listeners are started first, and are accepting commanders as soon as they are bound.
+    Actors which connect in the background (see SocketActorNub's connectTimeout) then all
+    connect at the same time, each giving up after its own timeout. Commands sent to them
+    in the meanwhile are queued until they connect.
+
+    Each nub's result is reported as a startupNub keyword, and the time until every nub had
+    either started or failed as a startupTime keyword.
+    """
+
+    def __init__(self, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        self.startTime = None
+        self.readyTime = None
+
+        # { name : [kind, state, seconds] }, in the order the nubs were started.
+        self.timeline = collections.OrderedDict()
+        self.pending = set()
+        self.starting = False
+
+    def start(self, listeners=(), actors=()):
+        """ Start the given listener and actor nubs. Returns before the actors have connected.
+
+        Args:
+           listeners  - the names of the listener nubs to start.
+           actors     - the names of the actors to connect to.
+        """
+
+        self.startTime = time.time()
+        self.readyTime = None
+        self.timeline.clear()
+        self.pending.clear()
+
+        # Nubs which start at once must not make us look ready before the rest have started.
+        self.starting = True
+        try:
+            for name in listeners:
+                self.startNub(name, 'listener')
+            for name in actors:
+                self.startNub(name, 'actor')
+        finally:
+            self.starting = False
+
+        self.checkReady()
+
+    def startNub(self, name, kind):
+        """ Start a single nub, and arrange to hear when it is ready. """
+
+        t0 = time.time()
+        self.timeline[name] = [kind, 'starting', 0.0]
+        try:
+            ok = hub.startNub(name)
+        except Exception as e:
+            self.finished(name, t0, str(e))
+            return
+
+        if ok is False:
+            self.finished(name, t0, "could not be started")
+            return
+
+        nub = hub.findActor(name) if kind == 'actor' else None
+        if nub is not None and hasattr(nub, 'whenConnected'):
+            self.pending.add(name)
+            nub.whenConnected(lambda nub, error, name=name, t0=t0: self.finished(name, t0, error))
+        else:
+            self.finished(name, t0, None)
+
+    def finished(self, name, t0, error):
+        """ Record that a nub has started, or failed to. """
+
+        dt = time.time() - t0
+        entry = self.timeline[name]
+        entry[1] = 'failed' if error else 'ok'
+        entry[2] = dt
+
+        if error:
+            CPL.log("Startup.finished", "%s %s failed after %0.3fs: %s" % (entry[0], name, dt, error))
+            g.hubcmd.warn(qKV('text', "failed to start %s %s: %s" % (entry[0], name, error)))
+        else:
+            CPL.log("Startup.finished", "%s %s started in %0.3fs" % (entry[0], name, dt))
+        self.genNubKey(g.hubcmd, name)
+
+        self.pending.discard(name)
+        self.checkReady()
+
+    def checkReady(self):
+        if self.starting or self.pending or self.readyTime is not None or self.startTime is None:
+            return
+
+        self.readyTime = time.time()
+        CPL.log("Startup.checkReady", "all %d nubs done in %0.3fs" % (len(self.timeline),
+                                                                      self.readyTime - self.startTime))
+        self.genTimeKey(g.hubcmd)
+
+    def genNubKey(self, cmd, name):
+        kind, state, dt = self.timeline[name]
+        cmd.inform(kv('startupNub', (CPL.qstr(name), CPL.qstr(kind), CPL.qstr(state), '%0.3f' % (dt))))
+
+    def genTimeKey(self, cmd):
+        nFailed = len([e for e in self.timeline.values() if e[1] == 'failed'])
+        total = (self.readyTime - self.startTime) if self.readyTime is not None else -1.0
+        cmd.inform(kv('startupTime', (len(self.timeline), len(self.pending), nFailed, '%0.3f' % (total))))
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        if self.startTime is None:
+            return
+        for name in self.timeline:
+            self.genNubKey(cmd, name)
+        self.genTimeKey(cmd)
@@ -282,8 +282,13 @@ class IOHandler(CPL.Object):
                 CPL.log("IOHandler.mayOutput", "writing len=%d wlen=%d %r" % \
                         (len(qtop), wlen, qtop[:min(wlen, 50)]))
                 
+            # Binary protocols queue bytes, everything else latin-1 strings.
+            #
+            data = qtop[:wlen]
+            if isinstance(data, str):
+                data = data.encode('latin-1')
             try:
-                wrote = os.write(self.out_fd, qtop[:wlen].encode('latin-1'))
+                wrote = os.write(self.out_fd, data)
             except socket.error as e:
                 CPL.log("IOHandler.mayOutput", "socket exception %r" % (e,))
                 self.shutdown(why=str(e))
@@ -20,6 +20,7 @@ class PollAccept(IOHandler):
            depth       - the number of pending incoming connections to allow.
                          set to 0 to make the instance quit after one connection.
            callback    - the function to call as callback(fd, remote_addr) on new connections.
+           sock        - if set, an already listening socket to accept connections from.
 
         """
 
@@ -34,8 +35,13 @@ class PollAccept(IOHandler):
         if depth == 0:
             depth = 1
             
+        self.listenFd = argv.get('sock', None)
+        if self.listenFd is not None:
+            CPL.log("IOAccept.init", "taking over listening on (%s,%s)" % (host, port))
+            self.poller.addInput(self)
+            return
+
         CPL.log("IOAccept.init", "listening on (%s,%s)" % (host, port))
-        self.listenFd = None
         try:
             self.listenFd = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.listenFd.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
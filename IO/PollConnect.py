@@ -3,63 +3,99 @@
 from __future__ import absolute_import
 __all__ = ['PollConnect']
 
+import errno
 import socket
 
-from .IOHandler import IOHandler
 import CPL
+from .IOHandler import IOHandler
 
 class PollConnect(IOHandler):
-    """ Provide asynchronous socket accept() handling. """
-    
-    def __init__(self, poller, host, port, depth=5, callback=None):
-        """ Set up to accept new connections on a given port.
+    """ Provide asynchronous socket connect() handling. """
+
+    def __init__(self, poller, host, port, callback=None, timeout=None, **argv):
+        """ Start connecting to a given host and port, without waiting for the connection.
 
         Args:
            poller      - the PollHandler instance to register with.
-           host, port  - the host and port arguments to listen(2)
-           depth       - the number of pending incoming connections to allow.
-                         set to 0 to make the instance quit after one connection.
-           callback    - the function to call as callback(fd, remote_addr) on new connections.
+           host, port  - the address to connect to.
+           callback    - the function to call as callback(socket, error) once we are connected
+                         or have failed. On success, the socket is non-blocking and error is None.
+                         On failure, socket is None and error says why.
+           timeout     - if set, how many seconds to wait for the connection.
 
+        Only the host name lookup blocks.
         """
 
-        self.poller = poller
-        self.depth = depth
-        self.acceptMany = depth
+        self.host = host
+        self.port = port
+
+        IOHandler.__init__(self, poller, **argv)
+
         self.callback = callback
-        if depth == 0:
-            depth = 1
-            
-        self.listenFd = None
+        self.timeout = timeout
+        self.done = False
+
+        CPL.log("IOConnect.init", "connecting to (%s,%s)" % (host, port))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
         try:
-            self.listenFd = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.listenFd.bind((host, port))
-            self.listenFd.listen(depth)
+            err = self.sock.connect_ex((host, port))
         except:
-            if self.listenFd:
-                self.listenFd.close()
+            self.sock.close()
             raise
-        
-        self.poller.addInput(self)
-        
-    def __del__(self):
-        self.poller.removeInput(self)
-        self.listenFd.close()
-        
-    def getInputFile(self):
-        return self.listenFd.fileno()
-
-    def readInput(self):
-
-        CPL.log("IOAccept.readInput", "accepting...")
-        newfd, addr = self.listenFd.accept()
-
-        # Listen for a single connect. Kill ourselves if we should.
-        #
-        if self.acceptMany == 0:
-            self.poller.removeInput(self)
-            self.poller = None
-        self.listenFd.listen(self.depth)
+
+        if err == 0:
+            self.poller.callMeIn(lambda: self._finish(None), 0.0)
+        elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.out_fd = self.sock.fileno()
+            self.poller.addOutput(self)
+            if timeout is not None:
+                self.poller.callMeIn(self._timedOut, timeout)
+        else:
+            self.poller.callMeIn(lambda: self._finish(errno.errorcode.get(err, str(err))), 0.0)
+
+    def __str__(self):
+        return "PollConnect(host=%s port=%s)" % (self.host, self.port)
+
+    def shutdown(self, **argv):
+        """ Give up on the connection, without calling back. """
+
+        if self.done:
+            return
+        CPL.log("PollConnect.shutdown", "shutting down %s" % (self))
+
+        self.done = True
+        self._release()
+        self.sock.close()
+
+    def _release(self):
+        if self.out_fd is not None:
+            self.poller.removeOutput(self)
+            self.out_fd = None
+
+    def mayOutput(self):
+        """ Called when the socket is writable, which it becomes when connect() has succeeded or failed. """
+
+        err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self._finish(errno.errorcode.get(err, str(err)) if err else None)
+
+    def _timedOut(self):
+        self._finish("timed out after %0.1fs" % (self.timeout))
+
+    def _finish(self, error):
+        """ Hand the socket on, or close it and report the error. Only the first call counts. """
+
+        if self.done:
+            return
+        self.done = True
+        self._release()
+
+        CPL.log("IOConnect.finish", "%s: %s" % (self, error if error else "connected"))
+        if error:
+            self.sock.close()
+            sock = None
+        else:
+            sock = self.sock
 
         if self.callback:
-            self.callback(newfd, addr)
+            self.callback(sock, error)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-from builtins import range
 from builtins import object
 __all__ = ['PollHandler']
 
@@ -12,8 +11,10 @@ __all__ = ['PollHandler']
     invoked. I.e. PollHandler does not read/write.
 """
 
+import collections
 import os
 import select
+import signal
 import socket
 import time
 from threading import *
@@ -64,7 +65,11 @@ class PollHandler(CPL.Object):
         self.files = {}
         self.lock = Lock()
         
+        # Timers are kept sorted as (time, sequence, timer) triples. The sequence
+        # number keeps timers with identical times from being compared themselves.
+        #
         self.timedCallbacks = []
+        self.timerSeq = 0
         self.cbLock = Lock()
         
         self.timeout = argv.get('timeout', 0.5)
@@ -76,6 +81,13 @@ class PollHandler(CPL.Object):
         #
         self.loopback = None
         self.looper = None
+
+        # Callbacks for signals which have arrived, which the loop calls, and the pipe which
+        # wakes it up to do so. See .callOnSignal()
+        #
+        self.signalled = collections.deque()
+        self.signalWaker = None
+
         needLoopback = argv.get('threaded', False)
         if needLoopback:
             self.startLoopback()
@@ -97,31 +109,47 @@ class PollHandler(CPL.Object):
         """
 
         self.cbLock.acquire()
-        self.timedCallbacks.append((timer['time'], timer))
+        self.timerSeq += 1
+        self.timedCallbacks.append((timer['time'], self.timerSeq, timer))
         self.timedCallbacks.sort()
 
         # Kick the loop if necessary
         #
-        if self.loopback and self.timedCallbacks[0][1] == timer:
-            os.write(self.loopback, 'I')
+        if self.loopback and self.timedCallbacks[0][2] is timer:
+            os.write(self.loopback, b'I')
         self.cbLock.release()
         
     def removeTimer(self, timer):
-        """ Remove an existing timer.
+        """ Remove an existing timer. Does not care if the timer has already fired.
 
         """
         self.cbLock.acquire()
-        self.timedCallbacks.remove((timer['time'], timer))
+        self.timedCallbacks = [t for t in self.timedCallbacks if t[2] is not timer]
         self.cbLock.release()
         
     def callMeIn(self, callback, delay):
-        """ Arrange to call callback after delay seconds. """
+        """ Arrange to call callback() after delay seconds. """
 
-        self.cbLock.acquire()
-        self.timedCallbacks.append((time.time() + delay, callback))
-        self.timedCallbacks.sort()
-        self.cbLock.release()
+        self.addTimer({'time' : time.time() + delay,
+                       'callback' : lambda timer: callback()})
         
+    def callOnSignal(self, signum, callback):
+        """ Arrange for the loop to call callback() soon after each signum signal arrives.
+
+        The signal handler itself only notes the signal: it can arrive while we are holding
+        our locks or dispatching I/O, so nothing else is safe to do there.
+        """
+
+        if self.signalWaker is None:
+            rFd, wFd = os.pipe()
+            os.set_blocking(rFd, False)
+            os.set_blocking(wFd, False)
+            self.signalWaker = NullIO(rFd, debug=self.debug)
+            self.addInput(self.signalWaker)
+            signal.set_wakeup_fd(wFd)
+
+        signal.signal(signum, lambda signum, frame: self.signalled.append(callback))
+
     def startLoopback(self):
         """ Create a pipe that the poller listens to, that we can write to when the
         poller's file lists change. Also create the object that consumes the input.
@@ -173,7 +201,7 @@ class PollHandler(CPL.Object):
 
         # Wake the poller up.
         if self.loopback:
-            os.write(self.loopback, 'I')
+            os.write(self.loopback, b'I')
 
         if self.debug > 2:
             CPL.log('Poll.registry', '%s added input %r(%s): %s' %
@@ -225,7 +253,7 @@ class PollHandler(CPL.Object):
 
         # Wake the poller up.
         if self.loopback and changed:
-            os.write(self.loopback, 'O')
+            os.write(self.loopback, b'O')
         
         if self.debug > 2:
             CPL.log('Poll.registry', '%s added output %r(%s): obj=%s info=%s' %
@@ -285,7 +313,7 @@ class PollHandler(CPL.Object):
 
         # Wake the poller up.
         if self.loopback:
-            os.write(self.loopback, 'i')
+            os.write(self.loopback, b'i')
             
     def removeOutput(self, obj):
         return self.removeOutputFd(obj.getOutputFd())
@@ -335,7 +363,7 @@ class PollHandler(CPL.Object):
 
         # Wake the poller up.
         if self.loopback:
-            os.write(self.loopback, 'o')
+            os.write(self.loopback, b'o')
 
     def flagNames(self, flags):
         """ Return a string describing a poll event flag mask. """
@@ -392,7 +420,7 @@ class PollHandler(CPL.Object):
             timeout = self.timeout
             self.cbLock.acquire()
             if self.timedCallbacks != []:
-                nextTick, nextTimer = self.timedCallbacks[0]
+                nextTick = self.timedCallbacks[0][0]
                 
                 now = time.time()
                 if nextTick - now < self.timeout:
@@ -433,6 +461,9 @@ class PollHandler(CPL.Object):
                     if self.debug > 8:
                         CPL.log("PollHandler.run", "time out on poll, with no timeoutHandler!")
 
+            while self.signalled:
+                self.signalled.popleft()()
+
             # Regardless of whether we got here by timeout or by event, check the timed callbacks for
             # expired events.
             #
@@ -440,16 +471,8 @@ class PollHandler(CPL.Object):
                 now = time.time()
                 timers = []
                 self.cbLock.acquire()
-                for i in range(len(self.timedCallbacks)):
-                    try:
-                        tick, timer = self.timedCallbacks[i]
-                    except IndexError:
-                        break
-                    
-                    if tick > now:
-                        break
-                    timers.append(timer)
-                    del self.timedCallbacks[i]
+                while self.timedCallbacks and self.timedCallbacks[0][0] <= now:
+                    timers.append(self.timedCallbacks.pop(0)[2])
                 self.cbLock.release()
 
                 for timer in timers:
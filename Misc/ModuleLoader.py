@@ -0,0 +1,141 @@
+__all__ = ['ModuleLoader']
+
+import hashlib
+import importlib
+import os
+import sys
+import time
+
+import CPL
+
+class ModuleLoader(CPL.Object):
+    """ Load the Vocab and Nubs modules, and reload them only when their source has changed.
+
+    The first load of a module is a normal import. After that, each load stat()s the module's
+    source file, and if that has changed, hashes it: the module is only reloaded if the
+    source is really different. Parent packages are checked the same way, so a package is
+    only reloaded when its own __init__ changes.
+
+    Modules are named by their full dotted names, e.g. 'Vocab.hubCommands'.
+    """
+
+    def __init__(self, **argv):
+        CPL.Object.__init__(self, **argv)
+
+        # What we know about each module we have loaded, as
+        #   { name : [module, path, (mtime, size), sha1] }
+        self.modules = {}
+
+        # Some stats.
+        self.loads = 0
+        self.reloads = 0
+        self.reloadTime = 0.0
+        self.lastReload = None
+
+    def load(self, name, parents=True):
+        """ Return the module with the given full name, loading or reloading it if needed.
+
+        Args:
+           name     - the full dotted name of the module.
+           parents  - if True, also check that the containing packages are up to date.
+
+        Raises:
+           ImportError if the module cannot be found, or whatever loading it raises.
+        """
+
+        self.loads += 1
+        if parents:
+            parts = name.split('.')
+            for i in range(1, len(parts)):
+                self._load('.'.join(parts[:i]))
+
+        return self._load(name)
+
+    def _load(self, name):
+        info = self.modules.get(name, None)
+        if info is None:
+            return self._firstLoad(name)
+
+        mod, path, stamp, digest = info
+        if path is None:
+            return mod
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Let the import machinery deal with a module which has moved or gone.
+            return self._reload(name, mod)
+
+        newStamp = (st.st_mtime_ns, st.st_size)
+        if newStamp == stamp:
+            return mod
+
+        newDigest = self._digest(path)
+        info[2] = newStamp
+        if newDigest == digest:
+            if self.debug > 2:
+                CPL.log('ModuleLoader.load', '%s was touched but not changed' % (name))
+            return mod
+
+        return self._reload(name, mod)
+
+    def _firstLoad(self, name):
+        """ Import a module we have not loaded before, or adopt one which is already imported. """
+
+        mod = sys.modules.get(name, None)
+        if mod is None:
+            t0 = time.time()
+            mod = importlib.import_module(name)
+            CPL.log('ModuleLoader.load', 'loaded %s in %0.3fs' % (name, time.time() - t0))
+
+        self._remember(name, mod)
+        return mod
+
+    def _reload(self, name, mod):
+        """ Reload a changed module, and note how long that took. """
+
+        t0 = time.time()
+        try:
+            mod = importlib.reload(mod)
+        except Exception:
+            # The old module stays loaded. Forget the stamp, so that the next load hashes
+            # the file again, and retries if it is not the one which last loaded.
+            info = self.modules.get(name, None)
+            if info is not None:
+                info[2] = None
+            raise
+        dt = time.time() - t0
+
+        self.reloads += 1
+        self.reloadTime += dt
+        self.lastReload = (name, dt)
+        CPL.log('ModuleLoader.load', 'reloaded %s in %0.3fs' % (name, dt))
+
+        self._remember(name, mod)
+        return mod
+
+    def _remember(self, name, mod):
+        path = getattr(mod, '__file__', None)
+        if path is None:
+            self.modules[name] = [mod, None, None, None]
+            return
+
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            digest = self._digest(path)
+        except OSError:
+            stamp = digest = None
+        self.modules[name] = [mod, path, stamp, digest]
+
+    def _digest(self, path):
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).digest()
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        lastName, lastTime = self.lastReload if self.lastReload else ('', 0.0)
+        cmd.inform("moduleLoader=%d,%d,%d,%0.3f,%s,%0.3f" % (len(self.modules), self.loads,
+                                                             self.reloads, self.reloadTime,
+                                                             CPL.qstr(lastName), lastTime))
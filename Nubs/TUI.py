@@ -6,6 +6,7 @@ from Hub.Reply.Encoders.ASCIIReplyEncoder import ASCIIReplyEncoder
 from Hub.Nub.Commanders import AuthStdinNub
 from Hub.Nub.Listeners import SocketListener
 
+import CPL
 import g
 import hub
 
@@ -38,7 +39,8 @@ def acceptTUI(in_f, out_f, addr=None):
                      encoder=e, decoder=d, debug=1,
                      type='TUI', needsAuth=True,
                      isUser=True,
-                     otherIP=otherIP, otherFQDN=otherFQDN)
+                     otherIP=otherIP, otherFQDN=otherFQDN,
+                     conflate=CPL.cfg.get('hub', 'TUIconflate', None))
     c.taster.addToFilter(all, (), all)
     hub.addCommander(c)
     
@@ -1,5 +1,3 @@
-import time
-
 import Hub.Command.Decoders as hubDecoders
 import Hub.Reply.Encoders as hubEncoders
 import Hub.Nub.Commanders as hubCommanders 
@@ -34,8 +32,6 @@ def start(poller):
     
     l = SocketListener(poller, listenPort, name, acceptStdin, host=listenHost)
     hub.addAcceptor(l)
-    
-    time.sleep(1)
 
 def stop():
     l = hub.findAcceptor(name)
@@ -0,0 +1,38 @@
+from Hub.Command.Decoders.JSONCmdDecoder import JSONCmdDecoder
+from Hub.Reply.Encoders.JSONReplyEncoder import JSONReplyEncoder
+from Hub.Nub.Commanders import StdinNub
+from Hub.Nub.Listeners import SocketListener
+
+import g
+import hub
+
+name = 'jsonin'
+listenPort = 6096
+listenHost = 'tron'
+
+def acceptStdin(in_f, out_f, addr=None):
+    """ Create a command source which reads and writes JSON lines with the given fds. """
+    
+    nubID = g.nubIDs.gimme()
+
+    d = JSONCmdDecoder(name=name, debug=1)
+    e = JSONReplyEncoder(name=name, debug=1)
+    c = StdinNub(g.poller, in_f, out_f,
+                 name='%s.v%d' % (name, nubID),
+                 encoder=e, decoder=d, debug=1)
+
+    # By default, listen to nothing but replies to our commands and messages from the hub.
+    c.taster.addToFilter(('hub',), (), ('hub',))
+    hub.addCommander(c)
+
+def start(poller):
+    stop()
+    
+    l = SocketListener(poller, listenPort, name, acceptStdin, host=listenHost)
+    hub.addAcceptor(l)
+
+def stop():
+    l = hub.findAcceptor(name)
+    if l:
+        hub.dropAcceptor(l)
+        del l
@@ -15,6 +15,8 @@ import os.path
 
 from Hub.Command.Encoders.ASCIICmdEncoder import ASCIICmdEncoder
 from Hub.Reply.Decoders.ASCIIReplyDecoder import ASCIIReplyDecoder
+from Hub.Command.Encoders.WireCmdEncoder import WireCmdEncoder
+from Hub.Reply.Decoders.WireReplyDecoder import WireReplyDecoder
 from Hub.Nub.SocketActorNub import SocketActorNub
 
 import CPL.cfg
@@ -82,16 +84,31 @@ def start(poller, name, initCmds=None,
                     'status')
     # safeCmds = r'^\s*info\s*$'
 
-    d = ASCIIReplyDecoder(debug=decoderDebug)
-    e = ASCIICmdEncoder(sendCommander=True, useCID=False, 
-                        debug=encoderDebug)
+    # Offer binary frames first thing. The encoder only switches if the actor agrees.
+    #
+    if cfg.get('wire', 'ascii') == 'binary':
+        e = WireCmdEncoder(sendCommander=True, useCID=False, 
+                           debug=encoderDebug)
+        d = WireReplyDecoder(encoder=e, debug=decoderDebug)
+        initCmds = (WireCmdEncoder.negotiateCmd,) + tuple(initCmds)
+    else:
+        d = ASCIIReplyDecoder(debug=decoderDebug)
+        e = ASCIICmdEncoder(sendCommander=True, useCID=False, 
+                            debug=encoderDebug)
 
     try:
         nub = SocketActorNub(poller, hostname, port,
                              name=name, encoder=e, decoder=d,
                              grabCID=True,
                              initCmds=initCmds, # safeCmds=safeCmds,
+                             timeout=cfg.get('timeout', None),
+                             cmdTimeouts=cfg.get('cmdTimeouts', None),
+                             maxInFlight=cfg.get('maxInFlight', None),
+                             urgentCmds=cfg.get('urgentCmds', None),
+                             coalesceCmds=cfg.get('coalesceCmds', None),
                              needsAuth=False,
+                             connectTimeout=cfg.get('connectTimeout',
+                                                    CPL.cfg.get('hub', 'actorConnectTimeout', 10.0)),
                              logDir=os.path.join(g.logDir, name),
                              debug=nubDebug)
     except Exception as e:
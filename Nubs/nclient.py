@@ -41,8 +41,6 @@ def start(poller):
     l = SocketListener(poller, listenPort, name, acceptStdin,
                        host=listenHost)
     hub.addAcceptor(l)
-    
-    time.sleep(1)
 
 def stop():
     l = hub.findAcceptor(name)
@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 from .Exceptions import *
+from .cache import *
 from .dequote import *
 from .args import *
 from .keys import *
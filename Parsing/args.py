@@ -1,12 +1,13 @@
 from __future__ import absolute_import
 from builtins import range
-__all__ = ['parseArgs', 'match']
+__all__ = ['parseArgs', 'argsCache', 'match']
 
 import collections
 import re
 
 import CPL
 from .Exceptions import ParseException
+from .cache import ParseCache
 
 from .keys import *
 
@@ -128,6 +129,9 @@ def parseArgs(s):
 
     return KVs
 
+# Most commands have been seen before.
+argsCache = ParseCache(parseArgs, name='cmdArgs')
+
 def match(argv, opts):
     """ Searches an OrderedDict for matches.
 
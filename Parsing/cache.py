@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+__all__ = ['FrozenKVs', 'ParseCache']
+
+import collections
+import sys
+
+import CPL
+
+class FrozenKVs(collections.OrderedDict):
+    """ A read-only OrderedDict of parsed keywords, which can be shared between any number of users.
+
+    Multiple values are stored as tuples instead of lists. Copies and pickles are plain,
+    modifiable, OrderedDicts.
+    """
+
+    def __init__(self, KVs=None):
+        collections.OrderedDict.__init__(self)
+        if KVs is not None:
+            for k, v in KVs.items():
+                if isinstance(v, list):
+                    v = tuple(v)
+                collections.OrderedDict.__setitem__(self, k, v)
+
+    def _readOnly(self, *args, **argv):
+        raise TypeError("parsed keywords are shared, and cannot be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _readOnly
+    pop = popitem = clear = update = setdefault = move_to_end = _readOnly
+
+    def __reduce__(self):
+        return (collections.OrderedDict, (list(self.items()),))
+
+    def copy(self):
+        return collections.OrderedDict(self)
+
+class ParseCache(CPL.Object):
+    """ Remember the results of parsing the most recently seen strings.
+
+    Actors repeat the same reply lines, and commanders the same commands, over and over. We
+    keep the parsed results for the most recently used strings, up to a rough total size,
+    and return the same FrozenKVs for each repeat. Strings which fail to parse are not
+    remembered.
+    """
+
+    def __init__(self, parser, **argv):
+        """
+        Args:
+           parser   - the function to cache. Must take a string and return an OrderedDict.
+
+        KWArgs:
+           name       - what to call ourselves in the parseCache keyword.
+           maxBytes   - the rough limit on the memory used by the cached entries.
+           maxLength  - do not cache strings longer than this.
+        """
+
+        CPL.Object.__init__(self, **argv)
+
+        self.parser = parser
+        self.name = argv.get('name', parser.__name__)
+        self.maxBytes = argv.get('maxBytes', 1000000)
+        self.maxLength = argv.get('maxLength', 2000)
+
+        # The cached results, least recently used first, as { string : (FrozenKVs, size) }
+        self.entries = collections.OrderedDict()
+        self.nBytes = 0
+
+        # Some stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def setLimits(self, maxBytes=None, maxLength=None):
+        """ Change our size limits, dropping entries as necessary. """
+
+        if maxBytes is not None:
+            self.maxBytes = maxBytes
+        if maxLength is not None:
+            self.maxLength = maxLength
+        self._trim()
+
+    def clear(self):
+        self.entries.clear()
+        self.nBytes = 0
+
+    def entrySize(self, s, KVs):
+        """ Roughly estimate the memory used by a cache entry: the string itself, the key and value
+        strings, which are at most as long, and the dictionary. """
+
+        return 2 * sys.getsizeof(s) + sys.getsizeof(KVs)
+
+    def parse(self, s):
+        """ Return the parsed version of s, as a FrozenKVs.
+
+        Raises:
+           whatever our parser raises.
+        """
+
+        try:
+            KVs, size = self.entries[s]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.entries.move_to_end(s)
+            return KVs
+
+        self.misses += 1
+        KVs = FrozenKVs(self.parser(s))
+        if len(s) <= self.maxLength:
+            size = self.entrySize(s, KVs)
+            self.entries[s] = (KVs, size)
+            self.nBytes += size
+            self._trim()
+
+        return KVs
+
+    def _trim(self):
+        """ Drop the least recently used entries until we fit. """
+
+        while self.nBytes > self.maxBytes and self.entries:
+            s, (KVs, size) = self.entries.popitem(last=False)
+            self.nBytes -= size
+            self.evictions += 1
+
+    def genKeys(self, cmd):
+        """ generate the keys describing ourselves. """
+
+        cmd.inform("parseCache=%s,%d,%d,%d,%d,%d,%d" % (CPL.qstr(self.name),
+                                                        self.hits, self.misses, self.evictions,
+                                                        len(self.entries), self.nBytes,
+                                                        self.maxBytes))
@@ -1,7 +1,7 @@
 from __future__ import print_function
 from __future__ import absolute_import
 __all__ = ['eatAVee', 'eatAString',
-           'parseKV', 'parseKVs',
+           'parseKV', 'parseKVs', 'kvsCache',
            'parseASCIIReply',
            'parseRawReply']
 
@@ -21,6 +21,7 @@ import re
 
 import CPL
 from .Exceptions import ParseException
+from .cache import ParseCache
 
 def eatAVee(s):
     """ Match a keyword value -- a possibly space-padded value ended by a whitespace, a comma, or a semicolon.
@@ -186,6 +187,31 @@ def parseKV(s):
 
     return K, values, rest
 
+# Match an entire well-formed "key", "key;" or "key=V1,V2,...[;]" in one go, where the
+# values are quoted strings or bare tokens. Anything this does not match -- empty values,
+# trailing commas, unterminated strings, junk -- is left to parseKV().
+#
+_value_re = r"""
+  (?:"[^"\\]*(?:\\.[^"\\]*)*"                  # A double-quoted string
+   | '[^'\\]*(?:\\.[^'\\]*)*'                  # A single-quoted string
+   | [^;,\s"'][^;,\x20\t\r\n\x0b\x0c]*         # A bare token, as eatAVee() sees it,
+     (?![^;,\x20\t\r\n\x0b\x0c])                # which must not be cut short.
+  )"""
+value_re = re.compile(_value_re, re.IGNORECASE|re.VERBOSE|re.DOTALL)
+
+kvs_re = re.compile(r"""
+  \s*
+  (?P<key>[a-z_][a-z0-9_-]*)    # The keyword name, as kv_re sees it.
+  \s*
+  (?:
+     =\s*
+     (?P<first>%s)               # The first value
+     (?P<more>(?:\s*,\s*%s)*)   # Any other values
+     \s*(?:;|(?!\s*,))          # The end of the values
+   | (?:;|\Z)                   # Or a valueless keyword.
+  )""" % (_value_re, _value_re),
+                     re.IGNORECASE|re.VERBOSE|re.DOTALL)
+
 def parseKVs(s):
     """ Parse a string of key-value pairs into an OrderedDict .
 
@@ -194,12 +220,47 @@ def parseKVs(s):
 
     If a keyword has no value, the value is None
     Otherwise the value is a list of parsed values. Note that each value can be None.
-    
+
+    The well-formed start of the string is tokenized in a single pass with kvs_re. Anything
+    after that is handled by the slower, and more forgiving, parseKV().
     """
     
     KVs = collections.OrderedDict()
-    rest = s
+    pos = 0
+
+    # kv_re treats newlines specially, so leave any such strings to the slow parser.
+    if '\n' not in s:
+        for match in kvs_re.finditer(s):
+            if match.start() != pos:
+                break
+            pos = match.end()
+
+            key, first, more = match.group('key', 'first', 'more')
+            if first is None:
+                KVs[key] = None
+            elif not more:
+                KVs[key] = first
+            else:
+                KVs[key] = [first] + value_re.findall(more)
+
+        if pos == len(s):
+            return KVs
+        
+    return _parseKVsFrom(s[pos:], KVs)
+
+# Most reply lines have been seen before.
+kvsCache = ParseCache(parseKVs, name='replyKVs')
 
+def _parseKVsFrom(rest, KVs):
+    """ Parse the rest of a string of key-value pairs into the given OrderedDict, one keyword at a time.
+
+    Returns:
+      - the OrderedDict.
+
+    Raises:
+      - ParseException, with .KVs set to the OrderedDict.
+    """
+    
     while 1:
         try:
             key, values, rest = parseKV(rest)
@@ -268,7 +329,7 @@ def parseASCIIReply(s, cidFirst=False):
     d = match.groupdict()
 
     try:
-        KVs = parseKVs(d['rest'])
+        KVs = kvsCache.parse(d['rest'])
     except ParseException as e:
         KVs = e.KVs
         leftoverText = e.leftoverText
@@ -322,9 +383,12 @@ def testParsing():
                "eol=2,3,")
     
     for t in OKtests:
-        r = parseKVs(t)
         print("OKtest = %s" % (t))
-        print("output = %s" % (r))
+        try:
+            r = parseKVs(t)
+            print("output = %s" % (r))
+        except Exception as e:
+            print("exception = %s" % (e))
         print()
         
     for t in NGtests:
@@ -337,10 +401,79 @@ def testParsing():
             
         print()
 
+def _parseOutcome(parser, s):
+    """ Return what a parser makes of s: the KVs, and any ParseException's leftover text. """
+
+    try:
+        return parser(s), None
+    except ParseException as e:
+        return e.KVs, e.leftoverText
+
+def testFuzz(n=100000, seed=None):
+    """ Check that parseKVs() gives the same results as the slow parser on random strings. """
+
+    import random
+
+    # Weighted towards the characters which matter to the parsers. u'\u017f' matches [s]
+    # case-insensitively, and u'\xa0' is whitespace to lstrip() but not to eatAVee().
+    #
+    alphabet = ('a', 'b', 'Z', '_', '-', '0', '9', '.', '=', '=', ';', ';', ',', ',',
+                ' ', ' ', '  ', '\t', '"', '"', "'", '\\', '\\"', 'key=', 'k2=', '; ',
+                '"a b"', "'x,y'", u'\xa0', u'\u017f', '\x1c', '\r', '\n')
+
+    rng = random.Random(seed)
+    failures = 0
+    for i in range(n):
+        s = ''.join([rng.choice(alphabet) for j in range(rng.randint(0, 20))])
+        fast = _parseOutcome(parseKVs, s)
+        slow = _parseOutcome(lambda s: _parseKVsFrom(s, collections.OrderedDict()), s)
+        if fast != slow or list(fast[0].keys()) != list(slow[0].keys()):
+            failures += 1
+            if failures <= 10:
+                print("MISMATCH for %r:\n   fast=%r\n   slow=%r" % (s, fast, slow))
+
+    print("fuzzed %d strings: %d mismatches" % (n, failures))
+    return failures == 0
+
+# Some typical actor reply bodies.
+sampleLines = ('AxePos=121.8132,45.0002,-0.0033; AxeLim=-180,360,6,85,-270,270',
+               'text="exposure 23 of 100 done, 128.30s elapsed"',
+               'temps=12.21,12.33,-110.17,-110.31,-109.98,20.01,19.88,20.47; heaters=on,off,on,off',
+               'version="tags/1.3.2-0-g2c1e7d4"',
+               'exposureState="reading",1.000000,900.0,"2016-01-01T12:00:00.00"; shutters="open"',
+               'Commanders="client.TUI","client.tron","TUI.PFS.rhl","TUI.PFS.craig"; User="rhl","craig"',
+               'filename="/data/pfs/2016-01-01/PFSA00001234.fits"; spectrograph=1; arm=r',
+               'loop=1; loopTime=0.25; guideErr=0.012,-0.043; fwhm=1.45,1.51; sky=302.4')
+
+def benchmark(n=20000):
+    """ Time parseKVs() against the slow parser on some typical actor lines. """
+
+    import time
+
+    slow = lambda s: _parseKVsFrom(s, collections.OrderedDict())
+    for line in sampleLines:
+        assert parseKVs(line) == slow(line), line
+
+    for name, parser in (('slow', slow), ('parseKVs', parseKVs)):
+        t0 = time.time()
+        for i in range(n):
+            for line in sampleLines:
+                parser(line)
+        dt = time.time() - t0
+        print("%-10s %0.2fus/line" % (name, 1e6 * dt / (n * len(sampleLines))))
+
+    longLine = '; '.join(['k%d="a long string value, number %d",%d' % (i, i, i) for i in range(1000)])
+    for name, parser in (('slow', slow), ('parseKVs', parseKVs)):
+        t0 = time.time()
+        parser(longLine)
+        print("%-10s %0.4fs for a %d character line" % (name, time.time() - t0, len(longLine)))
+
 def testMatching():
     pass
 
 if __name__ == "__main__":
+    CPL.disableLoggingFor('eatAString')
     testParsing()
     testMatching()
-             
+    testFuzz()
+    benchmark()
@@ -4,6 +4,7 @@ __all__ = ['InternalCmd']
 import re
 
 import CPL
+from Hub.Reply.KVBuilder import kv, qKV
 
 class InternalCmd(object):
 
@@ -55,8 +56,7 @@ class InternalCmd(object):
         cmdWord = words[0]
         cmdHandler = self.commands.get(cmdWord, None)
         if cmdHandler == None:
-            cmd.fail('%sTxt=%s' % \
-                     (self.name, CPL.qstr("No command named %s" % (cmdWord))))
+            cmd.fail(qKV('%sTxt' % (self.name), "No command named %s" % (cmdWord)))
             return
 
         cmd.reportQueued()
@@ -64,13 +64,13 @@ class InternalCmd(object):
             cmdHandler(cmd)
         except Exception as e:
             CPL.tback('Vocab.sendCommand', e)
-            cmd.fail('%sTxt=%s' % (self.name, CPL.qstr(e, tquote='"')))
+            cmd.fail(qKV('%sTxt' % (self.name), e))
             return
 
     def statusCmd(self, cmd, doFinish=True):
         """ """
 
-        cmd.inform("vocabStats=%s,%d" % (CPL.qstr(self.name), self.totalCommands))
+        cmd.inform(kv('vocabStats', (CPL.qstr(self.name), self.totalCommands)))
         
         if doFinish:
             cmd.finish()
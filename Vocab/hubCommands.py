@@ -4,6 +4,11 @@ import sys
 
 import CPL
 from Hub.KV.KVDict import *
+from Hub.Reply.KVBuilder import kv, qKV
+from Hub.Command.Decoders.ASCIICmdDecoder import ASCIICmdDecoder
+from Hub.Reply.Encoders.ASCIIReplyEncoder import ASCIIReplyEncoder
+from Hub.Reply.Encoders.WireReplyEncoder import WireReplyEncoder
+import Parsing
 import Vocab.InternalCmd as InternalCmd
 import g
 import hub
@@ -38,6 +43,8 @@ class hubCommands(InternalCmd.InternalCmd):
                           'version' : self.version,
                           'ping' : self.status,
                           'relog' : self.relog,
+                          'reloadConfig' : self.reloadConfig,
+                          'wire' : self.wire,
                           }
 
     def version(self, cmd, finish=True):
@@ -45,24 +52,46 @@ class hubCommands(InternalCmd.InternalCmd):
 
         hub.getSetHubVersion()
 
-        vString = 'version=%s' % (g.KVs.getKV('hub', 'version', default='Unknown'))
+        vString = kv('version', g.KVs.getKV('hub', 'version', default='Unknown'))
         if finish:
             cmd.finish(vString)
         else:
             cmd.inform(vString)
 
     def doListen(self, cmd):
-        """ Change what replies get sent to us. """
+        """ Change what replies get sent to us.
+
+        listen addActors|setActors|delActors a1 [a2 ...]
+        listen clearActors
+        listen addKeys|setKeys|delKeys actor.key1 [actor.key2 ...]
+        listen clearKeys
+        listen setConflation interval=S actor.keyPattern1 [actor.keyPattern2 ...]
+        listen clearConflation
+        listen changesOnly=on|off
+        listen bootstrap [src1 src2 ...]
+
+        If the hub's bootstrapOnListen configuration is set, addActors and setActors also
+        stream the newly listened-to actors' keys.
+        """
 
         matched, unmatched, leftovers = cmd.match([('listen', None),
                                                    ('addActors', None),
                                                    ('setActors', None),
                                                    ('clearActors', None),
-                                                   ('delActors', None)])
+                                                   ('delActors', None),
+                                                   ('addKeys', None),
+                                                   ('setKeys', None),
+                                                   ('delKeys', None),
+                                                   ('clearKeys', None),
+                                                   ('setConflation', None),
+                                                   ('clearConflation', None),
+                                                   ('interval', str),
+                                                   ('changesOnly', str),
+                                                   ('bootstrap', None)])
 
         cmdr = cmd.cmdr()
         if not cmdr:
-            cmd.fail('debug=%s' % (CPL.qstr("cmdr=%s; cmd=%s" % (cmdr, cmd))))
+            cmd.fail(qKV('debug', "cmdr=%s; cmd=%s" % (cmdr, cmd)))
             return
         CPL.log("doListen", "start: %s" % (cmdr.taster))
         CPL.log("doListen", "leftovers: %s" % (leftovers))
@@ -71,16 +100,18 @@ class hubCommands(InternalCmd.InternalCmd):
             actors = list(leftovers.keys())
             CPL.log("doListen", "addActors: %s" % (actors))
             #cmd.inform('text="%s"' % (CPL.qstr("adding actors: %s" % (actors))))
+            newActors = [a for a in actors if not cmdr.taster.wantsSource(a)]
             cmdr.taster.addToFilter(actors, [], actors)
             cmdr.taster.genKeys(cmd)
-            cmd.finish()
+            self.finishListen(cmd, cmdr, newActors)
         elif 'setActors' in matched:
             actors = list(leftovers.keys())
             CPL.log("doListen", "setActors: %s" % (actors))
             #cmd.inform('text="%s"' % (CPL.qstr("adding actors: %s" % (actors))))
+            newActors = [a for a in actors if not cmdr.taster.wantsSource(a)]
             cmdr.taster.setFilter(actors, [], actors)
             cmdr.taster.genKeys(cmd)
-            cmd.finish()
+            self.finishListen(cmd, cmdr, newActors)
         elif 'delActors' in matched:
             actors = list(leftovers.keys())
             CPL.log("doListen", "delActors: %s" % (actors))
@@ -92,11 +123,67 @@ class hubCommands(InternalCmd.InternalCmd):
             cmdr.taster.setFilter([], cmdr.taster.cmdrs, [])
             cmdr.taster.genKeys(cmd)
             cmd.finish()
+        elif 'addKeys' in matched or 'setKeys' in matched or 'delKeys' in matched:
+            keys = list(leftovers.keys())
+            CPL.log("doListen", "keys: %s %s" % (list(matched.keys()), keys))
+            try:
+                if 'addKeys' in matched:
+                    cmdr.taster.addKeys(keys)
+                elif 'setKeys' in matched:
+                    cmdr.taster.setKeys(keys)
+                else:
+                    cmdr.taster.removeKeys(keys)
+            except Exception as e:
+                cmd.fail(qKV('text', e))
+                return
+            cmdr.taster.genKeys(cmd)
+            cmd.finish()
+        elif 'clearKeys' in matched:
+            cmdr.taster.setKeys([])
+            cmdr.taster.genKeys(cmd)
+            cmd.finish()
+        elif 'setConflation' in matched:
+            patterns = list(leftovers.keys())
+            if 'interval' not in matched or not patterns:
+                cmd.fail(qKV('text', "usage: listen setConflation interval=S actor.keyPattern1 [actor.keyPattern2 ...]"))
+                return
+            try:
+                cmdr.conflator.setConflation(matched['interval'], patterns)
+            except Exception as e:
+                cmd.fail(qKV('text', e))
+                return
+            cmdr.conflator.genKeys(cmd)
+            cmd.finish()
+        elif 'clearConflation' in matched:
+            cmdr.conflator.clearConflation()
+            cmdr.conflator.genKeys(cmd)
+            cmd.finish()
+        elif 'changesOnly' in matched:
+            onOff = str(matched['changesOnly']).lower()
+            if onOff not in ('on', 'off'):
+                cmd.fail(qKV('text', "usage: listen changesOnly=on|off"))
+                return
+            cmdr.taster.setChangesOnly(onOff == 'on')
+            cmdr.taster.genKeys(cmd)
+            cmd.finish()
+        elif 'bootstrap' in matched:
+            cmdr.bootstrap.start(cmd, list(leftovers.keys()))
         else:
-            cmd.fail('text="unknown listen command"')
+            cmd.fail(qKV('text', "unknown listen command"))
             
         CPL.log("doListen", "finish: %s" % (cmdr.taster))
 
+    def finishListen(self, cmd, cmdr, newActors):
+        """ Finish a listen command, optionally after streaming the keys of newly listened-to actors. """
+
+        sources = [a for a in newActors if a != '*' and a in g.KVs.sources]
+        if '*' in newActors:
+            sources = g.KVs.getSources()
+        if sources and CPL.cfg.get('hub', 'bootstrapOnListen', False):
+            cmdr.bootstrap.start(cmd, sources)
+        else:
+            cmd.finish()
+
     def actors(self, cmd, finish=True, verbose=False):
         """ Return a list of the currently connected actors. """
 
@@ -112,7 +199,7 @@ class hubCommands(InternalCmd.InternalCmd):
             cmd.finish('')
         
     def status(self, cmd, finish=True):
-        CPL.cfg.flush()
+        CPL.cfg.refresh()
 
         matched, unmatched, leftovers = cmd.match([('all', False)])
         verbose = 'all' in matched
@@ -120,10 +207,36 @@ class hubCommands(InternalCmd.InternalCmd):
         self.version(cmd, finish=False)
         self.actors(cmd, finish=False, verbose=verbose)
         self.commanders(cmd, finish=False, verbose=verbose)
+        Parsing.kvsCache.genKeys(cmd)
+        Parsing.argsCache.genKeys(cmd)
+        g.imageWriter.genKeys(cmd)
+        g.moduleLoader.genKeys(cmd)
+        g.startup.genKeys(cmd)
+        g.handover.genKeys(cmd)
 
         if finish:
             cmd.finish('')
             
+    def reloadConfig(self, cmd):
+        """ Reread the hub configuration, and apply any changes.
+
+        reloadConfig
+
+        Only the actors whose configured host or port changed are reconnected.
+        """
+
+        try:
+            changed = hub.reconfigure(cmd)
+        except Exception as e:
+            CPL.tback('hub.reloadConfig', e)
+            cmd.fail(qKV('text', "failed to reload the configuration: %s" % (e)))
+            return
+
+        if changed:
+            cmd.finish('')
+        else:
+            cmd.finish(qKV('text', "the configuration has not changed"))
+
     def setUsername(self, cmd):
         """ Change the username for the cmd's commander. """
         
@@ -131,7 +244,7 @@ class hubCommands(InternalCmd.InternalCmd):
         args = args[1:]
 
         if len(args) != 1:
-            cmd.fail('cmdError="usage: setUsername newname"')
+            cmd.fail(qKV('cmdError', "usage: setUsername newname"))
             return
 
         cmdr = cmd.cmdr()
@@ -156,16 +269,16 @@ class hubCommands(InternalCmd.InternalCmd):
 
         nubs = list(cmd.argDict.keys())[1:]
         if len(nubs) == 0:
-            cmd.fail('text="must specify one or more nubs to stop..."')
+            cmd.fail(qKV('text', "must specify one or more nubs to stop..."))
             return
 
         ok = True
         for nub in nubs:
             try:
-                cmd.inform('text=%s' % (CPL.qstr("stopping nub %s" % (nub))))
+                cmd.inform(qKV('text', "stopping nub %s" % (nub)))
                 hub.stopNub(nub)
             except Exception as e:
-                cmd.warn('text=%s' % (CPL.qstr("failed to stop nub %s: %s" % (nub, e))))
+                cmd.warn(qKV('text', "failed to stop nub %s: %s" % (nub, e)))
 
         cmd.finish('')
 
@@ -174,16 +287,16 @@ class hubCommands(InternalCmd.InternalCmd):
 
         nubs = list(cmd.argDict.keys())[1:]
         if len(nubs) == 0:
-            cmd.fail('text="must specify one or more nubs to start..."')
+            cmd.fail(qKV('text', "must specify one or more nubs to start..."))
             return
 
         ok = True
         for nub in nubs:
             try:
-                cmd.inform('text=%s' % (CPL.qstr("(re-)starting nub %s" % (nub))))
+                cmd.inform(qKV('text', "(re-)starting nub %s" % (nub)))
                 hub.startNub(nub)
             except Exception as e:
-                cmd.warn('text=%s' % (CPL.qstr("failed to start nub %s: %s" % (nub, e))))
+                cmd.warn(qKV('text', "failed to start nub %s: %s" % (nub, e)))
 
         cmd.finish('')
 
@@ -196,7 +309,7 @@ class hubCommands(InternalCmd.InternalCmd):
 
         parts = list(cmd.argDict.keys())[1:]
         if len(parts) == 0:
-            cmd.fail('text="must specify a nub to start..."')
+            cmd.fail(qKV('text', "must specify a nub to start..."))
             return
 
         nubName = parts[0]
@@ -209,14 +322,14 @@ class hubCommands(InternalCmd.InternalCmd):
         try:
             port = int(port)
         except Exception as e:
-            cmd.fail('text="nub port must be an integer, not %s"' % (port))
+            cmd.fail(qKV('text', "nub port must be an integer, not %s" % (port)))
             return
 
         try:
-            cmd.inform('text=%s' % (CPL.qstr("(re-)starting nub %s (%s:%s) " % (nubName, hostname, port))))
+            cmd.inform(qKV('text', "(re-)starting nub %s (%s:%s) " % (nubName, hostname, port)))
             hub.startNub(nubName, hostname=hostname, port=port)
         except Exception as e:
-            cmd.warn('text=%s' % (CPL.qstr("failed to start nub %s: %s" % (nubName, e))))
+            cmd.warn(qKV('text', "failed to start nub %s: %s" % (nubName, e)))
 
         cmd.finish('')
 
@@ -233,7 +346,8 @@ class hubCommands(InternalCmd.InternalCmd):
                 nub = g.actors[n]
                 nub.statusCmd(cmd, doFinish=False)
             except Exception as e:
-                cmd.warn('text=%s' % (CPL.qstr("failed to query actor %s: %s" % (n, e))))
+                cmd.warn(qKV('text', "failed to query actor %s: %s" % (n, e)))
+        g.pendingCommands.genKeys(cmd)
 
         cmd.finish('')
 
@@ -250,7 +364,7 @@ class hubCommands(InternalCmd.InternalCmd):
                 nub = g.actors[n]
                 nub.listCommandsCmd(cmd, doFinish=False)
             except Exception as e:
-                cmd.warn('text=%s' % (CPL.qstr("failed to query actor %s: %s" % (n, e))))
+                cmd.warn(qKV('text', "failed to query actor %s: %s" % (n, e)))
 
         cmd.finish('')
 
@@ -267,7 +381,7 @@ class hubCommands(InternalCmd.InternalCmd):
             hub.loadWords(words)
         except Exception as e:
             CPL.tback('hub.loadWords', e)
-            cmd.fail('text=%s' % (CPL.qstr(e)))
+            cmd.fail(qKV('text', e))
             return
         
         if finish:
@@ -283,26 +397,63 @@ class hubCommands(InternalCmd.InternalCmd):
         
         words = cmd.cmd.split()
         if len(words) < 3:
-            cmd.fail('text="usage: getKeys srcName key1 [key2 ... keyN]"')
+            cmd.fail(qKV('text', "usage: getKeys srcName key1 [key2 ... keyN]"))
             return
         
         src = words[1]
         keys = words[2:]
         
-        matched, unmatched = g.KVs.getValues(src, keys)
-        CPL.log("hub.getKeys", "matched=%s unmatched=%s" % (matched, unmatched))
-        for k, v in matched.items():
-            kvString = kvAsASCII(k, v)
-            cmd.inform(kvString, src="hub.%s" % (src))
+        matched, unmatched = g.KVs.getEncodedValues(src, keys)
+        CPL.log("hub.getKeys", "matched=%s unmatched=%s" % (list(matched.keys()), unmatched))
+        if matched:
+            cmd.inform(matched, src="hub.%s" % (src))
         if unmatched:
-            cmd.warn("text=%s" % (CPL.qstr("unmatched %s keys: %s" % (src, ', '.join(unmatched)))))
+            cmd.warn(qKV('text', "unmatched %s keys: %s" % (src, ', '.join(unmatched))))
         cmd.finish('')
 
+    def wire(self, cmd):
+        """ Switch the cmd's commander between ASCII lines and binary frames.
+
+        wire binary|ascii
+
+        The replies to this command are already sent in the new protocol. Binary frames
+        always start with a 0 byte, and ASCII lines never do, so the commander can tell
+        which is which. Commands can always be sent either way.
+        """
+
+        args = cmd.cmd.split()[1:]
+        if len(args) != 1 or args[0] not in ('binary', 'ascii'):
+            cmd.fail(qKV('cmdError', "usage: wire binary|ascii"))
+            return
+
+        cmdr = cmd.cmdr()
+        if not cmdr:
+            cmd.fail(qKV('text', "cannot find the commander for %s" % (cmd)))
+            return
+        if not isinstance(cmdr.encoder, ASCIIReplyEncoder) or not isinstance(cmdr.decoder, ASCIICmdDecoder):
+            cmd.fail(qKV('text', "the %s connection cannot change its protocol" % (cmdr.name)))
+            return
+
+        binary = args[0] == 'binary'
+        if binary:
+            cmdr.useWireCodecs()
+
+        if isinstance(cmdr.encoder, WireReplyEncoder):
+            cmdr.encoder.setBinary(binary)
+        cmd.finish(kv('wire', args[0]))
+
     def reallyReallyRestart(self, cmd):
-        """ Restart the entire MC. Which among other things kills us now. """
+        """ Restart the entire MC. Which among other things kills us now.
+
+        Unless the connections are handed over to the new hub, in which case they are kept.
+        """
+
+        if CPL.cfg.get('hub', 'handoverRestart', True):
+            cmd.inform(qKV('text', 'Restarting the hub now; your connection will be handed over.'))
+            hub.restart(cmd=cmd)
+            return
 
-        cmd.warn('text=%s' % \
-                 (CPL.qstr('Restarting the hub now... bye, bye, and please call back soon!')))
+        cmd.warn(qKV('text', 'Restarting the hub now... bye, bye, and please call back soon!'))
 
         # Give the poller a chance to flush out the warning.
         g.poller.callMeIn(hub.restart, 1.0)
@@ -314,7 +465,7 @@ class hubCommands(InternalCmd.InternalCmd):
         args = args[1:]
 
         if len(args) != 1:
-            cmd.fail('cmdError="usage: relog filename"')
+            cmd.fail(qKV('cmdError', "usage: relog filename"))
             return
 
         filename = args[0]
@@ -327,5 +478,5 @@ class hubCommands(InternalCmd.InternalCmd):
         sys.stderr = os.fdopen(2, "w", 1)
         f.close()
 
-        cmd.finish('text="Jeebus, you done it now, whatever it was"')
+        cmd.finish(qKV('text', "Jeebus, you done it now, whatever it was"))
 
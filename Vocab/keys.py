@@ -1,8 +1,8 @@
 __all__ = ['keys']
 
 import CPL
+from Hub.Reply.KVBuilder import kv, qKV
 from Vocab.InternalCmd import InternalCmd
-from Hub.KV.KVDict import kvAsASCII
 import g
 
 class keys(InternalCmd):
@@ -32,29 +32,25 @@ class keys(InternalCmd):
         try:
             actor = matched['getFor']
         except KeyError:
-            cmd.fail('keysTxt="no actor specified"')
+            cmd.fail(qKV('keysTxt', "no actor specified"))
             return
 
         try:
             g.KVs.sources[actor]
         except KeyError:
-            cmd.fail('keysTxt="actor %s is not connected"' % (actor))
+            cmd.fail(qKV('keysTxt', "actor %s is not connected" % (actor)))
             return
 
         keys = list(leftovers.keys())
         CPL.log("keys.getFor", "matched=%s; unmatched=%s; leftovers=%s" % (matched, unmatched, leftovers))
         
-        matchedKeys, unmatchedKeys = g.KVs.getValues(actor, keys)
+        matchedKeys, unmatchedKeys = g.KVs.getEncodedValues(actor, keys)
         if unmatchedKeys:
-            failed = [CPL.qstr(x) for x in unmatchedKeys]
-            cmd.warn('unmatchedKeys=%s' % (','.join(failed)), bcast=False)
+            cmd.warn(kv('unmatchedKeys', unmatchedKeys, quote=True), bcast=False)
 
-        values = []
-        for k, v in matchedKeys.items():
-            values.append(kvAsASCII(k, v))
-
-        if values:
-            cmd.inform("; ".join(values), noRegister=True, src="keys_%s" % (actor), bcast=False, debug=9)
+        # Pass the values straight through: the encoders use the KVDict's cached encodings.
+        if matchedKeys:
+            cmd.inform(matchedKeys, noRegister=True, src="keys_%s" % (actor), bcast=False, debug=9)
         if finish:
             cmd.finish(bcast=False)
         
@@ -5,6 +5,7 @@ import os
 
 import CPL
 from Hub.KV.KVDict import *
+from Hub.Reply.KVBuilder import qKV
 from Vocab.InternalCmd import *
 import g
 import hub
@@ -59,12 +60,12 @@ class perms(InternalCmd):
     
     def hackOn(self, cmd, finish=True):
         g.perms.hackOn = True
-        cmd.warn('permsTxt="permissions are now disabled"')
+        cmd.warn(qKV('permsTxt', "permissions are now disabled"))
         cmd.finish()
         
     def hackOff(self, cmd, finish=True):
         g.perms.hackOn = False
-        cmd.warn('permsTxt="permissions are now in effect"')
+        cmd.warn(qKV('permsTxt', "permissions are now in effect"))
         cmd.finish()
         
     def status(self, cmd, finish=True):
@@ -147,7 +148,7 @@ class perms(InternalCmd):
 
         args = list(cmd.argDict.keys())[1:]
         if len(args) == 0:
-            cmd.fail('text="perms register requires one or more program names"')
+            cmd.fail(qKV('text', "perms register requires one or more program names"))
             return
         
         if len(args) == 1 and args[0] == '*':
@@ -170,7 +171,7 @@ class perms(InternalCmd):
 
         args = list(cmd.argDict.keys())[1:]
         if len(args) == 0:
-            cmd.fail('text="perms unregister requires one or more program names"')
+            cmd.fail(qKV('text', "perms unregister requires one or more program names"))
             return
 
         if len(args) == 1 and args[0] == '*':
@@ -196,7 +197,7 @@ class perms(InternalCmd):
         try:
             program = matched['program']
         except KeyError:
-            cmd.fail('authTxt="no program specified"')
+            cmd.fail(qKV('authTxt', "no program specified"))
             return
 
         g.perms.setActorsForProgram(program, leftovers, cmd=cmd)
@@ -218,7 +219,7 @@ class perms(InternalCmd):
         try:
             program = matched['program']
         except KeyError:
-            cmd.fail('authTxt="no program specified"')
+            cmd.fail(qKV('authTxt', "no program specified"))
             return
 
         g.perms.addActorsToProgram(program, leftovers, cmd=cmd)
@@ -239,7 +240,7 @@ class perms(InternalCmd):
         try:
             program = matched['program']
         except KeyError:
-            cmd.fail('authTxt="no program specified"')
+            cmd.fail(qKV('authTxt', "no program specified"))
             return
 
         g.perms.dropActorsFromProgram(program, leftovers, cmd=cmd)
@@ -0,0 +1,607 @@
+#!/usr/bin/env python
+
+""" benchHub.py -- time some of the hub's internal paths, without any real connections.
+
+    Runs a hub against a throwaway configuration and log directory. Usage:
+
+        benchHub.py [-n N] [benchmark ...]
+
+    With no benchmark names, run them all.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+tronDir = os.environ.setdefault('TRON_TRON_DIR',
+                                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, tronDir)
+
+def setup():
+    """ Create a minimal configuration, and initialize the hub from it. """
+
+    cfgDir = tempfile.mkdtemp(prefix='benchHub')
+    with open(os.path.join(cfgDir, 'hub.py'), 'w') as cfgFile:
+        cfgFile.write("""
+logDir = %r
+passwordFile = %r
+vocabulary = ('hub', 'keys', 'msg')
+listeners = ()
+actors = {}
+httpHost = 'localhost'
+httpRoot = '/'
+""" % (os.path.join(cfgDir, 'logs'), os.path.join(cfgDir, 'passwords')))
+    open(os.path.join(cfgDir, 'passwords'), 'w').close()
+    os.environ['CONFIG_DIR'] = cfgDir
+
+    import hub
+    hub.init()
+
+def report(name, n, dt, note=''):
+    print("%-40s %8d %10.3fs %10.2fus/op %s" % (name, n, dt, 1e6 * dt / n, note))
+
+def makeCommander(name):
+    """ Create a CommanderNub with no connection. """
+
+    import g
+    from Hub.Command.Decoders.ASCIICmdDecoder import ASCIICmdDecoder
+    from Hub.Reply.Encoders.ASCIIReplyEncoder import ASCIIReplyEncoder
+    from Hub.Nub.Commanders import CommanderNub
+
+    d = ASCIICmdDecoder(needCID=False, EOL='\n', name=name)
+    e = ASCIIReplyEncoder(EOL='\n', simple=True, CIDfirst=True)
+    return CommanderNub(g.poller, name=name, encoder=e, decoder=d)
+
+def benchCommanders(n):
+    """ Connect, name, look up and reconnect n commanders. """
+
+    import g
+    import hub
+    from Hub.Command.Command import Command
+
+    # What hub.validateCommanderNames() and Command.cmdr() used to do.
+    def linearName(fullName):
+        i = 2
+        proposedName = fullName
+        while True:
+            for c in g.commanders.values():
+                if c.name == proposedName:
+                    break
+            else:
+                return proposedName
+            proposedName = "%s_%d" % (fullName, i)
+            i += 1
+    def linearCmdr(name):
+        for c in list(g.commanders.values()):
+            if c.name == name:
+                return c
+        return None
+
+    nubs = [makeCommander('bench_%d' % (i)) for i in range(n)]
+
+    t0 = time.time()
+    for nub in nubs:
+        hub.addCommander(nub)
+    report('commanders: add', n, time.time() - t0, '(includes the Commanders keyword)')
+
+    t0 = time.time()
+    for nub in nubs:
+        nub.setNames('TUI', 'user')
+    report('commanders: setNames, one base name', n, time.time() - t0)
+    assert len(set([nub.name for nub in nubs])) == n
+
+    cmds = [Command(nub.ID, '0', 1, 'hub', 'status', bcastCmdInfo=False) for nub in nubs]
+    t0 = time.time()
+    for cmd in cmds:
+        assert cmd.cmdr().name == cmd.cmdrName
+    report('commanders: Command.cmdr()', n, time.time() - t0)
+
+    nRef = min(n, 200)
+    t0 = time.time()
+    for cmd in cmds[-nRef:]:
+        linearCmdr(cmd.cmdrName)
+    report('commanders: old linear cmdr()', nRef, time.time() - t0)
+
+    t0 = time.time()
+    for i in range(nRef):
+        hub.validateCommanderNames(None, 'TUI', 'user')
+    report('commanders: name allocation', nRef, time.time() - t0)
+    t0 = time.time()
+    for i in range(nRef // 10):
+        linearName('TUI.user')
+    report('commanders: old linear name allocation', nRef // 10, time.time() - t0)
+
+    # Reconnect storm: drop every other commander, and have new ones take their names.
+    dropped = nubs[::2]
+    t0 = time.time()
+    for nub in dropped:
+        hub.dropCommander(nub, doShutdown=False)
+    newNubs = [makeCommander('bench_new_%d' % (i)) for i in range(len(dropped))]
+    for nub in newNubs:
+        hub.addCommander(nub)
+        nub.setNames('TUI', 'user')
+    report('commanders: drop+reconnect half', len(dropped), time.time() - t0)
+    assert sorted([nub.name for nub in newNubs]) == sorted([nub.name for nub in dropped])
+
+    for nub in nubs[1::2] + newNubs:
+        hub.dropCommander(nub, doShutdown=False)
+
+def makeActor(name):
+    """ Create an ActorNub with no connection. """
+
+    import g
+    from Hub.Command.Encoders.ASCIICmdEncoder import ASCIICmdEncoder
+    from Hub.Reply.Decoders.ASCIIReplyDecoder import ASCIIReplyDecoder
+    from Hub.Nub.ActorNub import ActorNub
+
+    d = ASCIIReplyDecoder()
+    e = ASCIICmdEncoder(sendCommander=True, useCID=False)
+    return ActorNub(g.poller, name=name, encoder=e, decoder=d)
+
+def objectSize(obj):
+    """ Return the size of an object and of any instance dictionary. """
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def benchAlloc(n):
+    """ Measure the memory used by n command round trips: a commander sends a command
+    to an actor, which replies with a keyword and then finishes the command. """
+
+    import gc
+    import tracemalloc
+
+    import hub
+    from Hub.Command.Command import Command
+    from Hub.Reply.Reply import Reply
+
+    cmdr = makeCommander('bench.alloc')
+    cmdr.taster.addToFilter(('*',), (), ('*',))
+    hub.addCommander(cmdr)
+    actor = makeActor('benchActor')
+    hub.addActor(actor)
+
+    def roundTrip(i):
+        cmdr.copeWithInput('%d benchActor doit %d\n' % (i, i))
+        actor.copeWithInput('0 %d i value=%d\n0 %d :\n' % (actor.mid - 1, i, actor.mid - 1))
+        del cmdr.outQueue[:]
+        del actor.outQueue[:]
+
+    for i in range(100):
+        roundTrip(i)
+
+    cmd = Command(cmdr.ID, '0', 1, 'benchActor', 'doit', bcastCmdInfo=False)
+    reply = Reply(cmd, 'i', 'value=1')
+    print("Command instance: %d bytes, Reply instance: %d bytes" % (objectSize(cmd),
+                                                                   objectSize(reply)))
+    del cmd, reply
+
+    gc.collect()
+    t0 = time.time()
+    for i in range(n):
+        roundTrip(i)
+    report('alloc: round trip', n, time.time() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    blocks0 = sys.getallocatedblocks()
+    size0, peak0 = tracemalloc.get_traced_memory()
+    peaks = 0
+    for i in range(n):
+        tracemalloc.reset_peak()
+        size1, peak1 = tracemalloc.get_traced_memory()
+        roundTrip(i)
+        size2, peak2 = tracemalloc.get_traced_memory()
+        peaks += peak2 - size1
+    size3, peak3 = tracemalloc.get_traced_memory()
+    blocks1 = sys.getallocatedblocks()
+    tracemalloc.stop()
+    gc.collect()
+    blocks2 = sys.getallocatedblocks()
+    print("alloc: per round trip: %d bytes peak, %d bytes and %d blocks retained before gc, %d blocks after gc" % \
+          (peaks // n, (size3 - size0) // n, (blocks1 - blocks0) // n, (blocks2 - blocks0) // n))
+
+    # Now measure what each command costs while it is in flight.
+    #
+    gc.collect()
+    tracemalloc.start()
+    blocks0 = sys.getallocatedblocks()
+    size0, peak0 = tracemalloc.get_traced_memory()
+    mids = []
+    for i in range(n):
+        cmdr.copeWithInput('%d benchActor doit %d\n' % (i, i))
+        mids.append(actor.mid - 1)
+        actor.copeWithInput('0 %d i value=%d\n' % (actor.mid - 1, i))
+        del cmdr.outQueue[:]
+        del actor.outQueue[:]
+    size1, peak1 = tracemalloc.get_traced_memory()
+    blocks1 = sys.getallocatedblocks()
+    tracemalloc.stop()
+    print("alloc: per command in flight: %d bytes, %d blocks" % ((size1 - size0) // n,
+                                                                 (blocks1 - blocks0) // n))
+    for mid in mids:
+        actor.copeWithInput('0 %d :\n' % (mid))
+    del cmdr.outQueue[:]
+
+    hub.dropCommander(cmdr, doShutdown=False)
+    hub.dropActor(actor)
+
+def benchKeys(n):
+    """ Answer n "keys getFor" queries for 50 keys, with the old format-and-reparse path and
+    with the cached encodings. """
+
+    import g
+    import hub
+    from Hub.KV.KVDict import kvAsASCII
+    from Hub.Reply.Reply import Reply
+
+    cmdr = makeCommander('bench.keys')
+    hub.addCommander(cmdr)
+    actor = makeActor('benchKeys')
+    hub.addActor(actor)
+
+    nKeys = 50
+    actor.copeWithInput('0 0 i %s\n' % ('; '.join(['key%d=%d,"some text %d",%0.4f' % (i, i, i, i * 0.1)
+                                                   for i in range(nKeys)])))
+    keyNames = ['key%d' % (i) for i in range(nKeys)]
+    enc = cmdr.encoder
+    cmd = g.hubcmd
+
+    t0 = time.time()
+    for i in range(n):
+        matched, unmatched = g.KVs.getValues('benchKeys', keyNames)
+        s = "; ".join([kvAsASCII(k, v) for k, v in matched.items()])
+        r = Reply(cmd, 'i', s, src='keys_benchKeys')
+        enc.encode(r, cmdr)
+    report('keys: format+parse+encode', n, time.time() - t0)
+
+    t0 = time.time()
+    for i in range(n):
+        matched, unmatched = g.KVs.getEncodedValues('benchKeys', keyNames)
+        r = Reply(cmd, 'i', matched, src='keys_benchKeys')
+        enc.encode(r, cmdr)
+    report('keys: cached encodings', n, time.time() - t0)
+
+    hub.dropCommander(cmdr, doShutdown=False)
+    hub.dropActor(actor)
+
+def benchParseCache(n):
+    """ Parse n reply lines, drawn from a small set of repeated lines, with and without the cache. """
+
+    import Parsing
+    from Parsing.keys import sampleLines
+
+    lines = [sampleLines[i % len(sampleLines)] for i in range(n)]
+
+    t0 = time.time()
+    for line in lines:
+        Parsing.parseKVs(line)
+    report('parseCache: parseKVs', n, time.time() - t0)
+
+    cache = Parsing.ParseCache(Parsing.parseKVs, name='bench')
+    t0 = time.time()
+    for line in lines:
+        cache.parse(line)
+    report('parseCache: cached parseKVs', n, time.time() - t0,
+           '(%d hits, %d misses)' % (cache.hits, cache.misses))
+
+def benchReplies(n):
+    """ Build n sets of the hub's per-command diagnostic replies by formatting and reparsing
+    strings, and with the KV builder. Then time n "hub actors" commands end to end. """
+
+    import CPL
+    import g
+    import hub
+    from Hub.Reply.KVBuilder import kv, qKV
+    from Hub.Reply.Reply import Reply
+
+    cmd = g.hubcmd
+    names = sorted(g.actors.keys())
+
+    t0 = time.time()
+    for i in range(n):
+        Reply(cmd, 'd', 'CmdIn=%s,%s,%s' % (CPL.qstr('bench.me'), CPL.qstr('hub'), CPL.qstr('actors')))
+        Reply(cmd, 'd', 'CmdQueued=%d,%0.2f,%s,%d,%s,%d,%s' % (i, time.time(), CPL.qstr('bench.me'), i,
+                                                                CPL.qstr('hub'), 0, CPL.qstr('actors')))
+        Reply(cmd, 'i', 'Actors=%s' % (','.join([CPL.qstr(x) for x in names])))
+        Reply(cmd, 'w', 'text=%s' % (CPL.qstr('command %d took too long' % (i))))
+        Reply(cmd, 'd', 'CmdDone=%d,%s' % (i, CPL.qstr(':')))
+    report('replies: format+parse', n, time.time() - t0, '(5 replies each)')
+
+    t0 = time.time()
+    for i in range(n):
+        Reply(cmd, 'd', kv('CmdIn', ('bench.me', 'hub', 'actors'), quote=True))
+        Reply(cmd, 'd', kv('CmdQueued', (i, '%0.2f' % (time.time()), CPL.qstr('bench.me'), i,
+                                         CPL.qstr('hub'), 0, CPL.qstr('actors'))))
+        Reply(cmd, 'i', kv('Actors', names, quote=True))
+        Reply(cmd, 'w', qKV('text', 'command %d took too long' % (i)))
+        Reply(cmd, 'd', kv('CmdDone', i).addQuoted('flag', ':'))
+    report('replies: KV builder', n, time.time() - t0, '(5 replies each)')
+
+    cmdr = makeCommander('bench.replies')
+    hub.addCommander(cmdr)
+    t0 = time.time()
+    for i in range(n):
+        cmdr.copeWithInput('%d hub actors\n' % (i))
+        del cmdr.outQueue[:]
+    report('replies: "hub actors" commands', n, time.time() - t0)
+    hub.dropCommander(cmdr, doShutdown=False)
+
+def benchBinary(n):
+    """ Decode and save 4MB and 8MB binary protocol image frames, arriving in 64kB reads. """
+
+    import testBinaryDecoder
+
+    nFrames = max(1, n // 500)
+    for xpix, ypix in (2048, 1024), (2048, 2048):
+        testBinaryDecoder.benchmark(nFrames=nFrames, xpix=xpix, ypix=ypix)
+
+def benchWire(n):
+    """ Time the wire format against ASCII, on its own and end to end: n status replies from an
+    actor, relayed to 10 listening commanders. """
+
+    import collections
+    import random
+
+    import hub
+    from Hub.KV import WireFormat
+    from Hub.KV.KVDict import kvAsASCII
+    from Hub.Command.Encoders.WireCmdEncoder import WireCmdEncoder
+    from Hub.Reply.Decoders.WireReplyDecoder import WireReplyDecoder
+    from Hub.Reply.Encoders.WireReplyEncoder import WireReplyEncoder
+
+    WireFormat.benchmark(n=n)
+
+    rng = random.Random(1)
+    replies = []
+    for i in range(n):
+        x = rng.uniform(0, 360)
+        KVs = collections.OrderedDict()
+        KVs['TCCPos'] = (repr(x), repr(x / 3.0), '45.0')
+        KVs['AxePos'] = (repr(x + 1), repr(x / 7.0), str(i))
+        KVs['SecFocus'] = str(i)
+        KVs['TCCStatus'] = ('"TTT"', '"NNN"')
+        replies.append(KVs)
+
+    for proto in 'ascii', 'wire':
+        actor = makeActor('benchWire')
+        if proto == 'wire':
+            actor.encoder = WireCmdEncoder(sendCommander=True, useCID=False, binary=True)
+            actor.decoder = WireReplyDecoder(encoder=actor.encoder)
+            writer = WireFormat.WireWriter()
+            inputs = [writer.packReply('0', '0', '', 'i', KVs).decode('latin-1') for KVs in replies]
+        else:
+            inputs = ['0 0 i %s\n' % ('; '.join([kvAsASCII(k, v) for k, v in KVs.items()])) for KVs in replies]
+        hub.addActor(actor)
+
+        cmdrs = []
+        for i in range(10):
+            cmdr = makeCommander('bench.wire%d' % (i))
+            cmdr.taster.addToFilter(['benchWire'], [], ['benchWire'])
+            if proto == 'wire':
+                cmdr.encoder = WireReplyEncoder(EOL='\n', simple=True, CIDfirst=True, binary=True)
+            hub.addCommander(cmdr)
+            cmdrs.append(cmdr)
+
+        nBytes = 0
+        t0 = time.time()
+        for s in inputs:
+            actor.copeWithInput(s)
+            for cmdr in cmdrs:
+                nBytes += sum(map(len, cmdr.outQueue))
+                del cmdr.outQueue[:]
+        report('wire: %s replies to 10 commanders' % (proto), n, time.time() - t0,
+               '(%0.1f bytes out per reply)' % (nBytes / n))
+
+        for cmdr in cmdrs:
+            hub.dropCommander(cmdr, doShutdown=False)
+        hub.dropActor(actor)
+
+def benchPyReplies(n):
+    """ Encode n replies for 10 python commanders, and decode them, as pickles and as shared full reply frames. """
+
+    import g
+    from Hub.Reply.Reply import Reply
+    from Hub.Reply.Encoders.PyReplyEncoder import PyReplyEncoder
+    from Hub.Reply.Decoders.PyReplyDecoder import PyReplyDecoder
+
+    replies = [Reply(g.hubcmd, 'i', 'TCCPos=%0.6f,%0.6f,45.0; SecFocus=%d; TCCStatus="TTT","NNN"' % (i * 0.1, i * 0.2, i))
+               for i in range(n)]
+
+    for usePickle in True, False:
+        what = 'pickle' if usePickle else 'frames'
+        encoders = [PyReplyEncoder(pickle=usePickle) for i in range(10)]
+        t0 = time.time()
+        for r in replies:
+            for e in encoders:
+                encoded = e.encode(r, None)
+        report('pyReplies: %s encode for 10' % (what), n, time.time() - t0)
+
+        decoder = PyReplyDecoder(pickle=usePickle)
+        data = encoded.decode('latin-1')
+        t0 = time.time()
+        for i in range(n):
+            decoder.decode('', data)
+        report('pyReplies: %s decode' % (what), n, time.time() - t0, '(%d bytes)' % (len(encoded)))
+
+def benchJSON(n):
+    """ Time JSON lines against ASCII end to end: n status replies from an actor, relayed to 100
+    listening commanders. """
+
+    import collections
+    import random
+
+    import hub
+    from Hub.KV.KVDict import kvAsASCII
+    from Hub.Reply.Encoders.JSONReplyEncoder import JSONReplyEncoder
+
+    rng = random.Random(1)
+    inputs = []
+    for i in range(n):
+        x = rng.uniform(0, 360)
+        KVs = collections.OrderedDict()
+        KVs['TCCPos'] = (repr(x), repr(x / 3.0), '45.0')
+        KVs['AxePos'] = (repr(x + 1), repr(x / 7.0), str(i))
+        KVs['SecFocus'] = str(i)
+        KVs['TCCStatus'] = ('"TTT"', '"NNN"')
+        inputs.append('0 0 i %s\n' % ('; '.join([kvAsASCII(k, v) for k, v in KVs.items()])))
+
+    for proto in 'ascii', 'json':
+        actor = makeActor('benchJSON')
+        hub.addActor(actor)
+
+        cmdrs = []
+        for i in range(100):
+            cmdr = makeCommander('bench.json%d' % (i))
+            cmdr.taster.addToFilter(['benchJSON'], [], ['benchJSON'])
+            if proto == 'json':
+                cmdr.encoder = JSONReplyEncoder(name=cmdr.name)
+            hub.addCommander(cmdr)
+            cmdrs.append(cmdr)
+
+        nBytes = 0
+        t0 = time.time()
+        for s in inputs:
+            actor.copeWithInput(s)
+            for cmdr in cmdrs:
+                nBytes += sum(map(len, cmdr.outQueue))
+                del cmdr.outQueue[:]
+        report('json: %s replies to 100 commanders' % (proto), n, time.time() - t0,
+               '(%0.1f bytes out per reply)' % (nBytes / n))
+
+        for cmdr in cmdrs:
+            hub.dropCommander(cmdr, doShutdown=False)
+        hub.dropActor(actor)
+
+def benchPerms(n):
+    """ Check n commands from each of 50 programs to each of 20 actors, with and without the
+    cached access decisions. """
+
+    import re
+
+    from Auth import Auth
+
+    class BenchActor(object):
+        def __init__(self, name):
+            self.name = name
+            self.needsAuth = name
+            self.safeCmds = re.compile(r'^\s*(status|ping)\s*$')
+
+    class BenchCmd(object):
+        def __init__(self, cmd):
+            self.cmd = cmd
+        def inform(self, *args, **argv):
+            pass
+        warn = fail = inform
+
+    auth = Auth(BenchCmd(None))
+    actors = [BenchActor('actor%02d' % (i)) for i in range(20)]
+    auth.addActors([a.name for a in actors])
+    programs = ['PROG%02d' % (i) for i in range(50)]
+    for i, prog in enumerate(programs):
+        auth.addPrograms([prog], [a.name for a in actors[i % 3::3]])
+
+    cmdrs = ['%s.user' % (p) for p in programs]
+    cmds = [BenchCmd('status'), BenchCmd('expose object itime=10'), BenchCmd('expose object itime=20')]
+    nChecks = n * len(cmdrs) * len(actors)
+
+    for cached in True, False:
+        t0 = time.time()
+        for i in range(n):
+            cmd = cmds[i % len(cmds)]
+            for cmdr in cmdrs:
+                for actor in actors:
+                    if not cached:
+                        auth.invalidate()
+                        auth.safeCmds.clear()
+                    auth.checkAccess(cmdr, actor, cmd)
+        dt = time.time() - t0
+        report('perms: %s checks' % ('cached' if cached else 'uncached'), nChecks, dt,
+               '(%0.0f checks/s)' % (nChecks / dt))
+
+def benchLogins(n):
+    """ Log in 200 commanders at once, as when every TUI reconnects after a restart: all the
+    knockKnocks, then all the logins. With and without rereading the password file each time. """
+
+    import hashlib
+
+    import CPL
+    import g
+    import hub
+    from Hub.Command.Decoders.ASCIICmdDecoder import ASCIICmdDecoder
+    from Hub.Reply.Encoders.ASCIIReplyEncoder import ASCIIReplyEncoder
+    from Hub.Nub.Commanders import AuthCommanderNub
+
+    with open(CPL.cfg.get('hub', 'passwordFile'), 'w') as pw_f:
+        pw_f.write("# bench\n")
+        for i in range(50):
+            pw_f.write("PROG%02d  secret%d\n" % (i, i))
+        pw_f.write("BENCH  benchPassword\n")
+
+    nLogins = 200
+    rounds = max(1, n // 200)
+    for reread in False, True:
+        dt = 0.0
+        for r in range(rounds):
+            cmdrs = []
+            for i in range(nLogins):
+                d = ASCIICmdDecoder(needCID=False, EOL='\n', name='bench.login')
+                e = ASCIIReplyEncoder(EOL='\n', simple=True, CIDfirst=True)
+                cmdr = AuthCommanderNub(g.poller, name='bench.login%d' % (i), encoder=e, decoder=d)
+                hub.addCommander(cmdr)
+                cmdrs.append(cmdr)
+
+            t0 = time.time()
+            for cmdr in cmdrs:
+                cmdr.copeWithInput('1 auth knockKnock\n')
+            for i, cmdr in enumerate(cmdrs):
+                if reread:
+                    g.passwords.forget()
+                pw = hashlib.sha1((cmdr.nonce + 'benchPassword').encode('latin-1')).hexdigest()
+                cmdr.copeWithInput('2 auth login program="BENCH" username="user%d" password="%s"\n' % (i, pw))
+            dt += time.time() - t0
+
+            loggedIn = len([c for c in cmdrs if c.state == c.CONNECTED])
+            assert loggedIn == nLogins, "only %d of %d commanders logged in" % (loggedIn, nLogins)
+            for cmdr in cmdrs:
+                hub.dropCommander(cmdr, doShutdown=False)
+
+        report('logins: %d at once, %s' % (nLogins, 'rereading' if reread else 'cached'), rounds, dt,
+               '(per %d logins)' % (nLogins))
+
+benchmarks = dict(commanders=benchCommanders,
+                  alloc=benchAlloc,
+                  keys=benchKeys,
+                  parseCache=benchParseCache,
+                  replies=benchReplies,
+                  binary=benchBinary,
+                  wire=benchWire,
+                  pyReplies=benchPyReplies,
+                  json=benchJSON,
+                  perms=benchPerms,
+                  logins=benchLogins)
+
+def main():
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [-n N] [benchmark ...]")
+    parser.add_option("-n", dest="n", type="int", default=2000,
+                      help="how many objects to use in each benchmark")
+    opts, args = parser.parse_args()
+
+    names = args if args else sorted(benchmarks.keys())
+    for name in names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark %s; known ones are: %s" % (name, ', '.join(sorted(benchmarks.keys()))))
+
+    setup()
+    for name in names:
+        benchmarks[name](opts.n)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+""" testBinaryDecoder.py -- check and time the BinaryReplyDecoder, without any real connections.
+
+    Checks the decoder's checksums, packet splitting and image handling against the original
+    algorithms, then times it. Usage:
+
+        testBinaryDecoder.py
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+tronDir = os.environ.setdefault('TRON_TRON_DIR',
+                                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, tronDir)
+
+import g
+import CPL
+from Hub.Reply.Decoders.BinaryReplyDecoder import BinaryReplyDecoder
+from Hub.Reply.FITSWriter import FITSWriter
+
+def makePacket(mid, cid, msg=None, image=None, xpix=0, ypix=0, bitpix=16):
+    """ Return a complete binary protocol packet, holding either a reply line or an image. """
+
+    if image is None:
+        body = msg.encode('latin-1')
+        isFile = 0
+    else:
+        body = struct.pack('>hhh', xpix, ypix, bitpix) + bytes(image)
+        isFile = 2
+
+    csum = 0
+    if body:
+        csum = int(np.bitwise_xor.reduce(np.frombuffer(body, dtype=np.uint8)))
+    return struct.pack('>BBihh', 1, isFile, len(body), cid, mid) + body + struct.pack('>BB', csum, 4)
+
+def _oldChecksum(buf, start, end):
+    my_csum = 0
+    for i in range(start, end):
+        my_csum ^= buf[i]
+    return my_csum
+
+def _oldFiddle(image, byteSwapFirst, signFlip, byteSwapLast):
+    """ What the pixel16 routines did to 16-bit native pixels. """
+
+    pixels = list(struct.unpack('=%dH' % (len(image) // 2), image))
+    swap = lambda p: ((p & 0xff) << 8) | (p >> 8)
+    if byteSwapFirst:
+        pixels = [swap(p) for p in pixels]
+    if signFlip:
+        pixels = [p ^ 0x8000 for p in pixels]
+    if byteSwapLast:
+        pixels = [swap(p) for p in pixels]
+    return struct.pack('=%dH' % (len(pixels)), *pixels)
+
+class _TestNub(object):
+    """ Just enough of an ActorNub to drive a decoder: input in, replies out. """
+
+    def __init__(self, decoder):
+        self.name = decoder.nubID
+        self.decoder = decoder
+        self.poller = g.poller
+        self.in_fd, self.wfd = os.pipe()
+        self.inputBuffer = ''
+        self.replies = []
+        g.actors[self.name] = self
+        self.poller.addInput(self)
+
+    def getInputFd(self):
+        return self.in_fd
+
+    def isReading(self):
+        return self.in_fd in self.poller.files and 'inputHandler' in self.poller.files[self.in_fd]
+
+    def copeWithInput(self, s):
+        while True:
+            reply, self.inputBuffer = self.decoder.decode(self.inputBuffer, s)
+            s = None
+            if reply is None:
+                break
+            self.replies.append(reply)
+
+    def close(self):
+        self.poller.removeInput(self)
+        os.close(self.in_fd)
+        os.close(self.wfd)
+        del g.actors[self.name]
+
+def _runTimers(poller):
+    """ Call the poller's expired timers, as its loop would. """
+
+    while poller.timedCallbacks and poller.timedCallbacks[0][0] <= time.time():
+        poller.cbLock.acquire()
+        timer = poller.timedCallbacks.pop(0)[2]
+        poller.cbLock.release()
+        timer['callback'](timer)
+
+def _setupGlobals():
+    """ Create the hub globals we need, if we are not running inside a hub. """
+
+    import IO
+    from Hub.KV.KVDict import KVDict
+
+    if not hasattr(g, 'poller'):
+        g.poller = IO.PollHandler()
+    if not hasattr(g, 'actors'):
+        g.actors = {}
+    if not hasattr(g, 'KVs'):
+        g.KVs = KVDict()
+
+def _makeDecoder(saveImages=False, **argv):
+    _setupGlobals()
+    scratchDir = tempfile.mkdtemp(prefix='binaryDecoder') if saveImages else None
+    d = BinaryReplyDecoder(scratchDir, **argv)
+    d.setNub('test')
+    return d
+
+def _decodeAll(decoder, data, chunkSize, paused=None):
+    """ Feed data to the decoder in chunkSize pieces, and return all the decoded replies.
+
+    Args:
+       paused  - if set, a list to append whether the decoder had paused its input to
+                 after each chunk.
+    """
+
+    nub = _TestNub(decoder)
+    try:
+        for i in range(0, len(data), chunkSize):
+            nub.copeWithInput(data[i:i + chunkSize])
+            if paused is not None:
+                paused.append(decoder.paused and not nub.isReading())
+
+        writer = decoder.writer
+        while decoder.held or writer.nQueued:
+            time.sleep(0.001)
+            _runTimers(nub.poller)
+    finally:
+        nub.close()
+
+    assert len(nub.inputBuffer) == 0, "%d bytes left over" % (len(nub.inputBuffer))
+    assert not decoder.paused, "decoder is still paused"
+    return nub.replies
+
+def testBinary(seed=None):
+    """ Check checksums, splitting and image handling against the original algorithms. """
+
+    import random
+
+    rng = random.Random(seed)
+    failures = 0
+    _setupGlobals()
+    writer = FITSWriter(g.poller, nThreads=2, maxQueued=2)
+
+    # Reply lines, with various chunkings of the input.
+    #
+    lines = ['i a=1', ': text="done"', 'w x=1,2,3; y="a;b"', '> ', 'f %s' % ('z' * 5000)]
+    data = b''.join([makePacket(i, 7, msg=l) for i, l in enumerate(lines)])
+    for chunkSize in (1, 3, 17, 1000, len(data)):
+        replies = _decodeAll(_makeDecoder(writer=writer), data, chunkSize)
+        got = [(r['mid'], r['cid'], r['flag'], r['rest'].strip()) for r in replies]
+        want = [(i, 7, l[0], l[1:].strip()) for i, l in enumerate(lines)]
+        if got != want:
+            print("MISMATCH: chunkSize=%d got=%r" % (chunkSize, got))
+            failures += 1
+
+    for i in range(200):
+        body = bytes([rng.randrange(256) for j in range(rng.randint(0, 300))])
+        buf = bytearray(b'0123456789' + body + b'cc')
+        if _makeDecoder().checksum(buf, 10, len(buf) - 2) != _oldChecksum(buf, 10, len(buf) - 2):
+            print("MISMATCH: checksum of %r" % (body))
+            failures += 1
+
+    # Images, with every combination of fiddling.
+    #
+    xpix, ypix = 37, 11
+    image = bytes([rng.randrange(256) for j in range(xpix * ypix * 2)])
+    for flags in range(8):
+        argv = dict(byteSwapFirst=bool(flags & 1), signFlip=bool(flags & 2), byteSwapLast=bool(flags & 4))
+        decoder = _makeDecoder(saveImages=True, writer=writer, **argv)
+        replies = _decodeAll(decoder, makePacket(3, 4, image=image, xpix=xpix, ypix=ypix), 100)
+        KVs = replies[0]['KVs']
+        with open(KVs['scratchFile'], 'rb') as f:
+            fits = f.read()
+        want = _oldFiddle(image, argv['byteSwapFirst'], argv['signFlip'], argv['byteSwapLast'])
+        if (KVs['xpix'], KVs['ypix'], KVs['bitpix']) != (str(xpix), str(ypix), '16') \
+                or len(fits) % 2880 != 0 or fits[2880:2880 + len(want)] != want:
+            print("MISMATCH: image with %r" % (argv))
+            failures += 1
+        shutil.rmtree(decoder.scratchDir)
+
+    # Replies stay in order behind the images, and with a full writer we stop reading
+    # until it catches up.
+    #
+    decoder = _makeDecoder(saveImages=True, writer=writer)
+    packets = []
+    for i in range(6):
+        packets.append(makePacket(i, 4, msg='i n=%d' % (i)))
+        packets.append(makePacket(i, 4, image=image, xpix=xpix, ypix=ypix))
+    packets.append(makePacket(6, 4, msg=': text="done"'))
+    paused = []
+    replies = _decodeAll(decoder, b''.join(packets), 500, paused=paused)
+    got = [(r['mid'], r['flag'], 'scratchFile' in r['KVs']) for r in replies]
+    want = [(i // 2, 'i', bool(i % 2)) for i in range(12)] + [(6, ':', False)]
+    if got != want or not any(paused):
+        print("MISMATCH: ordering/backpressure: got=%r paused=%r" % (got, paused))
+        failures += 1
+    files = [r['KVs']['scratchFile'] for r in replies if 'scratchFile' in r['KVs']]
+    if len(set(files)) != 6 or g.KVs.getKV('images', 'testFile') != files[-1]:
+        print("MISMATCH: image files %r, images.testFile=%r" % (files, g.KVs.getKV('images', 'testFile')))
+        failures += 1
+    shutil.rmtree(decoder.scratchDir)
+
+    # A failed write turns into a warning, still in order.
+    #
+    decoder = _makeDecoder(writer=writer)
+    decoder.scratchDir = '/nonexistent/binaryDecoder'
+    replies = _decodeAll(decoder, makePacket(1, 4, image=image, xpix=xpix, ypix=ypix) +
+                         makePacket(2, 4, msg=': '), 1000)
+    got = [(r['mid'], r['flag'], list(r['KVs'].keys())) for r in replies]
+    if got != [(1, 'w', ['xpix', 'ypix', 'bitpix', 'text']), (2, ':', [])]:
+        print("MISMATCH: failed write: got=%r" % (got))
+        failures += 1
+
+    print("binary decoder tests: %d failures" % (failures))
+    return failures == 0
+
+class _BenchWriter(FITSWriter):
+    """ A FITSWriter which can pretend to have slow disks, or save images from the poll loop
+    itself, as we used to. """
+
+    def __init__(self, poller, diskDelay=0.0, sync=False, **argv):
+        FITSWriter.__init__(self, poller, **argv)
+        self.diskDelay = diskDelay
+        self.sync = sync
+
+    def saveImage(self, job):
+        time.sleep(self.diskDelay)
+        return FITSWriter.saveImage(self, job)
+
+    def write(self, image, xpix, ypix, bitpix, callback, **argv):
+        if not self.sync:
+            return FITSWriter.write(self, image, xpix, ypix, bitpix, callback, **argv)
+
+        job = dict(image=image, nBytes=len(image), header=self.header(xpix, ypix, bitpix),
+                   bitpix=bitpix, callback=callback, fiddle=argv.get('fiddle', None),
+                   scratchDir=argv.get('scratchDir', None), prefix='bench-')
+        self.nQueued += 1
+        fname = self.saveImage(job)
+        self.poller.callMeIn(lambda: self._finished(job, fname, None, 0.0), 0.0)
+
+def benchmark(nFrames=5, xpix=2048, ypix=2048, chunkSize=65536):
+    """ Time decoding and saving multi-megabyte image frames, arriving in chunkSize reads.
+
+    Reports how long the poll loop spent decoding, and how long it took for all the
+    images to be saved, when saving from the loop and with writer threads, and with
+    fast and (pretend) slow disks.
+    """
+
+    image = np.arange(xpix * ypix, dtype=np.uint16).tobytes()
+    packet = makePacket(1, 1, image=image, xpix=xpix, ypix=ypix)
+    data = packet * nFrames
+    CPL.disableLoggingFor('Binary.saveImage')
+    CPL.disableLoggingFor('Binary.pauseInput')
+    CPL.disableLoggingFor('Binary.resumeInput')
+    _setupGlobals()
+
+    for diskDelay in 0.0, 0.05:
+        for sync, nThreads in (True, 0), (False, 1), (False, 2):
+            writer = _BenchWriter(g.poller, diskDelay=diskDelay, sync=sync, nThreads=nThreads, maxQueued=4)
+            decoder = _makeDecoder(saveImages=True, writer=writer, byteSwapFirst=True, signFlip=True)
+            nub = _TestNub(decoder)
+            t0 = time.time()
+            loopTime = 0.0
+            for i in range(0, len(data), chunkSize):
+                t1 = time.time()
+                nub.copeWithInput(data[i:i + chunkSize])
+                _runTimers(nub.poller)
+                loopTime += time.time() - t1
+            while decoder.held or writer.nQueued:
+                time.sleep(0.0005)
+                t1 = time.time()
+                _runTimers(nub.poller)
+                loopTime += time.time() - t1
+            dt = time.time() - t0
+            nub.close()
+            shutil.rmtree(decoder.scratchDir)
+            print("%d %0.1fMB frames in %dkB reads, %s, disk delay %0.2fs: loop %0.4fs/frame, saved %0.3fs/frame" %
+                  (nFrames, len(packet) / 1e6, chunkSize // 1024,
+                   "saved from loop" if sync else "%d writer threads" % (nThreads),
+                   diskDelay, loopTime / nFrames, dt / nFrames))
+
+    buf = bytearray(packet)
+    t0 = time.time()
+    new = _makeDecoder().checksum(buf, 10, len(buf) - 2)
+    t1 = time.time()
+    old = _oldChecksum(buf, 10, len(buf) - 2)
+    t2 = time.time()
+    print("checksum of one frame: numpy=%0.4fs python loop=%0.3fs (match=%s)" % (t1 - t0, t2 - t1, new == old))
+
+if __name__ == "__main__":
+    testBinary()
+    benchmark()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+""" testHandover.py -- check that connections using the binary protocol survive a handover.
+
+    Passes a binary actor and a binary commander through handoverState() and
+    restoreHandoverState(), as a hub restart does, without any real connections, and checks
+    that both ends still agree on the numbered keywords. Usage:
+
+        testHandover.py
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import pickle
+import sys
+
+tronDir = os.environ.setdefault('TRON_TRON_DIR',
+                                os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, tronDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchHub import setup, makeActor, makeCommander
+
+def makeWireActor(name):
+    """ Create an ActorNub with no connection, which has agreed to binary frames. """
+
+    from Hub.Command.Encoders.WireCmdEncoder import WireCmdEncoder
+    from Hub.Reply.Decoders.WireReplyDecoder import WireReplyDecoder
+
+    actor = makeActor(name)
+    actor.encoder = WireCmdEncoder(sendCommander=True, useCID=False, binary=True)
+    actor.decoder = WireReplyDecoder(encoder=actor.encoder)
+    actor.encoder.setNub(name)
+    actor.decoder.setNub(name)
+    return actor
+
+def relay(actor, cmdr, actorWriter, clientReader, KVs):
+    """ Send a reply from the far end of the actor, and return what the far end of the
+    commander decodes of it. """
+
+    actor.copeWithInput(actorWriter.packReply('0', '0', '', 'i', KVs).decode('latin-1'))
+
+    buf = bytearray()
+    for s in cmdr.outQueue:
+        buf += s.encode('latin-1') if isinstance(s, str) else s
+    del cmdr.outQueue[:]
+
+    replies = []
+    while buf:
+        ftype, body = clientReader.readFrame(buf)
+        if ftype is None:
+            break
+        replies.append(clientReader.unpackReply(body))
+    return replies
+
+def testHandover():
+    """ Check that the keywords which were numbered before a handover keep their names after it. """
+
+    import hub
+    from Hub.KV.WireFormat import WireWriter, WireReader
+
+    failures = 0
+
+    # The far ends of our connections.
+    actorWriter = WireWriter()
+    clientReader = WireReader()
+
+    actor = makeWireActor('testWire')
+    hub.addActor(actor)
+    cmdr = makeCommander('test.wire')
+    cmdr.useWireCodecs()
+    cmdr.encoder.setBinary(True)
+    cmdr.taster.addToFilter(['testWire'], [], ['testWire'])
+    hub.addCommander(cmdr)
+
+    KVs = collections.OrderedDict()
+    KVs['TCCPos'] = ('121.5', '40.5', '45.0')
+    KVs['AxePos'] = ('122.5', '17.357142857142858', '1')
+    before = relay(actor, cmdr, actorWriter, clientReader, KVs)
+
+    actorState = pickle.loads(pickle.dumps(actor.handoverState()))
+    cmdrState = pickle.loads(pickle.dumps(cmdr.handoverState()))
+    hub.dropCommander(cmdr, doShutdown=False)
+    hub.dropActor(actor)
+
+    # The new hub's nubs start out knowing no keywords.
+    #
+    actor = makeWireActor('testWire')
+    actor.restoreHandoverState(actorState)
+    hub.addActor(actor)
+    cmdr = makeCommander('test.new')
+    cmdr.restoreHandoverState(cmdrState)
+    hub.addCommander(cmdr)
+
+    KVs = collections.OrderedDict()
+    KVs['AxePos'] = ('123.5', '17.5', '2')
+    after = relay(actor, cmdr, actorWriter, clientReader, KVs)
+
+    got = [list(r['KVs'].keys()) for r in before + after]
+    if got != [['TCCPos', 'AxePos'], ['AxePos']]:
+        print("MISMATCH: keywords before and after the handover: %r" % (got))
+        failures += 1
+    elif after[0]['KVs']['AxePos'] != KVs['AxePos']:
+        print("MISMATCH: AxePos after the handover: %r" % (after[0]['KVs']['AxePos'],))
+        failures += 1
+
+    # A codec which cannot carry on with the numbering must refuse to.
+    #
+    ascii = makeActor('testWire.ascii')
+    try:
+        ascii.restoreHandoverState(actorState)
+    except RuntimeError:
+        pass
+    else:
+        print("MISMATCH: an ASCII actor took over a binary actor's keywords")
+        failures += 1
+
+    hub.dropCommander(cmdr, doShutdown=False)
+    hub.dropActor(actor)
+
+    print("handover: %d failures" % (failures))
+    return failures
+
+if __name__ == "__main__":
+    setup()
+    sys.exit(1 if testHandover() else 0)
@@ -9,15 +9,63 @@ passwordFile = os.path.join(os.environ['TRON_TRON_DIR'], 'passwords')
 # Which words to load internally.
 vocabulary = ('hub', 'keys', 'msg')
 
+# Rate-limit fast keywords sent to TUI connections: (interval in seconds, list of actor.key patterns)
+# e.g. TUIconflate = (0.5, ('tcc.axePos', 'sps*.*Temp*'))
+TUIconflate = None
+
+# How many keys to send at a time when streaming the keyword dictionary to a commander
+# ("hub listen bootstrap"), and whether "hub listen addActors/setActors" should stream
+# the newly listened-to actors' keys before finishing.
+bootstrapChunkSize = 100
+bootstrapOnListen = False
+
 # This lists the incoming Nub/ connections we listen on. 
+# 'jsonin' takes commands and sends replies as JSON lines (see Hub/Reply/Encoders/JSONReplyEncoder.py).
 listeners = ('cmdin',
              'client',
              'nclient',
+             'jsonin',
              'TUI')
 
+# Which of the actors below to connect to at startup. They all connect at once, in the
+# background, and each gives up after its 'connectTimeout', or actorConnectTimeout, seconds.
+# Commands sent to an actor while it is connecting are queued until it connects.
+startActors = ()
+actorConnectTimeout = 10.0
+
+# "hub restart!" and SIGHUP start a new hub process, which takes over all the connections
+# from this one. The new hub has handoverTimeout seconds to do that, or this one keeps running.
+# Without handoverRestart, everything is shut down and "tron restart" is run instead.
+handoverRestart = True
+handoverTimeout = 30.0
+
+# Synthetic commands (ones we see replies to, but did not send) are forgotten when there are more than
+# maxExternalCommands of them, or when they have not been heard from for maxExternalCommandAge seconds.
+maxExternalCommands = 1000
+maxExternalCommandAge = 3600.0
+
+# Roughly how much memory to spend remembering parsed reply lines and command arguments.
+replyParseCacheBytes = 2000000
+cmdParseCacheBytes = 200000
+
+# How many threads save images from binary actors, and how many images can be waiting to be
+# saved before we stop reading from the actors.
+imageWriterThreads = 2
+imageWriterMaxQueued = 4
+
 # This lists all the outgoing actor connections we know how to make.
 # For the PFS MHS, all the current actors use the same connection protocol, so we hand off 
 # to a single manager which reads this dictionary.
+# Each actor can also take a 'timeout', after which unfinished commands are failed, and a
+# 'cmdTimeouts' dictionary of per-command timeouts, e.g. cmdTimeouts=dict(expose=1800.0)
+# Fragile actors can be given 'maxInFlight', the most commands they are sent at once; others wait
+# in a queue. Commands matching the 'urgentCmds' regexp are sent at once, e.g.
+#    sps1=dict(host="localhost", port=9011, actorName='mhsActor', maxInFlight=2, urgentCmds=r'^\s*(abort|stop)\b')
+# Identical concurrent commands matching the 'coalesceCmds' regexp (e.g. r'^\s*(status|ping)\s*$') are
+# only sent once, and all the commanders get the replies.
+# Actors which understand the binary wire protocol (Hub/KV/WireFormat.py) can be given wire='binary':
+# the hub then offers it with a 'wire binary' command when it connects, and uses ASCII if that fails.
+# Each actor can be given its own 'connectTimeout', instead of actorConnectTimeout.
 # 
 actors = dict(iic=       dict(host="localhost", port=9000, actorName='mhsActor'),
 
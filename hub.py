@@ -20,20 +20,27 @@
    r = Reply(cmd=cmd
 """
 
-import imp
 import os
 import re
 import signal
 import sys
 import time
 import collections
+import heapq
 
 import CPL
 from Misc.cdict import cdict
+from Misc.ModuleLoader import ModuleLoader
 
 import IO
 import Hub.KV.KVDict
 import Hub.Command.Command
+import Hub.Command.CommandTable
+import Hub.Reply.FITSWriter
+import Hub.Startup
+import Hub.Handover
+from Hub.Reply.KVBuilder import kv, qKV
+import Parsing
 import Auth
 import g
 
@@ -49,6 +56,9 @@ def init(configName=''):
                                 os.path.join(os.environ['TRON_TRON_DIR'], 'config', configName))
     CPL.cfg.init(path=configPath)
     os.environ['CONFIG_DIR'] = configPath
+
+    # The hub configuration we are running with. reconfigure() applies changes to it.
+    g.hubConfig = CPL.cfg.getSpace('hub')
     
     g.logDir = CPL.cfg.get('hub', 'logDir')
     CPL.setLogdir(g.logDir)
@@ -75,6 +85,9 @@ def init(configName=''):
     #   - An authorization manager
     permsCmd = Hub.Command.Command('.perms', '0', 0, 'perms', None, actorCid=0, actorMid=0, neverEnd=True)
     g.perms = Auth.Auth(permsCmd, debug=9)
+
+    #   - The login passwords
+    g.passwords = Auth.PasswordStore()
     
     #   - A dictionary of Commander Nubs, indexed by unique ID.
     g.commanders = CmdrDict('Commanders')
@@ -87,12 +100,32 @@ def init(configName=''):
     #   - dictionary of PollAcceptors, waiting for for new connections.
     g.acceptors = cdict()
 
-    #   - dictionary of active commands, indexed by XID.
-    g.pendingCommands = {}
-
     #   - A PollHandler
     g.poller = IO.PollHandler(debug=1)
 
+    #   - table of commands sent to actors, indexed by XID.
+    g.pendingCommands = Hub.Command.CommandTable.CommandTable(maxExternal=CPL.cfg.get('hub', 'maxExternalCommands', 1000),
+                                                              maxExternalAge=CPL.cfg.get('hub', 'maxExternalCommandAge', 3600.0))
+    g.pendingCommands.startReaper(g.poller)
+
+    #   - caches of parsed reply lines and command arguments.
+    Parsing.kvsCache.setLimits(maxBytes=CPL.cfg.get('hub', 'replyParseCacheBytes', 2000000))
+    Parsing.argsCache.setLimits(maxBytes=CPL.cfg.get('hub', 'cmdParseCacheBytes', 200000))
+
+    #   - the threads which save images from binary actors. Only started when needed.
+    g.imageWriter = Hub.Reply.FITSWriter.FITSWriter(g.poller,
+                                                    nThreads=CPL.cfg.get('hub', 'imageWriterThreads', 2),
+                                                    maxQueued=CPL.cfg.get('hub', 'imageWriterMaxQueued', 4))
+
+    #   - the loader for the Vocab and Nubs modules, which only reloads changed ones.
+    g.moduleLoader = ModuleLoader()
+
+    #   - what brings up the listeners and actors, and reports how long they took.
+    g.startup = Hub.Startup.Startup()
+
+    #   - what hands our connections over to a new hub process, or takes them over from an old one.
+    g.handover = Hub.Handover.Handover()
+
     CPL.log('hub.init', 'loading internal vocabulary...')
     loadWords(None)
     
@@ -100,14 +133,11 @@ def init(configName=''):
     loadKeys()
 
     # atexit.register(shutdown)
-    signal.signal(signal.SIGHUP, handleSIGHUP)
+    g.poller.callOnSignal(signal.SIGHUP, restart)
     signal.signal(signal.SIGTERM, handleSIGTERM)
 
     #   - A security manager
 
-def handleSIGHUP(signal, frame):
-    restart()
-    
 def handleSIGTERM(signal, frame):
     shutdown()
 
@@ -134,36 +164,22 @@ def loadWords(words=None, cmd=None):
 
 def _loadWords(wordlist, cmd=None):
     """ (Re-)load a list of Vocabulary words, overwriting any existing info. 
+
+    The Vocab package and the words' modules are only reloaded if their source has changed.
     """
 
-    # First, (re-)load the entire Vocabulary module. Let that fail to the top
-    # level.
-    #
-    
-    CPL.log('hub.loadVocab', 'trying to (re-)load Vocab module')
-    CPL.log('hub.loadVocab', 'trying to (re-)load Vocab module')
-    fp, pathname, description = imp.find_module('Vocab')
-    vocab_mod = imp.load_module('Vocab', fp, pathname, description)
-    if fp:
-        fp.close()
-    CPL.log('hub.loadVocab', 'Vocab module: %s' % (dir(vocab_mod)))
-     
     for w in wordlist:
-        # Now try to load the module itself.
+        # Load the word's module, reloading it if its source has changed.
         #
         modName = w
         if w == 'hub':
             modName = 'hubCommands'
         try:
             CPL.log('hub.loadVocab', 'trying to (re-)load vocabulary word %s' % (w,))
-            fp, pathname, description = imp.find_module(modName, vocab_mod.__path__)
-            mod = imp.load_module(modName, fp, pathname, description)
+            mod = g.moduleLoader.load('Vocab.%s' % (modName))
         except ImportError as e:
             raise Exception('Import of %s failed: %s' % (modName, e))
 
-        if fp:
-            fp.close()
-
         CPL.log('hub.loadWords', 'loading vocabulary word %s from %s...' % (w, mod))
 
         try:
@@ -181,6 +197,84 @@ def _loadWords(wordlist, cmd=None):
         
         CPL.log('hub.loadWords', 'vocabulary: %s' % (g.vocabulary))
         
+def reconfigure(cmd):
+    """ Reread the hub configuration, and apply what has changed since it was last applied.
+
+    Running actors whose configured address has changed are reconnected, new listeners and
+    startActors are started, and the cache limits are reset. Other changes take effect the
+    next time they are used.
+
+    Returns:
+       the names of the configuration variables which changed.
+    """
+
+    CPL.cfg.refresh('hub')
+    old = g.hubConfig
+    new = CPL.cfg.getSpace('hub')
+    changed = CPL.cfg.changedVars(old, new)
+    g.hubConfig = new
+    if not changed:
+        return changed
+
+    CPL.log('hub.reconfigure', 'changed: %s' % (changed))
+    cmd.inform(kv('configChanged', changed, quote=True))
+
+    if 'actors' in changed:
+        _reconfigureActors(old.get('actors', {}), new.get('actors', {}), cmd)
+
+    oldListeners = old.get('listeners', ())
+    newListeners = new.get('listeners', ())
+    for name in [n for n in oldListeners if n not in newListeners]:
+        cmd.inform(qKV('text', "listener %s is no longer configured, but is left running" % (name)))
+    toStart = [n for n in newListeners if n not in oldListeners]
+    toStart += [n for n in new.get('startActors', ()) if n not in old.get('startActors', ()) and findActor(n) is None]
+    for name in toStart:
+        try:
+            cmd.inform(qKV('text', "starting nub %s" % (name)))
+            startNub(name)
+        except Exception as e:
+            cmd.warn(qKV('text', "failed to start nub %s: %s" % (name, e)))
+
+    g.pendingCommands.maxExternal = new.get('maxExternalCommands', 1000)
+    g.pendingCommands.maxExternalAge = new.get('maxExternalCommandAge', 3600.0)
+    Parsing.kvsCache.setLimits(maxBytes=new.get('replyParseCacheBytes', 2000000))
+    Parsing.argsCache.setLimits(maxBytes=new.get('cmdParseCacheBytes', 200000))
+
+    return changed
+
+def _reconfigureActors(oldActors, newActors, cmd):
+    """ Reconnect the running actors whose configured host or port has changed.
+
+    Actors which were started at some other address than the configured one are left alone.
+    """
+
+    for name in sorted(set(oldActors) | set(newActors)):
+        oldCfg = oldActors.get(name, {})
+        newCfg = newActors.get(name, {})
+        nub = findActor(name)
+        if oldCfg == newCfg or nub is None:
+            continue
+
+        if not newCfg:
+            cmd.inform(qKV('text', "actor %s is no longer configured, but is left connected" % (name)))
+            continue
+
+        oldAddr = (oldCfg.get('host', None), oldCfg.get('port', None))
+        newAddr = (newCfg.get('host', None), newCfg.get('port', None))
+        nubAddr = (getattr(nub, 'host', None), getattr(nub, 'port', None))
+        if oldAddr == newAddr or nubAddr != oldAddr or None in newAddr:
+            cmd.inform(qKV('text', "the configuration of actor %s has changed: restart it to apply that" % (name)))
+            continue
+
+        cmd.inform(qKV('text', "reconnecting actor %s to %s:%s" % (name, newAddr[0], newAddr[1])))
+        try:
+            ok = startNub(name)
+        except Exception as e:
+            ok = False
+            cmd.warn(qKV('text', "failed to reconnect actor %s: %s" % (name, e)))
+        if ok:
+            cmd.inform(kv('actorReconnected', (CPL.qstr(name), CPL.qstr(newAddr[0]), newAddr[1])))
+
 def shutdown():
     CPL.log('hub.shutdown', 'shutting down......................................')
     try:
@@ -189,7 +283,36 @@ def shutdown():
         pass
     sys.exit(0)
 
-def restart():
+def restart(cmd=None):
+    """ Restart the hub.
+
+    If the handoverRestart configuration is set (the default), start a new hub process which
+    takes over all our connections, and exit once it has. If it cannot, we keep running.
+    Otherwise, shut everything down and run "tron restart".
+
+    Args:
+       cmd  - the command asking for the restart, if any.
+    """
+
+    if not CPL.cfg.get('hub', 'handoverRestart', True):
+        hardRestart()
+        return
+
+    if g.handover.isUnderWay():
+        (cmd if cmd else g.hubcmd).fail(qKV('text', "a hub restart is already under way"))
+        return
+
+    CPL.log('hub.restart', 'handing over to a new hub......................................')
+    try:
+        g.handover.start(cmd=cmd)
+    except Exception as e:
+        CPL.tback('hub.restart', e)
+        (cmd if cmd else g.hubcmd).warn(qKV('text', "could not start a new hub (%s); restarting the hard way" % (e)))
+
+        # Give the poller a chance to flush out the warning.
+        g.poller.callMeIn(hardRestart, 1.0)
+
+def hardRestart():
     CPL.log('hub.restart', 'restarting......................................')
     try:
         _shutdown()
@@ -243,52 +366,159 @@ class NubDict(collections.OrderedDict):
     def __init__(self, name):
         collections.OrderedDict.__init__(self)
         self.name = name
+
+        # Set while nubs are being added in bulk, e.g. when taking over from another hub.
+        self.quiet = False
         self.listSelf()
         
     def __setitem__(self, k, v):
         collections.OrderedDict.__setitem__(self, k, v)
 
-        self.listSelf()
+        if not self.quiet:
+            self.listSelf()
 
     def __delitem__(self, k):
         # k.shutdown(notifyHub=False)
         collections.OrderedDict.__delitem__(self, k)
 
-        self.listSelf()
+        if not self.quiet:
+            self.listSelf()
 
     def listSelf(self, cmd=None):
-        names = []
-        for n in self.values():
-            names.append(CPL.qstr(n.name))
+        names = [n.name for n in self.values()]
 
         if not cmd:
             cmd = g.hubcmd
 
-        cmd.inform("%s=%s" % (self.name, ','.join(names)))
+        cmd.inform(kv(self.name, names, quote=True))
 
 class CmdrDict(NubDict):
     """ Like NubDict, but generate a 'users' keyword, depending on
         the state of the nub's isUser attribute.
 
         Also, list the taster attributes
+
+        We also keep an index of the commanders by name, and hand out unique names by
+        adding _N suffixes to base names. For each base name we keep the highest suffix
+        which has been tried, and a heap of suffixes which have been released since. The
+        name index is the final word on which names are in use. A base name is forgotten
+        once none of its names are in use.
     """
     
+    def __init__(self, name):
+        self.byName = {}
+        self.suffixes = {}
+        NubDict.__init__(self, name)
+
+    def __setitem__(self, k, v):
+        oldNub = self.get(k, None)
+        if oldNub is not None:
+            self._unindex(oldNub.name, oldNub)
+        self.byName[v.name] = v
+        NubDict.__setitem__(self, k, v)
+
+    def __delitem__(self, k):
+        nub = self[k]
+        self._unindex(nub.name, nub)
+        NubDict.__delitem__(self, k)
+
+    def _unindex(self, name, nub):
+        """ Remove a name from the name index, and make its suffix available again. """
+
+        if self.byName.get(name, None) is not nub:
+            return
+        del self.byName[name]
+
+        if name in self.suffixes:
+            self._release(name, 1)
+        base, sep, suffix = name.rpartition('_')
+        if sep and suffix.isdigit() and base in self.suffixes:
+            n = int(suffix)
+            if 1 < n <= self.suffixes[base][0] + 1:
+                self._release(base, n)
+
+    def _release(self, baseName, n):
+        """ Make a suffix of baseName available again, once. """
+
+        high, free, freed = self.suffixes[baseName]
+        if n not in freed and (n == 1 or n <= high):
+            heapq.heappush(free, n)
+            freed.add(n)
+
+        # Only look for names still in use when there might not be any. The last name
+        # handed out has the suffix after the highest one tried.
+        if len(freed) >= high:
+            for i in range(1, high + 2):
+                if self._suffixedName(baseName, i) in self.byName:
+                    return
+            del self.suffixes[baseName]
+
+    def renamed(self, nub, oldName):
+        """ Reindex a commander which has changed its name. """
+
+        if nub.ID not in self:
+            return
+        self._unindex(oldName, nub)
+        self.byName[nub.name] = nub
+
+    def findByName(self, name):
+        """ Return the commander with the given name, or None. """
+
+        return self.byName.get(name, None)
+
+    def allocateName(self, baseName):
+        """ Return the first unused name of baseName, baseName_2, baseName_3, etc. 
+
+        The name is not reserved until a commander with that name is indexed.
+        """
+
+        alloc = self.suffixes.get(baseName, None)
+        if alloc is None:
+            # [highest suffix tried, heap of released suffixes, set of the same suffixes]
+            alloc = self.suffixes[baseName] = [0, [], set()]
+
+        free, freed = alloc[1], alloc[2]
+        while free:
+            name = self._suffixedName(baseName, free[0])
+            if name not in self.byName:
+                return name
+            freed.discard(heapq.heappop(free))
+
+        while True:
+            n = alloc[0] + 1
+            name = self._suffixedName(baseName, n)
+            if name not in self.byName:
+                return name
+            alloc[0] = n
+
+    def _suffixedName(self, baseName, n):
+        if n == 1:
+            return baseName
+        return "%s_%d" % (baseName, n)
+
     def listSelf(self, cmd=None, verbose=False):
+        """ Generate the Commanders and users keys, and for a command also each commander's user key.
+
+        The user keys are broadcast when each commander logs in, so they are not repeated
+        every time a commander comes or goes: with many commanders reconnecting at once,
+        that multiplied the replies by the number of commanders.
+        """
+
+        listUsers = cmd is not None
         if not cmd:
             cmd = g.hubcmd
         names = []
         userNames = []
         for n in self.values():
-            names.append(CPL.qstr(n.name))
+            names.append(n.name)
             if n.isUser:
-                userNames.append(CPL.qstr(n.name))
-            CPL.log('listCommanders', 'n=%s has info=%s' % (n, n.userInfo))
-            if n.userInfo:
+                userNames.append(n.name)
+            if listUsers and n.userInfo:
                 cmd.inform(n.userInfo)
             if verbose:
                 n.taster.genKeys(cmd, n.name)
-        cmd.inform("%s=%s" % (self.name, ','.join(names)))
-        cmd.inform("users=%s" % (','.join(userNames)))
+        cmd.inform(kv(self.name, names, quote=True))
+        cmd.inform(kv('users', userNames, quote=True))
 
     
 def addNubToDict(nub, nubDict):
@@ -300,7 +530,7 @@ def addNubToDict(nub, nubDict):
         return
     
     nubDict[nub.ID] = nub
-    CPL.log('Hub.nubs', 'added nub %s to %s' % (nub, nubDict))
+    CPL.log('Hub.nubs', 'added nub %s (now %d nubs)' % (nub, len(nubDict)))
         
     
 def dropNubFromDict(nub, nubDict, doShutdown=True):
@@ -343,6 +573,13 @@ def addCommander(nub):
 def dropCommander(nub, doShutdown=True):
     CPL.log("hub.dropCommander", "dropping %s" % (nub.name))
     dropNubFromDict(nub, g.commanders, doShutdown=doShutdown)
+    for actor in list(g.actors.values()):
+        if hasattr(actor, 'dropQueuedCommands'):
+            actor.dropQueuedCommands(nub.name)
+    g.pendingCommands.dropCommander(nub.name)
+    for actor in list(g.actors.values()):
+        if hasattr(actor, 'forgetCid'):
+            actor.forgetCid(nub.name)
     
 def findCommander(id): return findNubInDict(id, g.commanders)
 
@@ -407,20 +644,7 @@ def validateCommanderNames(nub, programName, username):
 
     fullName = "%s.%s" % (programName, username)
 
-    n = 2
-    proposedName = fullName
-    ok = False
-    while not ok:
-        ok = True
-        for c in g.commanders.values():
-            if c.name == proposedName:
-                ok = False
-                break
-        if not ok:
-            proposedName = "%s_%d" % (fullName, n)
-            n += 1
-
-    return proposedName
+    return g.commanders.allocateName(fullName)
     
 def listKeys(match, **argv):
     cmd = argv.get('cmd')
@@ -462,17 +686,15 @@ def addCommand(cmd):
     actor = getActor(cmd)
 
     if actor == None:
-        cmd.fail('NoTarget=%s' % \
-                 CPL.qstr("the target named %s is not connected" % (cmd.actorName)),
+        cmd.fail(qKV('NoTarget', "the target named %s is not connected" % (cmd.actorName)),
                  src='hub')
         return
 
     # Enforce permissions if the actor requires them.
     ok = g.perms.checkAccess(cmd.cmdrCid, actor, cmd)
     if not ok:
-        cmd.fail('NoPermission=%s' % \
-                 CPL.qstr("you do not have permission to command %s" % \
-                          (actor.needsAuth)),
+        cmd.fail(qKV('NoPermission', "you do not have permission to command %s" % \
+                     (actor.needsAuth)),
                  src='hub')
         return
     
@@ -482,18 +704,16 @@ def runCmd(c):
     cmd = c.cmd.strip()
     CPL.log("hub.runCmd", "cmd = %r" % (cmd))
     if cmd == "":
-        c.finish("Eval=%s" % (CPL.qstr("")),
-                 src='hub')
+        c.finish(qKV('Eval', ""), src='hub')
         return
     
     try:
         ret = eval(cmd)
     except Exception as e:
-        c.fail('EvalError=%s' % CPL.qstr(e),
-               src='hub')
+        c.fail(qKV('EvalError', e), src='hub')
         raise
     
-    c.finish("Eval=%s" % (CPL.qstr(ret)), src='hub')
+    c.finish(qKV('Eval', str(ret)), src='hub')
     CPL.log("hub.runCmd", "ret = %r" % (ret))
 
 
@@ -502,35 +722,9 @@ def listenTo(**argv):
     pass
 
 def loadVocab(**argv):
-    """ Load the entire Vocabulary, overwriting any existing info. """
+    """ Load the entire configured Vocabulary, overwriting any existing info. """
 
-    # First, (re-)load the entire Nubs module. Let that fail to the top
-    # level.
-    #
-    fp, pathname, description = imp.find_module('Vocab')
-    vocab_mod = imp.load_module('Vocab', fp, pathname, description)
-    if fp:
-        fp.close()
-     
-    # Now try to load the module itself.
-    #
-    try:
-        CPL.log('hub.loadVocab', 'trying to (re-)load vocabulary')
-        fp, pathname, description = imp.find_module(name, vocab_mod.__path__)
-    except:
-        raise
-
-    try:
-        mod = imp.load_module(name, fp, pathname, description)
-    finally:
-        # Since we may exit via an exception, close fp explicitly.
-        if fp:
-            fp.close()
-
-    # And call the start() function.
-    #
-    CPL.log('hub.startAConnection', 'starting Nub %s...' % (name))
-    mod.start(g.poller)
+    loadWords(cmd=argv.get('cmd', None))
 
 def stopNub(id):
     """  """
@@ -541,56 +735,14 @@ def stopNub(id):
         dropNub(n)
 
 def forceReload(name, all=True):
-    """ Do whatever we can to force a given module/package to be reloaded.
-    
-    """
-
-    mod = None
-    partName = name
-    if all:
-        # Optionally (re-)load all the containing modules. Let that fail to the top
-        # level.
-        #
-        start = 0
-        while 1:
-            end = name.find('.', start)
-            if end == -1:
-                partName = name[start:]
-                break
-            partName = name[start:end]
-            start = end+1
-
-            CPL.log('hub.forceReload', 'trying to (re-)load module %s in %s' % (partName, mod))
-            if mod == None:
-                fp, pathname, description = imp.find_module(partName)
-            else:
-                fp, pathname, description = imp.find_module(partName, mod.__path__)
-
-            try:
-                mod = imp.load_module(partName, fp, pathname, description)
-            finally:
-                if fp:
-                    fp.close()
-     
-    # Now try to load the module itself.
-    #
-    try:
-        CPL.log('hub.forceReload', 'trying to (re-)load final %s in %s' % (partName, mod))
-        if mod == None:
-            fp, pathname, description = imp.find_module(partName)
-        else:
-            fp, pathname, description = imp.find_module(partName, mod.__path__)
-    except:
-        raise
+    """ Return the given module/package, reloading it if its source has changed.
 
-    try:
-        mod = imp.load_module(name, fp, pathname, description)
-    finally:
-        # Since we may exit via an exception, close fp explicitly.
-        if fp:
-            fp.close()
+    Args:
+       name   - the full dotted name of the module.
+       all    - if True, also reload any of the containing packages which have changed.
+    """
 
-    return mod
+    return g.moduleLoader.load(name, parents=all)
 
 def stopNub(name):
     n = findActor(name)
@@ -604,40 +756,29 @@ def startManagedNub(name, managerName='mhsActor', hostname=None, port=None):
     as manager.start(name, hostname=hostname, port=port)
     """
 
-    # First, (re-)load the entire Nubs module. Let that fail to the top
-    # level.
-    #
-    fp, pathname, description = imp.find_module('Nubs')
-    nubs_mod = imp.load_module('Nubs', fp, pathname, description)
-    if fp:
-        fp.close()
-     
-    # Now try to load the manager nub itself.
+    # (Re-)load the manager nub if it has changed. The Nubs package itself is only
+    # reloaded if it has changed.
     #
+    modName = 'Nubs.%s' % (managerName)
     try:
         CPL.log('hub.startNub', 'trying to (re-)load Nub manager %s' % (managerName))
-        fp, pathname, description = imp.find_module(managerName, nubs_mod.__path__)
-    except:
+        mod = g.moduleLoader.load(modName)
+    except ModuleNotFoundError as e:
+        if e.name != modName:
+            g.hubcmd.warn(qKV('text', "failed to load manager Nub %s: %s" % (managerName, e)))
         return False
-
-    try:
-        mod = imp.load_module(managerName, fp, pathname, description)
     except Exception as e:
-        g.hubcmd.warn('text=%s' % (CPL.qstr("failed to load manager Nub %s: %s" % (managerName, e))))
+        g.hubcmd.warn(qKV('text', "failed to load manager Nub %s: %s" % (managerName, e)))
         return False
-    finally:
-        # Since we may exit via an exception, close fp explicitly.
-        if fp:
-            fp.close()
 
     # And call the start() function.
     #
     CPL.log('hub.startNub', 'starting managed Nub %s...' % (name))
     try:
-        g.hubcmd.inform('text="starting managed Nub %s at %s:%s..."' % (name, hostname, port))
+        g.hubcmd.inform(qKV('text', "starting managed Nub %s at %s:%s..." % (name, hostname, port)))
         mod.start(g.poller, name, argHost=hostname, argPort=port)
     except Exception as e:
-        g.hubcmd.warn('text=%s' % (CPL.qstr("failed to start managed Nub %s: %s" % (name, e))))
+        g.hubcmd.warn(qKV('text', "failed to start managed Nub %s: %s" % (name, e)))
         return False
 
     return True
@@ -650,29 +791,18 @@ def startNub(name, hostname=None, port=None):
 
     CPL.log('hub.startNub', 'trying to start %s' % (name))
 
-    # First, (re-)load the entire Nubs module. Let that fail to the top
-    # level.
-    #
-    fp, pathname, description = imp.find_module('Nubs')
-    nubs_mod = imp.load_module('Nubs', fp, pathname, description)
-    if fp:
-        fp.close()
-     
-    # Now try to load the module itself.
+    # (Re-)load the nub's module if it has changed. Nubs without their own module
+    # are started by a manager. Let other failures go to the top level.
     #
+    modName = 'Nubs.%s' % (name)
     try:
         CPL.log('hub.startNub', 'trying to (re-)load Nub %s' % (name))
-        fp, pathname, description = imp.find_module(name, nubs_mod.__path__)
-    except:
+        mod = g.moduleLoader.load(modName)
+    except ModuleNotFoundError as e:
+        if e.name != modName:
+            raise
         return startManagedNub(name, hostname=hostname, port=port)
 
-    try:
-        mod = imp.load_module(name, fp, pathname, description)
-    finally:
-        # Since we may exit via an exception, close fp explicitly.
-        if fp:
-            fp.close()
-
     # And call the start() function.
     #
     CPL.log('hub.startNub', 'starting Nub %s...' % (name))
@@ -5,18 +5,17 @@ import g
 import hub
 import CPL
 
-def startAllListeners(names):
-    """ Create all default connections, as defined by the proper configuration file. """
+def startAllListeners(names, actors=()):
+    """ Create all default connections, as defined by the proper configuration file.
 
-    for n in names:
-        try:
-            hub.startNub(n)
-        except Exception as e:
-            sys.stderr.write("FAILED to start nub %s: %s\n" % (n, e))
-            try:
-                g.hubcmd.warn('text=%s' % (CPL.qstr('FAILED to start nub %s: %s\n', n, e)))
-            except:
-                sys.stderr.write("hubcmd.warn failed\n")
+    The listeners are up when we return. The actors connect in the background, once
+    the hub is running.
+    """
+
+    g.startup.start(listeners=names, actors=actors)
+    for n, (kind, state, dt) in g.startup.timeline.items():
+        if state == 'failed':
+            sys.stderr.write("FAILED to start %s %s\n" % (kind, n))
 
 def main():
     parser = argparse.ArgumentParser()
@@ -25,7 +24,11 @@ def main():
     args = parser.parse_args()
     
     hub.init(configName=args.config)
-    startAllListeners(CPL.cfg.get('hub', 'listeners', doFlush=True))
+    if g.handover.isInherited():
+        g.handover.takeOver()
+    else:
+        startAllListeners(CPL.cfg.get('hub', 'listeners', doFlush=True),
+                          CPL.cfg.get('hub', 'startActors', ()))
     hub.run()
 
 if __name__ == "__main__":